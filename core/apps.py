@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        backend = settings.CACHES['default']['BACKEND']
+        if not getattr(settings, 'TASK_QUEUE_EAGER', False) and backend.endswith('LocMemCache'):
+            # The run_tasks worker and the web workers invalidate each other's cache entries
+            raise ImproperlyConfigured(
+                'A per-process LocMemCache cannot be shared with the run_tasks worker; '
+                'configure a shared cache or set TASK_QUEUE_EAGER'
+            )
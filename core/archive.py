@@ -0,0 +1,169 @@
+"""
+Archival of old meals, health logs and sleep logs.
+
+Rows older than ARCHIVE_HORIZON_DAYS move out of the hot tables into one
+ArchiveBlob per user, kind and calendar year. A blob holds the rows in their
+API (serializer) representation as zlib-compressed JSON. Export can then
+return archived rows unchanged, and analytics read the fields they need
+from them. User.archived_through records how far a user's
+archive reaches, so windows that stay in the hot tables never touch it.
+"""
+import json
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import User, Meal, HealthLog, Sleep, ArchiveBlob
+from .serializers import MealSerializer, HealthLogSerializer, SleepSerializer
+
+# Archive kind -> (model, serializer, lookup of the row's calendar day)
+ARCHIVE_SOURCES = {
+    ArchiveBlob.Kind.HEALTH_LOGS: (HealthLog, HealthLogSerializer, 'date'),
+    ArchiveBlob.Kind.SLEEP: (Sleep, SleepSerializer, 'date'),
+    ArchiveBlob.Kind.MEALS: (Meal, MealSerializer, 'local_date'),
+}
+
+_archiving = ContextVar('archiving', default=False)
+
+
+def is_archiving():
+    """True while rows are being moved into the archive"""
+    return _archiving.get()
+
+
+@contextmanager
+def archiving():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def row_date(row):
+    """Calendar day of an archived row"""
+    if 'date' in row:
+        return parse_date(row['date'])
+    if row.get('local_date'):
+        return parse_date(row['local_date'])
+    # Meals archived before they had a local_date
+    return parse_datetime(row['date_time']).date()
+
+
+def encode_rows(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def decode_rows(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+class ArchiveService:
+    """Move old rows into archive blobs and read them back"""
+
+    @staticmethod
+    def horizon():
+        """Rows dated before this day are due for archival"""
+        return timezone.now().date() - timedelta(days=getattr(settings, 'ARCHIVE_HORIZON_DAYS', 730))
+
+    @staticmethod
+    def archive_user(user, before=None):
+        """
+        Archive every row of user dated before `before` (default: the horizon); returns counts per kind.
+
+        Each calendar month is moved in a transaction of its own, which also
+        advances archived_through past it, so the lock is held for a month
+        of rows at a time and an interrupted run leaves a consistent archive.
+        """
+        before = before or ArchiveService.horizon()
+        if before > ArchiveService.horizon():
+            raise ValueError("Only rows older than ARCHIVE_HORIZON_DAYS can be archived")
+
+        months = set()
+        for model, _, date_lookup in ARCHIVE_SOURCES.values():
+            months.update(
+                model.objects.filter(user=user, **{f'{date_lookup}__lt': before})
+                .annotate(month=TruncMonth(date_lookup, output_field=DateField()))
+                .values_list('month', flat=True).distinct().order_by()
+            )
+        months = sorted(month for month in months if month is not None)
+
+        counts = dict.fromkeys(ARCHIVE_SOURCES, 0)
+        for month in months:
+            next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+            end = before if month == months[-1] else next_month
+            with transaction.atomic(), archiving():
+                for kind, moved in ArchiveService._archive_rows(user, month, end).items():
+                    counts[kind] += moved
+                archived_through = end - timedelta(days=1)
+                if user.archived_through is None or archived_through > user.archived_through:
+                    User.objects.filter(pk=user.pk).update(archived_through=archived_through)
+                    user.archived_through = archived_through
+        return counts
+
+    @staticmethod
+    def _archive_rows(user, start, end):
+        """Move the user's rows dated from start up to end into their yearly blobs"""
+        counts = {}
+        for kind, (model, serializer_class, date_lookup) in ARCHIVE_SOURCES.items():
+            rows = model.objects.filter(user=user, **{f'{date_lookup}__gte': start, f'{date_lookup}__lt': end})
+            if kind == ArchiveBlob.Kind.MEALS:
+                rows = rows.prefetch_related('mealfood_set__food')
+            data = json.loads(json.dumps(serializer_class(rows, many=True).data))
+            if data:
+                ArchiveService._append(user, kind, start.year, data)
+                rows.delete()
+            counts[kind] = len(data)
+        return counts
+
+    @staticmethod
+    def _append(user, kind, year, rows):
+        """Merge rows into the user's blob for kind and year"""
+        blob = ArchiveBlob.objects.select_for_update().filter(user=user, kind=kind, year=year).first()
+        if blob is not None:
+            archived = {row['id']: row for row in decode_rows(blob.data)}
+        else:
+            blob = ArchiveBlob(user=user, kind=kind, year=year)
+            archived = {}
+        archived.update((row['id'], row) for row in rows)
+
+        # Newest first, like the models' default ordering
+        merged = sorted(archived.values(), key=lambda row: (row_date(row), row['id']), reverse=True)
+        blob.data = encode_rows(merged)
+        blob.row_count = len(merged)
+        blob.first_date = row_date(merged[-1])
+        blob.last_date = row_date(merged[0])
+        blob.save()
+
+    @staticmethod
+    def reaches_archive(user, start_date=None):
+        """Whether a window starting at start_date includes archived rows"""
+        archived_through = getattr(user, 'archived_through', None)
+        return archived_through is not None and (start_date is None or start_date <= archived_through)
+
+    @staticmethod
+    def read(user, kind, start_date=None, end_date=None):
+        """Archived rows of kind in the window, in API representation, newest first"""
+        if not ArchiveService.reaches_archive(user, start_date):
+            return []
+        blobs = ArchiveBlob.objects.filter(user=user, kind=kind).order_by('-year')
+        if start_date is not None:
+            blobs = blobs.filter(last_date__gte=start_date)
+        if end_date is not None:
+            blobs = blobs.filter(first_date__lte=end_date)
+
+        rows = []
+        for data in blobs.values_list('data', flat=True):
+            for row in decode_rows(data):
+                day = row_date(row)
+                if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+                    rows.append(row)
+        return rows
@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+User = get_user_model()
+
+USER_CACHE_KEY = 'auth:user:{}'
+# What authentication, permissions and request routing read from request.user
+USER_CACHE_FIELDS = (
+    'id', 'username', 'is_active', 'is_staff', 'is_superuser',
+    'is_medical_professional', 'timezone', 'archived_through',
+)
+BLACKLIST_CACHE_KEY = 'auth:blacklisted:{}'
+BLACKLIST_APP_INSTALLED = 'rest_framework_simplejwt.token_blacklist' in settings.INSTALLED_APPS
+
+
+def _user_cache_timeout():
+    return getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 60)
+
+
+def _revoke_hash(password):
+    """What CHECK_REVOKE_TOKEN compares with the token claim, or None when the check is off"""
+    if not getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+        return None
+    from rest_framework_simplejwt.utils import get_md5_hash_password
+
+    return get_md5_hash_password(password)
+
+
+def _cached_entry(user_id):
+    """The cached authentication fields of a user, hitting the database at most once per TTL"""
+    key = USER_CACHE_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        row = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(
+            *USER_CACHE_FIELDS, 'password'
+        ).first()
+        if row is None:
+            return None
+        # Never the password hash itself
+        entry = {'revoke_hash': _revoke_hash(row.pop('password')), 'fields': row}
+        cache.set(key, entry, _user_cache_timeout())
+    return entry
+
+
+def _user_from_entry(entry):
+    fields = entry['fields']
+    names = [f.attname for f in User._meta.concrete_fields if f.attname in fields]
+    # The other fields are deferred and load from the database on first access
+    return User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+def get_cached_user(user_id):
+    """Return the user with the given id, with only the authentication fields loaded"""
+    entry = _cached_entry(user_id)
+    return None if entry is None else _user_from_entry(entry)
+
+
+def invalidate_cached_user(user_id):
+    """Drop a user from the authentication cache after it has changed"""
+    key = USER_CACHE_KEY.format(user_id)
+    cache.delete(key)
+    if transaction.get_connection().in_atomic_block:
+        # A request reading the old row before the change commits may cache it again
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that caches the user looked up from the token subject.
+
+    Only USER_CACHE_FIELDS are cached, in the shared cache. Entries expire after
+    JWT_USER_CACHE_TIMEOUT seconds and are dropped whenever the user is saved or
+    updated (see core.signals and UserQuerySet), so deactivation takes effect
+    immediately in every process.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        entry = _cached_entry(user_id)
+        if entry is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        user = _user_from_entry(entry)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry['revoke_hash']:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+
+class CachedRefreshToken(RefreshToken):
+    """Refresh token whose positive blacklist lookups are cached until the token expires"""
+
+    def _blacklist_cache_timeout(self):
+        remaining = datetime_from_epoch(self.payload['exp']) - aware_utcnow()
+        return max(int(remaining.total_seconds()), 1)
+
+    if BLACKLIST_APP_INSTALLED:
+
+        def check_blacklist(self):
+            jti = self.payload[api_settings.JTI_CLAIM]
+            key = BLACKLIST_CACHE_KEY.format(jti)
+            blacklisted = cache.get(key, False)
+            if not blacklisted:
+                from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+                # Misses are not cached: a token may be blacklisted by another process at any time
+                blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+                if blacklisted:
+                    # A blacklisted token stays blacklisted, so hits can live until expiry
+                    cache.set(key, True, self._blacklist_cache_timeout())
+            if blacklisted:
+                raise TokenError(_("Token is blacklisted"))
+
+        def blacklist(self):
+            result = super().blacklist()
+            jti = self.payload[api_settings.JTI_CLAIM]
+            cache.set(BLACKLIST_CACHE_KEY.format(jti), True, self._blacklist_cache_timeout())
+            return result
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that resolves the user through the authentication cache"""
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id and not api_settings.USER_AUTHENTICATION_RULE(get_cached_user(user_id)):
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Blacklist app not installed
+                    pass
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        return data
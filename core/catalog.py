@@ -0,0 +1,183 @@
+"""
+Public food catalog: bulk loading of nutrition datasets and versioned caching.
+
+Catalog foods have no owner and carry catalog_key, a hash of the
+normalised name under a unique index. CatalogLoader streams a dataset and
+upserts it in chunks with bulk_create(update_conflicts=True) on that key,
+so spelling variants of a name collapse into one food and loading a newer
+release updates nutrients in place. Public foods without an owner that
+predate catalog_key are given theirs before a load, so that it updates them
+rather than adding duplicates. Cached catalog reads embed the catalog
+version, which every load and every change to a public food bumps.
+"""
+import hashlib
+import re
+import time
+from itertools import islice
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from .models import Food
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fats')
+
+CATALOG_VERSION_KEY = 'foods:catalog-version'
+
+
+def normalize_food_name(name):
+    """Casefolded NFKC name without punctuation and with single spaces"""
+    name = unicodedata.normalize('NFKC', name).casefold()
+    name = re.sub(r"['’]", '', name)
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name).split())
+
+
+def catalog_key(name):
+    """Fixed-width hash of the normalised name, the catalog's dedup key"""
+    return hashlib.blake2b(normalize_food_name(name).encode(), digest_size=16).hexdigest()
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seeded with a timestamp rather than 1, so a version lost from the cache is never reissued.
+        # add() leaves a version another process just seeded or bumped alone.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Move every process sharing the cache, web workers and load_food_catalog
+    alike, off the cached catalog reads
+    """
+    try:
+        # Atomic in Redis, so concurrent bumps never land on the same version
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Never read, or evicted: seed it instead
+        catalog_version()
+    else:
+        # Backends without a native incr set the new value with the default timeout
+        cache.touch(CATALOG_VERSION_KEY, None)
+
+
+def catalog_cache_key(*parts):
+    """Cache key that stops matching once the catalog changes"""
+    return ':'.join(['foods', str(catalog_version()), *map(str, parts)])
+
+
+class CatalogLoader:
+    """Upsert (line number, record) pairs from importer.read_csv or read_ndjson into the public catalog"""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or getattr(settings, 'CATALOG_CHUNK_SIZE', 5000)
+        self.fields = [Food._meta.get_field(name) for name in ('name',) + NUTRIENT_FIELDS]
+        self.adopted = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, records):
+        self.adopt_existing()
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.load_chunk(chunk)
+        if self.created or self.updated:
+            bump_catalog_version()
+        return {
+            'adopted': self.adopted,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def reject(self, line, error):
+        self.error_count += 1
+        if len(self.errors) < getattr(settings, 'IMPORT_MAX_REPORTED_ERRORS', 1000):
+            self.errors.append({'line': line, 'error': str(error)})
+
+    def adopt_existing(self):
+        """Set catalog_key on public foods without an owner that do not have one yet, oldest first"""
+        pending = Food.objects.filter(user=None, is_public=True, catalog_key__isnull=True).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).values_list('id', 'name')[:self.chunk_size])
+            if not batch:
+                return
+            last_id = batch[-1][0]
+            keys = {}
+            for food_id, name in batch:
+                keys.setdefault(catalog_key(name), food_id)
+            # A spelling variant of a food that already has the key stays as it is
+            taken = set(Food.objects.filter(catalog_key__in=keys).values_list('catalog_key', flat=True))
+            adopted = [Food(id=food_id, catalog_key=key) for key, food_id in keys.items() if key not in taken]
+            Food.objects.bulk_update(adopted, ['catalog_key'])
+            self.adopted += len(adopted)
+
+    def clean(self, record):
+        """Name and nutrient values of a record; raises ValidationError"""
+        values = {}
+        for field in self.fields:
+            raw = record.get(field.name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if raw is None or raw == '':
+                raw = None
+            try:
+                values[field.name] = field.clean(raw, None)
+            except ValidationError as exc:
+                raise ValidationError(f'{field.name}: {" ".join(exc.messages)}')
+            if field.name in NUTRIENT_FIELDS and values[field.name] is not None and values[field.name] < 0:
+                raise ValidationError(f'{field.name}: Ensure this value is greater than or equal to 0.')
+        return values
+
+    def load_chunk(self, chunk):
+        foods = {}
+        for line, record in chunk:
+            if isinstance(record, Exception):
+                self.reject(line, record)
+                continue
+            try:
+                values = self.clean(record)
+            except ValidationError as exc:
+                self.reject(line, ' '.join(exc.messages))
+                continue
+            key = catalog_key(values['name'])
+            if key in foods:
+                self.duplicates += 1
+            # A later spelling of the same food replaces the earlier one
+            foods[key] = values
+
+        existing = {
+            key: nutrients
+            for key, *nutrients in Food.objects.filter(catalog_key__in=foods).values_list('catalog_key', *NUTRIENT_FIELDS)
+        }
+        changed = []
+        for key, values in foods.items():
+            nutrients = [values[name] for name in NUTRIENT_FIELDS]
+            if key not in existing:
+                self.created += 1
+            elif existing[key] == nutrients:
+                self.unchanged += 1
+                continue
+            else:
+                self.updated += 1
+            changed.append(Food(catalog_key=key, user=None, is_public=True, **values))
+
+        # Existing catalog foods keep their first name; only nutrients change
+        Food.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['catalog_key'], update_fields=list(NUTRIENT_FIELDS)
+        )
@@ -0,0 +1,240 @@
+"""
+Cohort analytics for medical professionals.
+
+The engine walks a patient set in chunks. For each chunk a few GROUP BY
+queries build per-patient summaries, which are folded into mergeable
+accumulators (running moments, fixed-bin histograms and correlation sums).
+Memory stays bounded by the chunk size, and a partial result is available
+after every chunk so large cohorts can be streamed to the client.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import Avg, Count, FloatField, Q
+from django.utils import timezone
+from datetime import timedelta
+
+from .models import HealthLog, Meal, Sleep
+
+# Per-patient metric -> (low edge, high edge, number of bins)
+COHORT_METRICS = {
+    'physical_feeling': (1, 5, 8),
+    'mental_feeling': (1, 5, 8),
+    'stool_count': (0, 10, 10),
+    'weight': (30, 200, 17),
+    'bad_day_rate': (0, 1, 10),
+    'sleep_duration': (0, 14, 14),
+    'sleep_quality': (1, 5, 8),
+    'energy_level': (1, 5, 8),
+    'meals_per_day': (0, 8, 8),
+    'foods_per_meal': (0, 10, 10),
+}
+
+COHORT_CORRELATIONS = [
+    ('sleep_duration', 'physical_feeling'),
+    ('sleep_quality', 'mental_feeling'),
+    ('energy_level', 'physical_feeling'),
+    ('sleep_duration', 'bad_day_rate'),
+    ('meals_per_day', 'physical_feeling'),
+    ('foods_per_meal', 'bad_day_rate'),
+]
+
+
+class RunningMoments:
+    """Count, mean, variance, min and max of a stream of values"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 3),
+            'std': round(std, 3),
+            'min': round(self.min, 3),
+            'max': round(self.max, 3),
+        }
+
+
+class Histogram:
+    """Fixed-bin histogram; values outside the range land in the edge bins"""
+
+    def __init__(self, low, high, bins):
+        self.low = low
+        self.high = high
+        self.width = (high - low) / bins
+        self.counts = [0] * bins
+
+    def add(self, value):
+        index = int((value - self.low) / self.width)
+        self.counts[min(max(index, 0), len(self.counts) - 1)] += 1
+
+    def as_list(self):
+        return [
+            {
+                'from': round(self.low + i * self.width, 3),
+                'to': round(self.low + (i + 1) * self.width, 3),
+                'count': count,
+            }
+            for i, count in enumerate(self.counts)
+        ]
+
+
+class Correlation:
+    """Pearson correlation from running sums"""
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.syy = self.sxy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.syy += y * y
+        self.sxy += x * y
+
+    def coefficient(self):
+        if self.n < 3:
+            return None
+        cov = self.n * self.sxy - self.sx * self.sy
+        var_x = self.n * self.sxx - self.sx * self.sx
+        var_y = self.n * self.syy - self.sy * self.sy
+        if var_x <= 0 or var_y <= 0:
+            return None
+        return round(cov / math.sqrt(var_x * var_y), 3)
+
+
+class CohortAnalyticsEngine:
+    """Aggregate distributions and correlations over a set of patients"""
+
+    def __init__(self, patient_ids, days=90, chunk_size=None):
+        self.patient_ids = sorted(set(patient_ids))
+        self.days = days
+        self.chunk_size = chunk_size or getattr(settings, 'COHORT_CHUNK_SIZE', 500)
+        self.end_date = timezone.now().date()
+        self.start_date = self.end_date - timedelta(days=days - 1)
+
+        self.processed = 0
+        self.with_data = 0
+        self.moments = {metric: RunningMoments() for metric in COHORT_METRICS}
+        self.histograms = {metric: Histogram(*spec) for metric, spec in COHORT_METRICS.items()}
+        self.correlations = {pair: Correlation() for pair in COHORT_CORRELATIONS}
+
+    def summarise_chunk(self, patient_ids):
+        """Per-patient summaries for one chunk, built with three grouped queries"""
+        summaries = {patient_id: {} for patient_id in patient_ids}
+
+        health = (
+            HealthLog.objects.filter(
+                user_id__in=patient_ids, date__gte=self.start_date, date__lte=self.end_date
+            )
+            .values('user_id')
+            .annotate(
+                logs=Count('id'),
+                bad_days=Count('id', filter=Q(physical_feeling__lte=2)),
+                physical_feeling=Avg('physical_feeling', output_field=FloatField()),
+                mental_feeling=Avg('mental_feeling', output_field=FloatField()),
+                stool_count=Avg('stool_count', output_field=FloatField()),
+                weight=Avg('weight', output_field=FloatField()),
+            )
+            .order_by()
+        )
+        for row in health:
+            summary = summaries[row['user_id']]
+            for metric in ('physical_feeling', 'mental_feeling', 'stool_count', 'weight'):
+                summary[metric] = row[metric]
+            summary['bad_day_rate'] = row['bad_days'] / row['logs']
+
+        sleep = (
+            Sleep.objects.filter(
+                user_id__in=patient_ids, date__gte=self.start_date, date__lte=self.end_date
+            )
+            .values('user_id')
+            .annotate(
+                sleep_duration=Avg('duration', output_field=FloatField()),
+                sleep_quality=Avg('quality', output_field=FloatField()),
+                energy_level=Avg('energy_level', output_field=FloatField()),
+            )
+            .order_by()
+        )
+        for row in sleep:
+            summaries[row['user_id']].update(
+                sleep_duration=row['sleep_duration'],
+                sleep_quality=row['sleep_quality'],
+                energy_level=row['energy_level'],
+            )
+
+        meals = (
+            Meal.objects.filter(
+                user_id__in=patient_ids,
+                local_date__gte=self.start_date,
+                local_date__lte=self.end_date,
+            )
+            .values('user_id')
+            .annotate(meals=Count('id', distinct=True), foods=Count('mealfood'))
+            .order_by()
+        )
+        for row in meals:
+            summaries[row['user_id']].update(
+                meals_per_day=row['meals'] / self.days,
+                foods_per_meal=row['foods'] / row['meals'],
+            )
+
+        return summaries
+
+    def add_summary(self, summary):
+        values = {metric: value for metric, value in summary.items() if value is not None}
+        if not values:
+            return
+        self.with_data += 1
+        for metric, value in values.items():
+            self.moments[metric].add(value)
+            self.histograms[metric].add(value)
+        for (x, y), correlation in self.correlations.items():
+            if x in values and y in values:
+                correlation.add(values[x], values[y])
+
+    def snapshot(self, done=False):
+        return {
+            'done': done,
+            'patients': len(self.patient_ids),
+            'processed': self.processed,
+            'with_data': self.with_data,
+            'window': {'from': str(self.start_date), 'to': str(self.end_date)},
+            'distributions': {
+                metric: dict(self.moments[metric].as_dict(), histogram=self.histograms[metric].as_list())
+                for metric in COHORT_METRICS
+            },
+            'correlations': [
+                {'x': x, 'y': y, 'n': correlation.n, 'r': correlation.coefficient()}
+                for (x, y), correlation in self.correlations.items()
+            ],
+        }
+
+    def run(self):
+        """Process the cohort chunk by chunk, yielding a partial result after each one"""
+        for offset in range(0, len(self.patient_ids), self.chunk_size):
+            chunk = self.patient_ids[offset:offset + self.chunk_size]
+            for summary in self.summarise_chunk(chunk).values():
+                self.add_summary(summary)
+            self.processed += len(chunk)
+            if self.processed < len(self.patient_ids):
+                yield self.snapshot()
+        yield self.snapshot(done=True)
@@ -0,0 +1,446 @@
+"""
+Columnar per-user snapshots of health and sleep logs on local disk.
+
+A snapshot holds a user's whole history of one table, archived rows
+included, as one file per column under COLUMNAR_SNAPSHOT_DIR. Fixed-width
+columns are raw arrays (dates as day ordinals, decimals as scaled integers,
+nulls as a sentinel); text columns are an offsets array plus UTF-8 bytes.
+Readers memory-map the files and scan them without querying the database or
+building model instances.
+
+Rows are sorted by date. New days are appended in place, while edits,
+deletions and backdated logs rebuild the snapshot into a new generation
+directory. A write marks the snapshot stale until the columnar_snapshots
+task has caught up, and stale snapshots are never read. Snapshots are
+opt-in per user: only users built by build_columnar_snapshots have one.
+"""
+import array
+import bisect
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .archive import ArchiveService
+from .models import User, HealthLog, Sleep, ArchiveBlob
+
+FORMAT_VERSION = 1
+
+# Stored in place of a null in 32-bit columns; one-byte columns use -1
+NULL = -2 ** 31
+# Stored for a blank ('') choice, which the API accepts as well as null
+BLANK_CHOICE = -2
+
+MANIFEST = 'manifest.json'
+STALE = 'STALE'
+
+
+class Column:
+    """Storage of one model field as a column"""
+
+    def __init__(self, field):
+        self.field = field
+        self.name = field.name
+        if field.choices:
+            self.kind = 'choice'
+            self.choices = [value for value, _ in field.choices]
+        elif isinstance(field, (models.TextField, models.CharField)):
+            self.kind = 'text'
+        elif isinstance(field, models.DateField):
+            self.kind = 'date'
+        elif isinstance(field, models.DecimalField):
+            self.kind = 'decimal'
+            self.scale = field.decimal_places
+        elif isinstance(field, models.BooleanField):
+            self.kind = 'bool'
+        else:
+            self.kind = 'int'
+
+        if self.kind in ('choice', 'bool'):
+            self.typecode, self.null = 'b', -1
+        elif self.kind == 'text' or field.primary_key:
+            # Text columns store their offsets array here
+            self.typecode, self.null = 'q', None
+        else:
+            self.typecode, self.null = 'i', NULL
+        self.itemsize = array.array(self.typecode).itemsize
+
+    def encode(self, value):
+        if value is None:
+            return self.null
+        if self.kind == 'choice':
+            return BLANK_CHOICE if value == '' else self.choices.index(value)
+        if self.kind == 'date':
+            return value.toordinal()
+        if self.kind == 'decimal':
+            return int(Decimal(value).scaleb(self.scale))
+        return int(value)
+
+    def decode(self, stored):
+        if stored == self.null:
+            return None
+        if self.kind == 'choice':
+            return '' if stored == BLANK_CHOICE else self.choices[stored]
+        if self.kind == 'date':
+            return date.fromordinal(stored)
+        if self.kind == 'decimal':
+            return Decimal(stored).scaleb(-self.scale)
+        if self.kind == 'bool':
+            return bool(stored)
+        return stored
+
+    def represent(self, value):
+        """API representation of a decoded value, as the model serializers render it"""
+        if value is None or self.kind in ('int', 'bool', 'choice', 'text'):
+            return value
+        return str(value) if self.kind == 'decimal' else value.isoformat()
+
+
+class ColumnarTable:
+    """Column layout of one model's snapshot; every concrete field except the user"""
+
+    def __init__(self, model, archive_kind):
+        self.model = model
+        self.archive_kind = archive_kind
+        self.columns = [Column(field) for field in model._meta.concrete_fields if field.name != 'user']
+        self.by_name = {column.name: column for column in self.columns}
+        self.value_columns = [column for column in self.columns if column.kind != 'text']
+        self.date_index = self.columns.index(self.by_name['date'])
+        self.value_fields = tuple(column.name for column in self.value_columns)
+        self._record_types = {}
+
+    def record_type(self, fields):
+        """
+        Named tuple class holding the given fields of one row.
+
+        Analytics load every row as one of these: a tuple has no per-instance
+        __dict__ or ModelState, so a row costs a fraction of a model instance.
+        """
+        fields = tuple(fields)
+        if fields not in self._record_types:
+            self._record_types[fields] = namedtuple(f'{self.model.__name__}Record', fields)
+        return self._record_types[fields]
+
+    def rows(self, queryset):
+        return queryset.order_by('date').values_list(*(column.field.attname for column in self.columns))
+
+    def archived_rows(self, user):
+        """Archived rows as value tuples in column order"""
+        return [
+            tuple(column.field.to_python(row.get(column.name)) for column in self.columns)
+            for row in ArchiveService.read(user, self.archive_kind)
+        ]
+
+    def archived_records(self, user, fields, start_date=None, end_date=None):
+        """Archived rows of the window as records of fields, newest first"""
+        record = self.record_type(fields)
+        columns = [self.by_name[name] for name in fields]
+        return [
+            record._make(column.field.to_python(row.get(column.name)) for column in columns)
+            for row in ArchiveService.read(user, self.archive_kind, start_date, end_date)
+        ]
+
+
+COLUMNAR_TABLES = {
+    'health_logs': ColumnarTable(HealthLog, ArchiveBlob.Kind.HEALTH_LOGS),
+    'sleep': ColumnarTable(Sleep, ArchiveBlob.Kind.SLEEP),
+}
+
+COLUMNAR_MODELS = {table.model: name for name, table in COLUMNAR_TABLES.items()}
+
+
+class ColumnarSnapshot:
+    """Read access to one fresh snapshot; columns are memory-mapped on first use"""
+
+    def __init__(self, table, directory, manifest):
+        self.table = table
+        self.directory = directory
+        self.rows = manifest['rows']
+        self.last_date = date.fromisoformat(manifest['last_date']) if manifest['last_date'] else None
+        self._mapped = {}
+
+    def _map(self, filename, typecode, count):
+        itemsize = array.array(typecode).itemsize
+        if count == 0:
+            return memoryview(array.array(typecode))
+        with open(self.directory / filename, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), count * itemsize, access=mmap.ACCESS_READ)
+        return memoryview(mapped).cast(typecode)
+
+    def column(self, name):
+        """Stored values of a fixed-width column, without copying"""
+        if name not in self._mapped:
+            column = self.table.by_name[name]
+            self._mapped[name] = self._map(f'{name}.col', column.typecode, self.rows)
+        return self._mapped[name]
+
+    def text(self, name):
+        """Decoded values of a text column"""
+        offsets = self._map(f'{name}.offsets', 'q', self.rows + 1)
+        data = self._map(f'{name}.txt', 'B', offsets[-1] if self.rows else 0)
+        return [bytes(data[start:end]).decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def span(self, start_date=None, end_date=None):
+        """Row range (lo, hi) of the days from start_date to end_date inclusive"""
+        dates = self.column('date')
+        lo = bisect.bisect_left(dates, start_date.toordinal()) if start_date else 0
+        hi = bisect.bisect_right(dates, end_date.toordinal()) if end_date else self.rows
+        return lo, max(lo, hi)
+
+    def records(self, start_date=None, end_date=None, fields=None):
+        """Rows of the window as records of fields (default: every non-text field), oldest first"""
+        fields = fields or self.table.value_fields
+        lo, hi = self.span(start_date, end_date)
+        values = [
+            [column.decode(stored) for stored in self.column(column.name)[lo:hi].tolist()]
+            for column in (self.table.by_name[name] for name in fields)
+        ]
+        return list(map(self.table.record_type(fields)._make, zip(*values)))
+
+    def representation(self, user_id):
+        """Every row in API representation, newest first, like the export endpoints"""
+        names = []
+        values = []
+        for column in self.table.columns:
+            names.append(column.name)
+            if column.kind == 'text':
+                values.append(self.text(column.name))
+            else:
+                values.append([column.represent(column.decode(stored)) for stored in self.column(column.name).tolist()])
+        rows = []
+        for row in zip(*values):
+            data = dict(zip(names, row))
+            rows.append({'id': data.pop('id'), 'user': user_id, **data})
+        rows.reverse()
+        return rows
+
+    def aggregate(self, lo, hi, fields):
+        """Row count and each field's non-null count, mean, min and max, keyed like the SQL aggregates"""
+        result = {'count': hi - lo}
+        for name in fields:
+            column = self.table.by_name[name]
+            values = self.column(name)[lo:hi]
+            if column.field.null:
+                values = [stored for stored in values if stored != column.null]
+            result[f'{name}__n'] = len(values)
+            if not len(values):
+                result[f'{name}__mean'] = result[f'{name}__min'] = result[f'{name}__max'] = None
+                continue
+            scale = 10 ** column.scale if column.kind == 'decimal' else 1
+            result[f'{name}__mean'] = sum(values) / len(values) / scale
+            result[f'{name}__min'] = column.decode(min(values))
+            result[f'{name}__max'] = column.decode(max(values))
+        return result
+
+    def choice_counts(self, name, lo, hi):
+        """Number of rows holding each choice of a choice column"""
+        column = self.table.by_name[name]
+        stored = self.column(name)[lo:hi].tolist()
+        return {value: stored.count(code) for code, value in enumerate(column.choices)}
+
+
+def _write_columns(directory, table, rows, existing):
+    """Append encoded rows to the column files, dropping anything past the first existing rows"""
+    for index, column in enumerate(table.columns):
+        if column.kind == 'text':
+            _append_text(directory, column.name, [row[index] or '' for row in rows], existing)
+            continue
+        path = directory / f'{column.name}.col'
+        path.touch()
+        values = array.array(column.typecode, (column.encode(row[index]) for row in rows))
+        with open(path, 'r+b') as file:
+            # Leftovers of an interrupted append are not covered by the manifest
+            file.truncate(existing * column.itemsize)
+            file.seek(0, os.SEEK_END)
+            values.tofile(file)
+
+
+def _append_text(directory, name, texts, existing):
+    offsets_path = directory / f'{name}.offsets'
+    data_path = directory / f'{name}.txt'
+    if not offsets_path.exists():
+        with open(offsets_path, 'wb') as offsets_file:
+            array.array('q', [0]).tofile(offsets_file)
+        data_path.touch()
+
+    with open(offsets_path, 'r+b') as offsets_file, open(data_path, 'r+b') as data_file:
+        offsets_file.seek(existing * 8)
+        end = array.array('q')
+        end.fromfile(offsets_file, 1)
+        end = end[0]
+        offsets_file.truncate((existing + 1) * 8)
+        data_file.truncate(end)
+
+        offsets = array.array('q')
+        data_file.seek(0, os.SEEK_END)
+        for text in texts:
+            encoded = text.encode()
+            data_file.write(encoded)
+            end += len(encoded)
+            offsets.append(end)
+        offsets_file.seek(0, os.SEEK_END)
+        offsets.tofile(offsets_file)
+
+
+class ColumnarSnapshotService:
+    """Build, refresh and open users' columnar snapshots"""
+
+    @staticmethod
+    def root():
+        return Path(getattr(settings, 'COLUMNAR_SNAPSHOT_DIR', settings.BASE_DIR / 'snapshots'))
+
+    @staticmethod
+    def table_dir(user_id, table_name):
+        return ColumnarSnapshotService.root() / str(user_id) / table_name
+
+    @staticmethod
+    def _manifest(directory):
+        try:
+            manifest = json.loads((directory / MANIFEST).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return manifest if manifest.get('format') == FORMAT_VERSION else None
+
+    @staticmethod
+    def _write_manifest(directory, manifest):
+        tmp = directory / f'{MANIFEST}.tmp'
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, directory / MANIFEST)
+
+    @staticmethod
+    @contextmanager
+    def _locked(directory):
+        """Serialise refreshes of one snapshot across processes"""
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def exists(user_id, table_name):
+        return (ColumnarSnapshotService.table_dir(user_id, table_name) / MANIFEST).exists()
+
+    @staticmethod
+    def open(user_id, table_name):
+        """The user's snapshot of table_name, or None if there is none or it is stale"""
+        directory = ColumnarSnapshotService.table_dir(user_id, table_name)
+        if (directory / STALE).exists():
+            return None
+        manifest = ColumnarSnapshotService._manifest(directory)
+        if manifest is None:
+            return None
+        return ColumnarSnapshot(COLUMNAR_TABLES[table_name], directory / manifest['generation'], manifest)
+
+    @staticmethod
+    def mark_stale(user_id, table_name):
+        """Stop reading the snapshot until a refresh has included the latest write"""
+        (ColumnarSnapshotService.table_dir(user_id, table_name) / STALE).touch()
+
+    @staticmethod
+    def build(user, table_name):
+        """Write a new generation holding the user's whole history; returns the row count"""
+        directory = ColumnarSnapshotService.table_dir(user.pk, table_name)
+        with ColumnarSnapshotService._locked(directory):
+            started = time.time()
+            rows = ColumnarSnapshotService._rebuild(user, table_name, directory)
+            ColumnarSnapshotService._clear_stale(directory, started)
+        return rows
+
+    @staticmethod
+    def refresh(user_id, table_name, since=None, rebuild=False):
+        """
+        Bring an existing snapshot up to date after writes.
+
+        Logs dated after the snapshot's last day are appended; anything else
+        (edits, deletions, backdated logs) rebuilds it. Returns the row count,
+        or None when the user has no snapshot of this table.
+        """
+        directory = ColumnarSnapshotService.table_dir(user_id, table_name)
+        if not (directory / MANIFEST).exists():
+            return None
+
+        with ColumnarSnapshotService._locked(directory):
+            started = time.time()
+            manifest = ColumnarSnapshotService._manifest(directory)
+            last_date = manifest and manifest['last_date']
+            if isinstance(since, date):
+                since = since.isoformat()
+            if manifest is None or rebuild or (since and last_date and since <= last_date):
+                user = User.objects.only('id', 'archived_through').get(pk=user_id)
+                rows = ColumnarSnapshotService._rebuild(user, table_name, directory)
+            else:
+                rows = ColumnarSnapshotService._append(user_id, table_name, directory, manifest)
+            ColumnarSnapshotService._clear_stale(directory, started)
+        return rows
+
+    @staticmethod
+    def _rebuild(user, table_name, directory):
+        table = COLUMNAR_TABLES[table_name]
+        rows = table.archived_rows(user) + list(table.rows(table.model.objects.filter(user=user)))
+        rows.sort(key=lambda row: row[table.date_index])
+
+        generation = f'g{time.time_ns()}'
+        (directory / generation).mkdir()
+        _write_columns(directory / generation, table, rows, 0)
+        ColumnarSnapshotService._write_manifest(directory, {
+            'format': FORMAT_VERSION,
+            'generation': generation,
+            'rows': len(rows),
+            'last_date': ColumnarSnapshotService._last_date(table, rows),
+            'built_at': timezone.now().isoformat(),
+        })
+
+        # Readers that already mapped an old generation keep their open files
+        for old in directory.iterdir():
+            if old.is_dir() and old.name != generation:
+                shutil.rmtree(old, ignore_errors=True)
+        return len(rows)
+
+    @staticmethod
+    def _append(user_id, table_name, directory, manifest):
+        table = COLUMNAR_TABLES[table_name]
+        new_rows = table.model.objects.filter(user_id=user_id)
+        if manifest['last_date']:
+            new_rows = new_rows.filter(date__gt=manifest['last_date'])
+        new_rows = list(table.rows(new_rows))
+        if new_rows:
+            _write_columns(directory / manifest['generation'], table, new_rows, manifest['rows'])
+            ColumnarSnapshotService._write_manifest(directory, dict(
+                manifest,
+                rows=manifest['rows'] + len(new_rows),
+                last_date=ColumnarSnapshotService._last_date(table, new_rows),
+            ))
+        return manifest['rows'] + len(new_rows)
+
+    @staticmethod
+    def _last_date(table, rows):
+        if not rows:
+            return None
+        return rows[-1][table.date_index].isoformat()
+
+    @staticmethod
+    def _clear_stale(directory, started):
+        # A write marked after this refresh started may not be included; keep the marker for its task
+        try:
+            if (directory / STALE).stat().st_mtime <= started:
+                (directory / STALE).unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def remove_user(user_id):
+        shutil.rmtree(ColumnarSnapshotService.root() / str(user_id), ignore_errors=True)
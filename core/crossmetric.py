@@ -0,0 +1,122 @@
+"""
+Lagged cross-correlation between sleep and next-day health metrics.
+
+Sleep and health logs share the (user, date) key. Both series of a window
+are loaded once with load_series and laid out as dense per-metric columns
+indexed by day, None where a day has no log. A single pass over the days
+then feeds every (lag, sleep metric, health metric) cell into a running
+Pearson accumulator. Lag k pairs the sleep logged on day d with the health
+log of day d + k, so lag 1 relates a night's sleep to the following day.
+
+Results are cached per user, window and lags. Writes to a user's health or
+sleep logs move the user to a new cache version.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cohort import Correlation
+from .services import load_series
+
+SLEEP_METRICS = ('quality', 'duration', 'energy_level')
+HEALTH_METRICS = ('physical_feeling', 'mental_feeling', 'stool_count', 'stool_quality', 'weight')
+
+# Stool quality as an ordinal, from hard to loose
+STOOL_SCALE = {'hard': 1, 'normal': 2, 'soft': 3, 'diarrhea': 4}
+
+
+def _numeric(metric, value):
+    if value is None:
+        return None
+    if metric == 'stool_quality':
+        return STOOL_SCALE.get(value)
+    return float(value)
+
+
+def _columns(records, metrics, first_day, length):
+    """metric -> list of float or None, one entry per day from first_day"""
+    columns = {metric: [None] * length for metric in metrics}
+    for record in records:
+        index = (record.date - first_day).days
+        for metric in metrics:
+            columns[metric][index] = _numeric(metric, getattr(record, metric))
+    return columns
+
+
+class CrossCorrelationService:
+    """Correlation matrices between sleep metrics and lagged health metrics"""
+
+    @staticmethod
+    def version_key(user_id):
+        return f'cross-correlation-version:{user_id}'
+
+    @staticmethod
+    def invalidate_user(user_id):
+        cache.set(CrossCorrelationService.version_key(user_id), time.time_ns(), None)
+
+    @staticmethod
+    def get(user, days=90, lags=None):
+        """The cached result for the window ending today, computing it when missing"""
+        lags = tuple(sorted(set(lags if lags is not None else getattr(settings, 'CROSS_CORRELATION_LAGS', (0, 1)))))
+        end_date = timezone.now().date()
+        # A version lost from the cache becomes a new one, never an old one
+        version = cache.get_or_set(CrossCorrelationService.version_key(user.pk), time.time_ns, None)
+        key = f"cross-correlation:{user.pk}:{version}:{end_date}:{days}:{','.join(map(str, lags))}"
+        result = cache.get(key)
+        if result is None:
+            result = CrossCorrelationService.compute(user, days, lags, end_date)
+            cache.set(key, result, getattr(settings, 'CROSS_CORRELATION_CACHE_TIMEOUT', 3600))
+        return result
+
+    @staticmethod
+    def compute(user, days, lags, end_date):
+        start_date = end_date - timedelta(days=days-1)  # -1 because end_date is inclusive
+        # Positive lags pair health in the window with sleep from before it
+        sleep_start = start_date - timedelta(days=max(lags))
+        span = (end_date - sleep_start).days + 1
+
+        sleep = _columns(
+            load_series(user, 'sleep', ('date',) + SLEEP_METRICS, sleep_start, end_date),
+            SLEEP_METRICS, sleep_start, span
+        )
+        health = _columns(
+            load_series(user, 'health_logs', ('date',) + HEALTH_METRICS, start_date, end_date),
+            HEALTH_METRICS, sleep_start, span
+        )
+
+        cells = {
+            lag: [[Correlation() for _ in HEALTH_METRICS] for _ in SLEEP_METRICS]
+            for lag in lags
+        }
+        health_rows = [health[metric] for metric in HEALTH_METRICS]
+        sleep_rows = [sleep[metric] for metric in SLEEP_METRICS]
+        for day in range(span - days, span):
+            health_values = [(j, row[day]) for j, row in enumerate(health_rows) if row[day] is not None]
+            if not health_values:
+                continue
+            for lag in lags:
+                for i, row in enumerate(sleep_rows):
+                    x = row[day - lag]
+                    if x is None:
+                        continue
+                    cell_row = cells[lag][i]
+                    for j, y in health_values:
+                        cell_row[j].add(x, y)
+
+        return {
+            'start_date': str(start_date),
+            'end_date': str(end_date),
+            'sleep_metrics': list(SLEEP_METRICS),
+            'health_metrics': list(HEALTH_METRICS),
+            'lags': [
+                {
+                    'lag': lag,
+                    'r': [[cell.coefficient() for cell in row] for row in cells[lag]],
+                    'n': [[cell.n for cell in row] for row in cells[lag]],
+                }
+                for lag in lags
+            ],
+        }
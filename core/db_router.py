@@ -0,0 +1,93 @@
+"""
+Read routing for replica and analytics databases.
+
+Views opt in with ReadReplicaMixin and a read_route. DATABASE_READ_ROUTES
+maps each route to a database alias, and an alias that is not configured
+falls back to default. Writes always go to default. A request that writes
+switches its remaining reads back to default. The writing user is then
+pinned to default for DATABASE_STICKY_SECONDS, so their next requests
+read their own writes even while the replica lags. Pins live in the shared
+cache, so they hold whichever worker process serves the next request, and
+only default is migrated: the read aliases get their schema by replication.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+STICKY_CACHE_KEY = 'db:sticky:{}'
+# DatabaseCache's table lives in default only, and its writes are not the request's writes
+CACHE_APP_LABEL = 'django_cache'
+
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Routing decisions for the request being handled"""
+
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+
+
+def begin_request():
+    """Start routing a new request; reads go to default until a view opts in"""
+    state = RoutingState()
+    _routing.set(state)
+    return state
+
+
+def end_request():
+    """Stop routing once the response, including any streamed body, is finished"""
+    _routing.set(None)
+
+
+def current_state():
+    return _routing.get()
+
+
+def is_pinned(user_id):
+    return cache.get(STICKY_CACHE_KEY.format(user_id)) is not None
+
+
+def pin_to_primary(user_id):
+    """Keep a user's reads on default for a while after they wrote"""
+    cache.set(STICKY_CACHE_KEY.format(user_id), True, getattr(settings, 'DATABASE_STICKY_SECONDS', 5))
+
+
+def route_reads(route, user):
+    """Send the current request's reads to the alias configured for route"""
+    state = current_state()
+    alias = getattr(settings, 'DATABASE_READ_ROUTES', {}).get(route)
+    if state is None or alias is None or alias not in settings.DATABASES:
+        return None
+    if user.is_authenticated and is_pinned(user.pk):
+        return None
+    state.read_alias = alias
+    return alias
+
+
+class ReadReplicaRouter:
+    """Route reads to the alias chosen for the current request, and every write to default"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return 'default'
+        state = current_state()
+        if state is None or state.wrote:
+            return None
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = current_state()
+        if state is not None and model._meta.app_label != CACHE_APP_LABEL:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Read aliases get the schema by replication; DATABASE_STANDALONE_ALIASES are migrated like default
+        return db == 'default' or db in getattr(settings, 'DATABASE_STANDALONE_ALIASES', ())
@@ -0,0 +1,326 @@
+"""
+Streaming import of meals, health logs and sleep logs from other trackers.
+
+Input is CSV with a header row, or NDJSON with one JSON object per line. It
+is read line by line, so uploads of any size run in constant memory.
+Records are validated with the model fields and written with bulk_create in
+chunks of IMPORT_CHUNK_SIZE, one transaction per chunk. An invalid line,
+including one that is not UTF-8, is reported with its line number and
+skipped; the rest of the import goes on. Days the user's archive already
+covers are rejected, as the live rows would duplicate archived ones.
+
+Meals list their foods, either as an NDJSON list of {"name", "amount"}
+objects or as a CSV "foods" column such as "Oatmeal:80|Milk:200". Names
+resolve through a per-import cache to the user's own or public foods, and
+unknown names become private foods of the user. Meal times without an
+offset are taken to be in the user's time zone.
+"""
+import csv
+import json
+import zoneinfo
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Food, HealthLog, Meal, MealFood, Sleep, local_date
+from .signals import bulk_created
+
+# Import kind -> (model, fields read from each record)
+IMPORT_KINDS = {
+    'health_logs': (HealthLog, (
+        'date', 'physical_feeling', 'mental_feeling', 'stool_count', 'stool_quality',
+        'complete_evacuation', 'weight', 'symptoms', 'notes',
+    )),
+    'sleep': (Sleep, ('date', 'duration', 'quality', 'wake_up_ease', 'energy_level', 'notes')),
+    'meals': (Meal, ('date_time', 'meal_type', 'notes')),
+}
+
+# Content type -> input format
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+NOT_UTF8 = 'Not UTF-8 encoded'
+
+BOOLEAN_STRINGS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+
+class RecordError(Exception):
+    """A record that cannot be imported"""
+
+
+def _decoded(lines, undecodable):
+    """
+    Text of every line. A line that is not UTF-8 reads as blank and its
+    number is appended to undecodable, so that one bad line fails on its own.
+    """
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                undecodable.append(number)
+                line = '\n'
+        yield line.lstrip('\ufeff') if number == 1 else line
+
+
+def read_csv(lines):
+    """(line number, record or RecordError) for every CSV row after the header"""
+    undecodable = []
+    reader = csv.reader(_decoded(lines, undecodable))
+    header = [name.strip() for name in next(reader, [])]
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            row = None
+        except csv.Error as exc:
+            row = RecordError(f'Malformed CSV: {exc}')
+        # Lines the reader went through to get this row
+        while undecodable:
+            yield undecodable.pop(0), RecordError(NOT_UTF8)
+        if row is None:
+            return
+        if isinstance(row, RecordError):
+            yield reader.line_num, row
+            continue
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            yield reader.line_num, RecordError(f'Expected {len(header)} columns, found {len(row)}')
+            continue
+        yield reader.line_num, dict(zip(header, row))
+
+
+def read_ndjson(lines):
+    """(line number, record or RecordError) for every non-empty NDJSON line"""
+    undecodable = []
+    for number, line in enumerate(_decoded(lines, undecodable), start=1):
+        if undecodable:
+            yield undecodable.pop(), RecordError(NOT_UTF8)
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, RecordError(f'Invalid JSON: {exc}')
+            continue
+        if not isinstance(record, dict):
+            yield number, RecordError('Expected a JSON object')
+            continue
+        yield number, record
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class DiaryImporter:
+    """Import one kind of record for one user"""
+
+    def __init__(self, user, kind, chunk_size=None):
+        self.user = user
+        self.kind = kind
+        self.model, field_names = IMPORT_KINDS[kind]
+        self.fields = [self.model._meta.get_field(name) for name in field_names]
+        self.chunk_size = chunk_size or getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+        self.tz = zoneinfo.ZoneInfo(user.timezone)
+        self.food_ids = {}  # food name -> id, shared by every chunk
+        self.imported = 0
+        self.foods_created = 0
+        self.error_count = 0
+        self.errors = []
+        self.days = set()
+
+    def run(self, records):
+        """Import (line number, record) pairs from read_csv or read_ndjson; returns a summary"""
+        records = iter(records)
+        try:
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        finally:
+            # Whatever was written still needs its derived data updated
+            bulk_created(self.model, self.user.pk, self.days)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'kind': self.kind,
+            'imported': self.imported,
+            'foods_created': self.foods_created,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def reject(self, line, error):
+        self.error_count += 1
+        if len(self.errors) < getattr(settings, 'IMPORT_MAX_REPORTED_ERRORS', 1000):
+            self.errors.append({'line': line, 'error': str(error)})
+
+    def clean(self, record):
+        """Model field values of a record; raises RecordError"""
+        values = {}
+        for field in self.fields:
+            raw = record.get(field.name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if raw is None or raw == '':
+                if field.has_default():
+                    values[field.attname] = field.get_default()
+                elif field.blank:
+                    values[field.attname] = None if field.null else ''
+                else:
+                    raise RecordError(f'{field.name}: This field is required.')
+                continue
+            if isinstance(field, models.BooleanField) and isinstance(raw, str):
+                raw = BOOLEAN_STRINGS.get(raw.lower(), raw)
+            try:
+                value = field.clean(raw, None)
+            except ValidationError as exc:
+                raise RecordError(f'{field.name}: {" ".join(exc.messages)}')
+            if isinstance(field, models.DateTimeField) and timezone.is_naive(value):
+                value = timezone.make_aware(value, self.tz)
+            values[field.attname] = value
+        return values
+
+    def check_archived(self, values):
+        """Raises RecordError for a day already moved to the archive, which a live row would duplicate"""
+        archived_through = self.user.archived_through
+        if archived_through is None:
+            return
+        if self.model is Meal:
+            name, day = 'date_time', local_date(values['date_time'], self.user.timezone)
+        else:
+            name, day = 'date', values['date']
+        if day <= archived_through:
+            raise RecordError(f'{name}: {day} is archived')
+
+    def clean_foods(self, raw):
+        """[(name, amount)] from an NDJSON list or a CSV "name:amount|name:amount" string"""
+        if raw is None or raw == '':
+            return []
+        if isinstance(raw, str):
+            items = []
+            for part in raw.split('|'):
+                name, separator, amount = part.rpartition(':')
+                if not separator:
+                    raise RecordError(f'foods: expected name:amount, found "{part.strip()}"')
+                items.append({'name': name, 'amount': amount.strip()})
+            raw = items
+        if not isinstance(raw, list):
+            raise RecordError('foods: expected a list of foods')
+
+        name_field = Food._meta.get_field('name')
+        amount_field = MealFood._meta.get_field('amount')
+        foods = []
+        for item in raw:
+            if not isinstance(item, dict):
+                raise RecordError('foods: every food needs a name and an amount')
+            try:
+                name = name_field.clean(str(item.get('name') or '').strip(), None)
+                amount = amount_field.clean(item.get('amount'), None)
+            except ValidationError as exc:
+                raise RecordError(f'foods: {item.get("name") or "food"}: {" ".join(exc.messages)}')
+            foods.append((name, amount))
+        return foods
+
+    def import_chunk(self, chunk):
+        valid = []
+        for line, record in chunk:
+            if isinstance(record, RecordError):
+                self.reject(line, record)
+                continue
+            try:
+                values = self.clean(record)
+                foods = self.clean_foods(record.get('foods')) if self.model is Meal else []
+                self.check_archived(values)
+            except RecordError as exc:
+                self.reject(line, exc)
+                continue
+            valid.append((line, values, foods))
+
+        try:
+            with transaction.atomic():
+                if self.model is Meal:
+                    days, foods_created = self.write_meals(valid)
+                else:
+                    days, foods_created = self.write_logs(valid), 0
+        except IntegrityError as exc:
+            # A concurrent write took one of the days; nothing of this chunk was kept
+            self.food_ids.clear()
+            for line, _, _ in valid:
+                self.reject(line, f'Not imported: {exc}')
+            return
+        # Counted once the chunk is committed
+        self.imported += len(days)
+        self.foods_created += foods_created
+        self.days.update(days)
+
+    def write_logs(self, valid):
+        """Write the logs of a chunk; returns their dates"""
+        dates = {values['date'] for _, values, _ in valid}
+        taken = set(self.model.objects.filter(user=self.user, date__in=dates).values_list('date', flat=True))
+        logs = []
+        for line, values, _ in valid:
+            if values['date'] in taken:
+                self.reject(line, f'date: {values["date"]} is already logged')
+                continue
+            taken.add(values['date'])
+            logs.append(self.model(user=self.user, **values))
+
+        self.model.objects.bulk_create(logs)
+        return [log.date for log in logs]
+
+    def write_meals(self, valid):
+        """Write the meals of a chunk; returns their local dates and the number of foods created"""
+        foods_created = self.resolve_foods({name for _, _, foods in valid for name, _ in foods})
+        meals = []
+        for _, values, _ in valid:
+            meal = Meal(user=self.user, **values)
+            # bulk_create skips Meal.save, which normally sets the local date
+            meal.local_date = local_date(meal.date_time, self.user.timezone)
+            meals.append(meal)
+
+        Meal.objects.bulk_create(meals)
+        MealFood.objects.bulk_create([
+            MealFood(meal=meal, food_id=self.food_ids[name], amount=amount)
+            for meal, (_, _, foods) in zip(meals, valid)
+            for name, amount in foods
+        ])
+        return [meal.local_date for meal in meals], foods_created
+
+    def resolve_foods(self, names):
+        """
+        Cache the food id of every name, creating private foods of the user
+        for unknown names; returns the number of foods created
+        """
+        missing = names - self.food_ids.keys()
+        if not missing:
+            return 0
+        found = {}
+        candidates = (
+            Food.objects.filter(Q(is_public=True) | Q(user=self.user), name__in=missing)
+            .values_list('id', 'name', 'user_id')
+        )
+        # The user's own food wins over a public one of the same name, then the oldest
+        for food_id, name, owner_id in sorted(candidates, key=lambda row: (row[2] != self.user.pk, row[0])):
+            found.setdefault(name, food_id)
+
+        new_foods = [Food(name=name, user=self.user, is_public=False) for name in sorted(missing - found.keys())]
+        if new_foods:
+            Food.objects.bulk_create(new_foods)
+            found.update((food.name, food.id) for food in new_foods)
+        self.food_ids.update(found)
+        return len(new_foods)
@@ -0,0 +1,33 @@
+"""
+Backfill of Meal.local_date, the day of a meal in its user's time zone.
+
+Day-based meal queries filter and group on this stored, indexed column
+instead of date_time__date, which the database computes in UTC for every
+row. Meal.save keeps it current. backfill() fills it for meals written
+before the column existed, and recomputes a user's meals after the user
+changes time zone.
+"""
+from django.db import transaction
+
+from .models import Meal, local_date
+
+
+def backfill(meals, batch_size=1000):
+    """Recompute local_date for the meals queryset in id-ordered batches; returns the number updated"""
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(
+            meals.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'date_time', 'user__timezone')[:batch_size]
+        )
+        if not batch:
+            return updated
+        with transaction.atomic():
+            # bulk_update skips save() and the signals; only the derived column changes
+            Meal.objects.bulk_update(
+                [Meal(id=meal_id, local_date=local_date(moment, tz_name)) for meal_id, moment, tz_name in batch],
+                ['local_date'],
+            )
+        updated += len(batch)
+        last_id = batch[-1][0]
@@ -0,0 +1,38 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from core.archive import ARCHIVE_SOURCES, ArchiveService
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Moves meals, health logs and sleep logs older than ARCHIVE_HORIZON_DAYS into compressed archive blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only archive this user id')
+
+    def handle(self, *args, **options):
+        before = ArchiveService.horizon()
+
+        # Only users who still have rows older than the horizon
+        has_old_rows = reduce(or_, [
+            Exists(model.objects.filter(user=OuterRef('pk'), **{f'{date_lookup}__lt': before}))
+            for model, _, date_lookup in ARCHIVE_SOURCES.values()
+        ])
+        users = User.objects.filter(has_old_rows).order_by('id')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+
+        totals = dict.fromkeys(ARCHIVE_SOURCES, 0)
+        for user in users.iterator():
+            counts = ArchiveService.archive_user(user, before)
+            for kind, count in counts.items():
+                totals[kind] += count
+            self.stdout.write(f'User {user.id}: ' + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived rows dated before {before}: ' + ', '.join(f'{count} {kind}' for kind, count in totals.items())
+        ))
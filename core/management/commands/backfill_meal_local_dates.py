@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.localdates import backfill
+from core.models import Meal
+
+
+class Command(BaseCommand):
+    help = "Fills Meal.local_date, the day of each meal in its user's time zone, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Meals updated per transaction')
+        parser.add_argument('--all', action='store_true', help='Recompute every meal, not only those without a local date')
+        parser.add_argument('--user', type=int, help='Only meals of this user id')
+
+    def handle(self, *args, **options):
+        meals = Meal.objects.all()
+        if not options['all']:
+            meals = meals.filter(local_date__isnull=True)
+        if options['user']:
+            meals = meals.filter(user_id=options['user'])
+
+        updated = backfill(meals, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Set the local date of {updated} meals'))
@@ -0,0 +1,78 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from core.models import HealthLog, Meal, Sleep
+from core.renderers import FastJSONParser, FastJSONRenderer
+from core.serializers import HealthLogSerializer, MealSerializer, SleepSerializer, values_serializer
+from core.services import HealthAnalyticsService
+
+from .benchmark_serializers import create_diary
+
+
+def best_time(run, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Compares DRF\'s JSON renderer and parser with the orjson-backed ones on export and trends payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=5000, help='Days of health, sleep and meal logs in the payloads')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case; the fastest is reported')
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stdout.write('orjson is not installed: both renderers use the json module')
+        days, repeat = options['days'], options['repeat']
+        start_date = timezone.now().date() - timedelta(days=days - 1)
+
+        # Everything written here is rolled back
+        with transaction.atomic():
+            user = create_diary('json-benchmark', start_date, days, random.Random(0))
+            payloads = {
+                'export': {
+                    'meals': values_serializer(MealSerializer).data(Meal.objects.filter(user=user)),
+                    'health_logs': values_serializer(HealthLogSerializer).data(HealthLog.objects.filter(user=user)),
+                    'sleep_logs': values_serializer(SleepSerializer).data(Sleep.objects.filter(user=user)),
+                },
+                'trends': HealthAnalyticsService.get_health_trends(user, days),
+                # Decimal, date and datetime objects rather than their serializer strings
+                'model values': {
+                    'health_logs': list(HealthLog.objects.filter(user=user).values()),
+                    'meals': list(Meal.objects.filter(user=user).values()),
+                },
+            }
+            transaction.set_rollback(True)
+
+        for name, data in payloads.items():
+            body = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != body:
+                self.stderr.write(f'{name}: the renderers disagree')
+            size = len(body) / 1024 / 1024
+            render = best_time(lambda: JSONRenderer().render(data), repeat)
+            fast_render = best_time(lambda: FastJSONRenderer().render(data), repeat)
+            self.stdout.write(
+                f'{name} ({size:.1f} MB): render {size / render:,.0f} MB/s, '
+                f'fast render {size / fast_render:,.0f} MB/s ({render / fast_render:.1f}x)'
+            )
+            parse = best_time(lambda: JSONParser().parse(io.BytesIO(body)), repeat)
+            fast_parse = best_time(lambda: FastJSONParser().parse(io.BytesIO(body)), repeat)
+            self.stdout.write(
+                f'{name} ({size:.1f} MB): parse {size / parse:,.0f} MB/s, '
+                f'fast parse {size / fast_parse:,.0f} MB/s ({parse / fast_parse:.1f}x)'
+            )
@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import datetime, time as day_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Food, HealthLog, Meal, MealFood, Sleep, User
+from core.serializers import HealthLogSerializer, MealSerializer, SleepSerializer, values_serializer
+
+
+def rows_per_second(render, repeat):
+    """Rows rendered per second by the fastest of repeat runs, and the row count"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = render()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows) / best, len(rows)
+
+
+def create_diary(username, start_date, days, rng):
+    """A user with a health log, a sleep log and a meal of 3 foods on each of days days"""
+    user = User.objects.create(username=username, email=f'{username}@example.com')
+    foods = Food.objects.bulk_create([Food(name=f'Benchmark food {i}', user=user) for i in range(50)])
+    HealthLog.objects.bulk_create([
+        HealthLog(
+            user=user,
+            date=start_date + timedelta(days=i),
+            physical_feeling=rng.randint(1, 5),
+            mental_feeling=rng.randint(1, 5),
+            stool_count=rng.randint(0, 4),
+            stool_quality=rng.choice(HealthLog.StoolQuality.values),
+            weight=Decimal(rng.randint(6000, 9000)) / 100,
+            symptoms='bloating' if i % 5 == 0 else '',
+            notes='Felt fine after lunch' if i % 3 == 0 else '',
+        )
+        for i in range(days)
+    ], batch_size=1000)
+    Sleep.objects.bulk_create([
+        Sleep(
+            user=user,
+            date=start_date + timedelta(days=i),
+            duration=Decimal(rng.randint(500, 900)) / 100,
+            quality=rng.randint(1, 5),
+            wake_up_ease=rng.randint(1, 5),
+            energy_level=rng.randint(1, 5),
+        )
+        for i in range(days)
+    ], batch_size=1000)
+    meals = []
+    for i in range(days):
+        day = start_date + timedelta(days=i)
+        moment = datetime.combine(day, day_time(12), tzinfo=dt_timezone.utc)
+        meals.append(Meal(user=user, date_time=moment, local_date=day, meal_type='lunch'))
+    Meal.objects.bulk_create(meals, batch_size=1000)
+    MealFood.objects.bulk_create([
+        MealFood(meal=meal, food=rng.choice(foods), amount=rng.randint(10, 500))
+        for meal in meals
+        for _ in range(3)
+    ], batch_size=1000)
+    return user
+
+
+class Command(BaseCommand):
+    help = 'Compares rows per second of the model serializers and the values() serializers on a synthetic user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=5000, help='Days of health, sleep and meal logs to render')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per serializer; the fastest is reported')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        start_date = timezone.now().date() - timedelta(days=days - 1)
+        rng = random.Random(0)
+
+        # Everything written here is rolled back
+        with transaction.atomic():
+            user = create_diary('serializer-benchmark', start_date, days, rng)
+            cases = {
+                'health logs': (HealthLogSerializer, HealthLog.objects.filter(user=user)),
+                'sleep logs': (SleepSerializer, Sleep.objects.filter(user=user)),
+                'meals with 3 foods': (MealSerializer, Meal.objects.filter(user=user)),
+            }
+            for name, (serializer_class, queryset) in cases.items():
+                instances = queryset.prefetch_related('mealfood_set__food') if queryset.model is Meal else queryset
+                fast = values_serializer(serializer_class)
+                model_rate, count = rows_per_second(
+                    lambda: serializer_class(instances.all(), many=True).data, options['repeat']
+                )
+                values_rate, _ = rows_per_second(lambda: fast.data(queryset.all()), options['repeat'])
+                self.stdout.write(
+                    f'{name}: {count} rows, model serializer {model_rate:,.0f} rows/s, '
+                    f'values serializer {values_rate:,.0f} rows/s ({values_rate / model_rate:.1f}x)'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,74 @@
+import gc
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import HealthLog, User
+from core.services import load_series
+
+TREND_FIELDS = ('date', 'physical_feeling', 'mental_feeling', 'stool_quality', 'weight')
+
+
+def measure(load):
+    """Bytes still allocated by load's result, its peak allocation and its run time"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak, elapsed
+
+
+class Command(BaseCommand):
+    help = 'Compares the memory per row of model instances and compact analytics records on a synthetic user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=10000, help='Days of daily health logs of the synthetic user')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=days - 1)
+        rng = random.Random(0)
+
+        # Everything written here is rolled back
+        with transaction.atomic():
+            user = User.objects.create(username='series-benchmark', email='series-benchmark@example.com')
+            HealthLog.objects.bulk_create([
+                HealthLog(
+                    user=user,
+                    date=start_date + timedelta(days=i),
+                    physical_feeling=rng.randint(1, 5),
+                    mental_feeling=rng.randint(1, 5),
+                    stool_count=rng.randint(0, 4),
+                    stool_quality=rng.choice(HealthLog.StoolQuality.values),
+                    weight=Decimal(rng.randint(6000, 9000)) / 100,
+                    symptoms='bloating' if i % 5 == 0 else '',
+                    notes='Felt fine after lunch' if i % 3 == 0 else '',
+                )
+                for i in range(days)
+            ], batch_size=1000)
+
+            profiles = {
+                'model instances': lambda: sorted(
+                    HealthLog.objects.filter(user=user, date__gte=start_date, date__lte=end_date),
+                    key=lambda log: log.date
+                ),
+                'compact records': lambda: load_series(user, 'health_logs', TREND_FIELDS, start_date, end_date),
+            }
+            for name, load in profiles.items():
+                rows, retained, peak, elapsed = measure(load)
+                self.stdout.write(
+                    f'{name}: {len(rows)} rows, {retained / len(rows):.0f} bytes/row retained, '
+                    f'{peak / len(rows):.0f} bytes/row peak, {elapsed * 1000:.0f} ms'
+                )
+                del rows
+            transaction.set_rollback(True)
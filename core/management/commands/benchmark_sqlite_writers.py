@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+FIRST_DAY = date(2000, 1, 1)
+
+
+def _connect(path, performance, timeout):
+    """Set up Django in a spawned process, pointed at the benchmark database"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_diary_project.settings')
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.db import connections
+
+    settings.SQLITE_PERFORMANCE_MODE = performance
+    settings.TASK_QUEUE_EAGER = False
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict.update(NAME=path, OPTIONS={'timeout': timeout})
+    return connection
+
+
+def _create_schema(path, performance, timeout, writers):
+    from django.core.management import call_command
+
+    _connect(path, performance, timeout)
+    call_command('migrate', verbosity=0)
+    call_command('createcachetable', verbosity=0)
+    from core.models import User
+
+    return [
+        User.objects.create(username=f'writer{worker}', email=f'writer{worker}@example.com').pk
+        for worker in range(writers)
+    ]
+
+
+def _writer(path, performance, timeout, user_id, writes):
+    """
+    Save health logs one request at a time. Each save runs the signal receivers,
+    whose TaskQueue.enqueue reads the pending task before writing it.
+    """
+    from django.db import OperationalError
+
+    _connect(path, performance, timeout)
+    from core.models import HealthLog
+
+    locked = 0
+    for i in range(writes):
+        try:
+            HealthLog.objects.create(
+                user_id=user_id, date=FIRST_DAY + timedelta(days=i),
+                physical_feeling=i % 5 + 1, mental_feeling=3, notes='x' * 200,
+            )
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+    return locked
+
+
+def _reader(path, performance, timeout, stop):
+    """Run analytics-style scans until told to stop"""
+    from django.db import OperationalError
+    from django.db.models import Avg, Count
+
+    _connect(path, performance, timeout)
+    from core.models import HealthLog
+
+    scans = 0
+    while not stop.is_set():
+        try:
+            list(HealthLog.objects.values('user_id', 'date').annotate(Avg('physical_feeling'), Count('id')))
+            scans += 1
+        except OperationalError:
+            pass
+    return scans
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent writer processes on SQLite with and without the performance pragmas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Number of writer processes')
+        parser.add_argument('--readers', type=int, default=2, help='Number of reader processes scanning the table')
+        parser.add_argument('--writes', type=int, default=300, help='Health logs saved per writer')
+        parser.add_argument('--timeout', type=float, default=5.0, help='Seconds a connection without busy_timeout waits for a lock (Django default: 5)')
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default (rollback journal)': False,
+            'performance (SQLITE_PRAGMAS)': True,
+        }
+        for name, performance in profiles.items():
+            elapsed, locked, scans = self.run_profile(performance, options)
+            total = options['writers'] * options['writes']
+            self.stdout.write(
+                f'{name}: {total - locked} writes in {elapsed:.2f}s '
+                f'({(total - locked) / elapsed:.0f}/s), {locked} "database is locked" errors, '
+                f'{scans} reader scans'
+            )
+
+    def run_profile(self, performance, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            connection = (path, performance, options['timeout'])
+
+            # Every process, this one's pool included, sets Django up against the benchmark file
+            context = multiprocessing.get_context('spawn')
+            stop = context.Manager().Event()
+            with context.Pool(options['writers'] + options['readers']) as pool:
+                user_ids = pool.apply(_create_schema, (*connection, options['writers']))
+                readers = [
+                    pool.apply_async(_reader, (*connection, stop))
+                    for _ in range(options['readers'])
+                ]
+                start = time.perf_counter()
+                writers = [
+                    pool.apply_async(_writer, (*connection, user_id, options['writes']))
+                    for user_id in user_ids
+                ]
+                locked = sum(result.get() for result in writers)
+                elapsed = time.perf_counter() - start
+                stop.set()
+                scans = sum(result.get() for result in readers)
+        return elapsed, locked, scans
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from core.columnar import COLUMNAR_TABLES, ColumnarSnapshotService
+from core.models import ArchiveBlob, User
+
+
+class Command(BaseCommand):
+    help = 'Builds or refreshes the columnar snapshots of every user with health or sleep logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only this user id')
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite existing snapshots instead of appending new days')
+
+    def handle(self, *args, **options):
+        has_logs = Exists(ArchiveBlob.objects.filter(user=OuterRef('pk')))
+        for table in COLUMNAR_TABLES.values():
+            has_logs |= Exists(table.model.objects.filter(user=OuterRef('pk')))
+        users = User.objects.filter(has_logs).only('id', 'archived_through').order_by('id')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+
+        built = refreshed = 0
+        for user in users.iterator():
+            for table_name in COLUMNAR_TABLES:
+                if options['rebuild'] or ColumnarSnapshotService.open(user.pk, table_name) is None:
+                    # Missing or stale: a stale snapshot's pending task may never come
+                    ColumnarSnapshotService.build(user, table_name)
+                    built += 1
+                else:
+                    ColumnarSnapshotService.refresh(user.pk, table_name)
+                    refreshed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built} and refreshed {refreshed} snapshots in {ColumnarSnapshotService.root()}'
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+
+from core.importer import IMPORT_KINDS, READERS, DiaryImporter
+
+
+class Command(BaseCommand):
+    help = "Imports a CSV or NDJSON file of health logs, sleep logs or meals into one user's diary"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or NDJSON file')
+        parser.add_argument('--user', type=int, required=True, help='Id of the user the records belong to')
+        parser.add_argument('--kind', choices=list(IMPORT_KINDS), required=True)
+        parser.add_argument('--format', choices=list(READERS), help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction (default IMPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(pk=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+        input_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+
+        started = time.perf_counter()
+        # Read as bytes, so that a line that is not UTF-8 is reported rather than ending the import
+        with open(options['path'], 'rb') as lines:
+            summary = DiaryImporter(user, options['kind'], options['chunk_size']).run(READERS[input_format](lines))
+        elapsed = time.perf_counter() - started
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['imported']} {options['kind']} in {elapsed:.2f}s "
+            f"({summary['imported'] / elapsed:,.0f} rows/s), {summary['foods_created']} new foods, "
+            f"{summary['error_count']} invalid lines"
+        ))
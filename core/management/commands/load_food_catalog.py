@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.catalog import CatalogLoader
+from core.importer import READERS
+
+
+class Command(BaseCommand):
+    help = "Streams a nutrition dataset (CSV or NDJSON with name, calories, protein, carbs, fats) into the public food catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(READERS), help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, help='Foods upserted per statement batch (default CATALOG_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+
+        started = time.perf_counter()
+        # Read as bytes, so that a line that is not UTF-8 is reported rather than ending the load
+        with open(options['path'], 'rb') as lines:
+            summary = CatalogLoader(options['chunk_size']).run(READERS[input_format](lines))
+        elapsed = time.perf_counter() - started
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        loaded = summary['created'] + summary['updated'] + summary['unchanged'] + summary['duplicates']
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {loaded} foods in {elapsed:.2f}s ({loaded / elapsed:,.0f} rows/s): "
+            f"{summary['created']} new, {summary['updated']} updated, {summary['unchanged']} unchanged, "
+            f"{summary['duplicates']} duplicate names, {summary['error_count']} invalid lines, "
+            f"{summary['adopted']} existing public foods keyed"
+        ))
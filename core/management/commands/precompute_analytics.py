@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.precompute import PrecomputeService
+
+
+class Command(BaseCommand):
+    help = 'Precomputes daily summaries and analytics snapshots for active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Run date in YYYY-MM-DD format (default: today); summaries cover the day before')
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker threads (analytics are CPU-bound, so more rarely help)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Users per checkpointed batch')
+        parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and process every user again')
+        parser.add_argument('--at', type=str, help='Stay running and start a run every day at this time (HH:MM, server time)')
+
+    def handle(self, *args, **options):
+        try:
+            run_date = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else None
+            run_time = datetime.strptime(options['at'], '%H:%M').time() if options['at'] else None
+        except ValueError:
+            raise CommandError('Use YYYY-MM-DD for --date and HH:MM for --at')
+
+        if run_time is None:
+            self.run_once(run_date, options)
+            return
+
+        # Minimal in-process scheduler: no broker, just sleep until the next slot
+        while True:
+            now = timezone.localtime()
+            next_run = now.replace(hour=run_time.hour, minute=run_time.minute, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            self.stdout.write(f'Next run at {next_run:%Y-%m-%d %H:%M}')
+            time.sleep((next_run - now).total_seconds())
+            self.run_once(None, options)
+
+    def run_once(self, run_date, options):
+        run = PrecomputeService.run(
+            day=run_date,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            restart=options['restart'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Precompute run for {run.run_date} {run.status}: {run.users_processed} users'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.search import SearchService
+
+
+class Command(BaseCommand):
+    help = "Writes the full-text search documents of every diary entry with symptoms or notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        documents = SearchService.rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(f'Search index holds {documents} documents'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.tasks import TaskQueue
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks (rolling statistics, daily summaries)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due instead of polling')
+        parser.add_argument('--batch-size', type=int, default=50, help='Tasks claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when no task is due')
+
+    def handle(self, *args, **options):
+        total_succeeded = total_failed = 0
+        while True:
+            succeeded, failed = TaskQueue.run_pending(options['batch_size'])
+            total_succeeded += succeeded
+            total_failed += failed
+            if succeeded or failed:
+                self.stdout.write(f'Ran {succeeded + failed} tasks ({failed} failed)')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {total_succeeded} tasks succeeded, {total_failed} failed'
+        ))
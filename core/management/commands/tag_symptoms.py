@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.models import HealthLog
+from core.symptoms import tag_queryset
+
+
+class Command(BaseCommand):
+    help = "Extracts normalised symptom tags from the symptoms text of health logs, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Health logs tagged per transaction')
+        parser.add_argument('--user', type=int, help='Only health logs of this user id')
+
+    def handle(self, *args, **options):
+        logs = HealthLog.objects.all()
+        if options['user']:
+            logs = logs.filter(user_id=options['user'])
+
+        tagged, tags = tag_queryset(logs, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Tagged {tagged} health logs with {tags} symptom tags'))
@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import secrets
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers, set_response_etag
+from django.utils.text import StreamingBuffer
+
+from . import db_router
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """Content codings of an Accept-Encoding header mapped to their q-values"""
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def _random_filename(max_random_bytes):
+    # As Django's GZipMiddleware: a random-length name makes the body length useless to BREACH
+    return b'a' * secrets.randbelow(max_random_bytes)
+
+
+class CompressionStats:
+    """Thread-safe counters describing how much compression saves"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.responses_compressed = 0
+            self.responses_skipped = 0
+            self.cache_hits = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def record(self, bytes_in, bytes_out, cache_hit=False):
+        with self._lock:
+            self.responses_compressed += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            if cache_hit:
+                self.cache_hits += 1
+
+    def record_skip(self):
+        with self._lock:
+            self.responses_skipped += 1
+
+    def snapshot(self):
+        with self._lock:
+            saved = self.bytes_in - self.bytes_out
+            return {
+                'responses_compressed': self.responses_compressed,
+                'responses_skipped': self.responses_skipped,
+                'cache_hits': self.cache_hits,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': saved,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            }
+
+
+compression_stats = CompressionStats()
+
+
+def _gzip_compress(data, level):
+    # mtime=0 keeps the output deterministic so identical bodies compress identically
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli_compress(data, level):
+    return brotli.compress(data, quality=min(level, 11))
+
+
+def _pad_gzip(compressed, max_random_bytes):
+    """Add a random-length file name to the header of a gzip body"""
+    header = bytearray(compressed[:10])
+    header[3] = gzip.FNAME
+    return bytes(header) + _random_filename(max_random_bytes) + b'\x00' + compressed[10:]
+
+
+def _gzip_stream(chunks, level, max_random_bytes=0):
+    buffer = StreamingBuffer()
+    filename = _random_filename(max_random_bytes) if max_random_bytes else None
+    with gzip.GzipFile(filename=filename, mode='wb', compresslevel=level, fileobj=buffer, mtime=0) as compressor:
+        for chunk in chunks:
+            compressor.write(chunk)
+            data = buffer.read()
+            if data:
+                yield data
+    yield buffer.read()
+
+
+def _brotli_stream(chunks, level):
+    compressor = brotli.Compressor(quality=min(level, 11))
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses with Brotli (when installed) or gzip.
+
+    Responses smaller than COMPRESSION_MIN_SIZE are sent as-is, streaming
+    responses are compressed chunk by chunk, and compressed bodies are cached
+    by a hash of the body so identical payloads (e.g. repeated exports) are
+    only compressed once.
+
+    Like Django's GZipMiddleware, gzip bodies get up to
+    COMPRESSION_MAX_RANDOM_BYTES of random header padding against BREACH.
+    Brotli has no such padding, so requests carrying credentials get gzip.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.level = getattr(settings, 'COMPRESSION_LEVEL', 6)
+        self.cache_timeout = getattr(settings, 'COMPRESSION_CACHE_TIMEOUT', 300)
+        self.cache_max_size = getattr(settings, 'COMPRESSION_CACHE_MAX_SIZE', 5 * 1024 * 1024)
+        self.max_random_bytes = getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def select_encoding(self, request):
+        """Pick the best encoding the client accepts, or None"""
+        codings = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        wildcard = codings.get('*', 0.0)
+        gzip_quality = codings.get('gzip', wildcard)
+        brotli_quality = codings.get('br', wildcard)
+        if brotli is None or self.carries_credentials(request):
+            brotli_quality = 0.0
+        if brotli_quality > 0 and brotli_quality >= gzip_quality:
+            return 'br'
+        if gzip_quality > 0:
+            return 'gzip'
+        return None
+
+    def carries_credentials(self, request):
+        """Whether the response may hold secrets that BREACH could recover"""
+        return 'HTTP_AUTHORIZATION' in request.META or bool(request.COOKIES)
+
+    def process_response(self, request, response):
+        # Vary on Accept-Encoding whether or not we end up compressing
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if getattr(response, 'is_async', False):
+                return response
+            return self.compress_streaming(response, encoding)
+        return self.compress_content(response, encoding)
+
+    def compress_content(self, response, encoding):
+        content = response.content
+        if len(content) < self.min_size:
+            compression_stats.record_skip()
+            return response
+
+        if not response.has_header('ETag'):
+            set_response_etag(response)
+        etag = response['ETag']
+        # ETags come from views and need not identify the body, so the cache key hashes it
+        cache_key = f'compressed:{encoding}:{self.level}:{hashlib.sha256(content).hexdigest()}'
+
+        compressed = cache.get(cache_key)
+        cache_hit = compressed is not None
+        if not cache_hit:
+            compress = _brotli_compress if encoding == 'br' else _gzip_compress
+            compressed = compress(content, self.level)
+            if len(compressed) >= len(content):
+                compression_stats.record_skip()
+                return response
+            if len(compressed) <= self.cache_max_size:
+                cache.set(cache_key, compressed, self.cache_timeout)
+
+        if encoding == 'gzip' and self.max_random_bytes:
+            compressed = _pad_gzip(compressed, self.max_random_bytes)
+        compression_stats.record(len(content), len(compressed), cache_hit=cache_hit)
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The body changed, so a strong ETag no longer holds
+        if not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def compress_streaming(self, response, encoding):
+        if encoding == 'br':
+            stream = _brotli_stream
+        else:
+            stream = partial(_gzip_stream, max_random_bytes=self.max_random_bytes)
+        response.streaming_content = self._counted(response.streaming_content, stream)
+        response['Content-Encoding'] = encoding
+        # The final size is unknown until the stream is exhausted
+        del response['Content-Length']
+        if response.has_header('ETag'):
+            del response['ETag']
+        return response
+
+    def _counted(self, chunks, stream):
+        counts = {'in': 0, 'out': 0}
+
+        def source():
+            for chunk in chunks:
+                counts['in'] += len(chunk)
+                yield chunk
+
+        for data in stream(source(), self.level):
+            counts['out'] += len(data)
+            yield data
+        compression_stats.record(counts['in'], counts['out'])
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Reset read routing for every request, and pin users who wrote to the primary.
+
+    Placed after authentication; DRF copies the authenticated user onto the
+    underlying request, so the writer is known once the view has run.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = db_router.begin_request()
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            db_router.pin_to_primary(user.pk)
+        return response
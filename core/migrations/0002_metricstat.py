@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mealfood',
+            name='meal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.meal'),
+        ),
+        migrations.CreateModel(
+            name='MetricStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=32)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('ewma', models.FloatField(blank=True, null=True)),
+                ('ewm_variance', models.FloatField(default=0)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('last_value', models.FloatField(blank=True, null=True)),
+                ('last_zscore', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'metric')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_metricstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('clinician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_grants', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clinician_grants', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('clinician', 'patient')},
+            },
+        ),
+    ]
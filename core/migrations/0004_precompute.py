@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_patientgrant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField(unique=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('last_user_id', models.BigIntegerField(default=0, help_text='Checkpoint: every user up to this id is done')),
+                ('users_processed', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-run_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('physical_feeling', models.IntegerField(blank=True, null=True)),
+                ('mental_feeling', models.IntegerField(blank=True, null=True)),
+                ('stool_count', models.IntegerField(blank=True, null=True)),
+                ('weight', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('sleep_duration', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+                ('sleep_quality', models.IntegerField(blank=True, null=True)),
+                ('energy_level', models.IntegerField(blank=True, null=True)),
+                ('meal_count', models.IntegerField(default=0)),
+                ('food_count', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('health_trends', 'Health Trends'), ('food_correlations', 'Food Correlations'), ('sleep_analysis', 'Sleep Analysis'), ('symptom_triggers', 'Symptom Triggers')], max_length=32)),
+                ('days', models.PositiveIntegerField()),
+                ('computed_for', models.DateField(help_text='Day whose analytics windows this snapshot covers')),
+                ('payload', models.JSONField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'kind', 'days')},
+            },
+        ),
+    ]
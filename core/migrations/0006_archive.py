@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='archived_through',
+            field=models.DateField(blank=True, help_text='Logs dated on or before this day have been moved to ArchiveBlob', null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchiveBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('meals', 'Meals'), ('health_logs', 'Health logs'), ('sleep', 'Sleep')], max_length=20)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_blobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'kind', 'year'],
+                'unique_together': {('user', 'kind', 'year')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:39
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='local_date',
+            field=models.DateField(blank=True, editable=False, help_text="Day of date_time in the user's time zone, kept by save()", null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='UTC', help_text='IANA time zone that assigns meals to calendar days', max_length=64, validators=[core.models.validate_timezone]),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['user', 'local_date'], name='meal_user_local_date'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_meal_local_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='catalog_key',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the normalised name for foods loaded into the public catalog', max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:03
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_food_catalog_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='barcode',
+            field=models.CharField(blank=True, help_text='GTIN-14, zero-padded from the scanned EAN/UPC', max_length=14, null=True, unique=True, validators=[core.models.validate_barcode]),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Identifier in an external nutrition database, e.g. fdc:171287', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# SQLite: an FTS5 index over core_searchdocument, kept in step by triggers. The
+# user id is an indexed column, so a search intersects the user's posting list
+# with the terms' instead of filtering every match. Rebuilding the table in a
+# later migration drops the triggers; recreate them there.
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        user_id, body, content='core_searchdocument', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER core_searchdocument_fts_insert AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, user_id, body) VALUES (new.id, new.user_id, new.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_fts_delete AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, user_id, body)
+        VALUES ('delete', old.id, old.user_id, old.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_fts_update AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, user_id, body)
+        VALUES ('delete', old.id, old.user_id, old.body);
+        INSERT INTO core_searchdocument_fts(rowid, user_id, body) VALUES (new.id, new.user_id, new.body);
+    END""",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_update',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_delete',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_insert',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+# PostgreSQL: a GIN index over the tsvector that core.search queries with
+POSTGRES_INDEX = [
+    "CREATE INDEX core_searchdocument_body_tsv ON core_searchdocument USING GIN (to_tsvector('english', body))",
+]
+POSTGRES_DROP = ['DROP INDEX IF EXISTS core_searchdocument_body_tsv']
+
+
+def run_for_vendor(sqlite, postgresql):
+    def run(apps, schema_editor):
+        for statement in {'sqlite': sqlite, 'postgresql': postgresql}.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_food_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('health_log', 'Health log'), ('sleep', 'Sleep'), ('meal', 'Meal'), ('meal_food', 'Meal food')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('date', models.DateField(null=True)),
+                ('body', models.TextField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            run_for_vendor(SQLITE_INDEX, POSTGRES_INDEX),
+            run_for_vendor(SQLITE_DROP, POSTGRES_DROP),
+        ),
+    ]
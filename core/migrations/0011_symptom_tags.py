@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymptomTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=40, unique=True)),
+                ('name', models.CharField(max_length=60)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='healthlog',
+            name='symptom_tags',
+            field=models.ManyToManyField(blank=True, help_text='Tags extracted from symptoms when the log is saved', related_name='health_logs', to='core.symptomtag'),
+        ),
+    ]
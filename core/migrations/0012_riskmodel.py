@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_symptom_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weights', models.BinaryField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('bad_days', models.PositiveIntegerField(default=0)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='risk_model', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:32
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='food',
+            name='barcode',
+            field=models.CharField(blank=True, help_text='GTIN-14, zero-padded from the scanned EAN/UPC', max_length=14, null=True, validators=[core.models.validate_barcode]),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Identifier in an external nutrition database, e.g. fdc:171287', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='food',
+            constraint=models.UniqueConstraint(fields=('user', 'barcode'), name='food_user_barcode'),
+        ),
+        migrations.AddConstraint(
+            model_name='food',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_public', True)), fields=('barcode',), name='food_public_barcode'),
+        ),
+        migrations.AddConstraint(
+            model_name='food',
+            constraint=models.UniqueConstraint(fields=('user', 'external_id'), name='food_user_external_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='food',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_public', True)), fields=('external_id',), name='food_public_external_id'),
+        ),
+    ]
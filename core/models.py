@@ -1,8 +1,47 @@
+import zoneinfo
+
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils.dateparse import parse_date
 from django.utils.translation import gettext_lazy as _
 
+def validate_timezone(value):
+    try:
+        zoneinfo.ZoneInfo(value)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(_('%(value)s is not a known time zone'), params={'value': value})
+
+def normalize_barcode(value):
+    """GTIN-14 form of an EAN-8, UPC-A, EAN-13 or GTIN-14 barcode, so every scan of a product matches"""
+    digits = ''.join(value.split()).replace('-', '')
+    if not digits.isdigit() or not 8 <= len(digits) <= 14:
+        raise ValidationError(_('%(value)s is not a barcode of 8 to 14 digits'), params={'value': value})
+    return digits.zfill(14)
+
+def validate_barcode(value):
+    if normalize_barcode(value) != value:
+        raise ValidationError(_('Barcodes are stored as 14 digits'))
+
+def local_date(moment, tz_name):
+    """Calendar day of an aware datetime in an IANA time zone"""
+    return moment.astimezone(zoneinfo.ZoneInfo(tz_name)).date()
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # update() sends no post_save, so the authentication cache is invalidated here
+        from .authentication import invalidate_cached_user
+
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        for user_id in user_ids:
+            invalidate_cached_user(user_id)
+        return rows
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
 class User(AbstractUser):
     """Extended user model with additional fields"""
     email = models.EmailField(unique=True)
@@ -16,6 +55,29 @@ class User(AbstractUser):
         help_text="Height in centimeters"
     )
     is_medical_professional = models.BooleanField(default=False)
+    archived_through = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Logs dated on or before this day have been moved to ArchiveBlob"
+    )
+    timezone = models.CharField(
+        max_length=64,
+        default='UTC',
+        validators=[validate_timezone],
+        help_text="IANA time zone that assigns meals to calendar days"
+    )
+
+    objects = UserManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # Lets a save tell whether the time zone changed
+        user._loaded_timezone = user.__dict__.get('timezone')
+        return user
+
+    def timezone_changed(self):
+        return getattr(self, '_loaded_timezone', self.timezone) != self.timezone
 
     def __str__(self):
         return self.username
@@ -31,6 +93,27 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+class DatedLogMixin:
+    """Remembers the date a log was loaded with, so a save can tell which days it left"""
+    date_field = 'date'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        log = super().from_db(db, field_names, values)
+        log._loaded_date = log.__dict__.get(cls.date_field)
+        return log
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # After the post_save receivers, which compare against the loaded date
+        self._loaded_date = getattr(self, self.date_field)
+
+    def changed_days(self):
+        """The days a save or delete of this log touches, oldest first"""
+        day = getattr(self, self.date_field)
+        day = parse_date(day) if isinstance(day, str) else day
+        return sorted({day, getattr(self, '_loaded_date', None)} - {None})
+
 class Food(models.Model):
     """Food items for meal tracking"""
     name = models.CharField(max_length=100)
@@ -64,11 +147,46 @@ class Food(models.Model):
         related_name='custom_foods'
     )
     is_public = models.BooleanField(default=True)
+    catalog_key = models.CharField(
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Hash of the normalised name for foods loaded into the public catalog"
+    )
+    barcode = models.CharField(
+        max_length=14,
+        null=True,
+        blank=True,
+        validators=[validate_barcode],
+        help_text="GTIN-14, zero-padded from the scanned EAN/UPC"
+    )
+    external_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="Identifier in an external nutrition database, e.g. fdc:171287"
+    )
+
+    class Meta:
+        # Codes are unique among each user's foods and among public foods, so one user's
+        # private foods never block another user's codes, and a scan has one public match
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'barcode'], name='food_user_barcode'),
+            models.UniqueConstraint(
+                fields=['barcode'], condition=models.Q(is_public=True), name='food_public_barcode'
+            ),
+            models.UniqueConstraint(fields=['user', 'external_id'], name='food_user_external_id'),
+            models.UniqueConstraint(
+                fields=['external_id'], condition=models.Q(is_public=True), name='food_public_external_id'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
-class Meal(models.Model):
+class Meal(DatedLogMixin, models.Model):
     """Meal records for user food intake"""
     class MealType(models.TextChoices):
         BREAKFAST = 'breakfast', _('Breakfast')
@@ -83,9 +201,27 @@ class Meal(models.Model):
         choices=MealType.choices,
     )
     notes = models.TextField(blank=True)
+    local_date = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Day of date_time in the user's time zone, kept by save()"
+    )
+    date_field = 'local_date'
 
     class Meta:
         ordering = ['-date_time']
+        indexes = [
+            # Every day-based meal query is a seek on this index
+            models.Index(fields=['user', 'local_date'], name='meal_user_local_date'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.local_date = local_date(self.date_time, self.user.timezone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'date_time' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'local_date'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username}'s {self.get_meal_type_display()} on {self.date_time.strftime('%Y-%m-%d %H:%M')}"
@@ -105,7 +241,15 @@ class MealFood(models.Model):
     def __str__(self):
         return f"{self.amount}g of {self.food.name} in {self.meal}"
 
-class HealthLog(models.Model):
+class SymptomTag(models.Model):
+    """Normalised symptom from the vocabulary in core.symptoms"""
+    slug = models.SlugField(max_length=40, unique=True)
+    name = models.CharField(max_length=60)
+
+    def __str__(self):
+        return self.name
+
+class HealthLog(DatedLogMixin, models.Model):
     """Daily health log for tracking digestive health"""
     class StoolQuality(models.TextChoices):
         HARD = 'hard', _('Hard and Dry')
@@ -139,6 +283,12 @@ class HealthLog(models.Model):
         help_text="Weight in kilograms"
     )
     symptoms = models.TextField(blank=True)
+    symptom_tags = models.ManyToManyField(
+        SymptomTag,
+        blank=True,
+        related_name='health_logs',
+        help_text="Tags extracted from symptoms when the log is saved"
+    )
     notes = models.TextField(blank=True)
 
     class Meta:
@@ -148,7 +298,7 @@ class HealthLog(models.Model):
     def __str__(self):
         return f"{self.user.username}'s health log on {self.date}"
 
-class Sleep(models.Model):
+class Sleep(DatedLogMixin, models.Model):
     """Sleep tracking for users"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sleep_logs')
     date = models.DateField()
@@ -177,3 +327,186 @@ class Sleep(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s sleep log on {self.date}"
+
+class MetricStat(models.Model):
+    """Incrementally maintained rolling statistics for one metric of one user"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='metric_stats')
+    metric = models.CharField(max_length=32)
+    count = models.PositiveIntegerField(default=0)
+    ewma = models.FloatField(null=True, blank=True)
+    ewm_variance = models.FloatField(default=0)
+    last_date = models.DateField(null=True, blank=True)
+    last_value = models.FloatField(null=True, blank=True)
+    last_zscore = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'metric']
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.metric} statistics"
+
+class RiskModel(models.Model):
+    """A user's online logistic regression of bad days on the previous day's food, sleep and meals"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='risk_model')
+    # Little-endian float32 weights, see core/risk.py for the feature layout
+    weights = models.BinaryField()
+    samples = models.PositiveIntegerField(default=0)
+    bad_days = models.PositiveIntegerField(default=0)
+    last_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s risk model"
+
+class PatientGrant(models.Model):
+    """Access granted by a patient to a medical professional"""
+    clinician = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_grants')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='clinician_grants')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        # The unique index on (clinician, patient) backs every scoped clinician query
+        unique_together = ['clinician', 'patient']
+
+    def __str__(self):
+        return f"{self.clinician.username} can view {self.patient.username}"
+
+class DailySummary(models.Model):
+    """Precomputed per-day rollup of a user's health, sleep and meal logs"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField()
+    physical_feeling = models.IntegerField(null=True, blank=True)
+    mental_feeling = models.IntegerField(null=True, blank=True)
+    stool_count = models.IntegerField(null=True, blank=True)
+    weight = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    sleep_duration = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    sleep_quality = models.IntegerField(null=True, blank=True)
+    energy_level = models.IntegerField(null=True, blank=True)
+    meal_count = models.IntegerField(default=0)
+    food_count = models.IntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['user', 'date']
+
+    def __str__(self):
+        return f"{self.user.username}'s summary for {self.date}"
+
+class AnalyticsSnapshot(models.Model):
+    """Precomputed analytics result served instead of computing on request"""
+    class Kind(models.TextChoices):
+        HEALTH_TRENDS = 'health_trends', _('Health Trends')
+        FOOD_CORRELATIONS = 'food_correlations', _('Food Correlations')
+        SLEEP_ANALYSIS = 'sleep_analysis', _('Sleep Analysis')
+        SYMPTOM_TRIGGERS = 'symptom_triggers', _('Symptom Triggers')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analytics_snapshots')
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    days = models.PositiveIntegerField()
+    computed_for = models.DateField(help_text="Day whose analytics windows this snapshot covers")
+    payload = models.JSONField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'kind', 'days']
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.kind} ({self.days} days) for {self.computed_for}"
+
+class PrecomputeRun(models.Model):
+    """Progress of one nightly precomputation, used to resume after interruption"""
+    class Status(models.TextChoices):
+        RUNNING = 'running', _('Running')
+        COMPLETED = 'completed', _('Completed')
+        FAILED = 'failed', _('Failed')
+
+    run_date = models.DateField(unique=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.RUNNING)
+    last_user_id = models.BigIntegerField(default=0, help_text="Checkpoint: every user up to this id is done")
+    users_processed = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-run_date']
+
+    def __str__(self):
+        return f"Precompute run for {self.run_date} ({self.status})"
+
+class BackgroundTask(models.Model):
+    """A deferred side effect of a write, processed by the run_tasks worker"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        FAILED = 'failed', _('Failed')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='background_tasks')
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            # At most one pending task per user and kind; later writes merge into it
+            models.UniqueConstraint(
+                fields=['user', 'kind'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_task',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} ({self.status})"
+
+class ArchiveBlob(models.Model):
+    """One user's archived rows of one kind for one calendar year, zlib-compressed JSON"""
+    class Kind(models.TextChoices):
+        MEALS = 'meals', _('Meals')
+        HEALTH_LOGS = 'health_logs', _('Health logs')
+        SLEEP = 'sleep', _('Sleep')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archive_blobs')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    year = models.PositiveSmallIntegerField()
+    row_count = models.PositiveIntegerField(default=0)
+    first_date = models.DateField()
+    last_date = models.DateField()
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['user', 'kind', 'year']
+        unique_together = ['user', 'kind', 'year']
+
+    def __str__(self):
+        return f"{self.user_id}'s archived {self.kind} for {self.year}"
+
+class SearchDocument(models.Model):
+    """Searchable text of one diary entry; full-text indexed by migration 0010"""
+    class Kind(models.TextChoices):
+        HEALTH_LOG = 'health_log', _('Health log')
+        SLEEP = 'sleep', _('Sleep')
+        MEAL = 'meal', _('Meal')
+        MEAL_FOOD = 'meal_food', _('Meal food')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_documents')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    # Not a foreign key: documents outlive archival of their entry
+    object_id = models.BigIntegerField()
+    date = models.DateField(null=True)
+    body = models.TextField()
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.user_id}'s {self.kind} {self.object_id}"
@@ -0,0 +1,9 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsMedicalProfessional(BasePermission):
+    """Allow access only to users flagged as medical professionals"""
+    message = "You don't have permission to access this resource."
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.is_medical_professional)
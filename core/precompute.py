@@ -0,0 +1,213 @@
+"""
+Nightly precomputation of per-user analytics.
+
+A run summarises yesterday into DailySummary rows and stores the default
+analytics windows as AnalyticsSnapshot rows, which AnalyticsViewSet serves
+directly. Users are processed in id order, in batches computed by a thread
+pool, and the run records the last finished user id so an interrupted run
+resumes where it stopped. A user who writes while their analytics are
+being computed gets no snapshots from that run, since they would already
+be stale.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from .models import (
+    User, HealthLog, Meal, Sleep, DailySummary, AnalyticsSnapshot, PrecomputeRun
+)
+from .services import HealthAnalyticsService
+
+# Snapshot kind -> (service method, window in days served by default)
+PRECOMPUTED_ANALYTICS = {
+    AnalyticsSnapshot.Kind.HEALTH_TRENDS: (HealthAnalyticsService.get_health_trends, 30),
+    AnalyticsSnapshot.Kind.FOOD_CORRELATIONS: (HealthAnalyticsService.get_food_correlations, 30),
+    AnalyticsSnapshot.Kind.SLEEP_ANALYSIS: (HealthAnalyticsService.analyze_sleep, 30),
+    AnalyticsSnapshot.Kind.SYMPTOM_TRIGGERS: (HealthAnalyticsService.identify_symptom_triggers, 60),
+}
+
+
+WRITE_STAMP_KEY = 'precompute:written:{}'
+
+
+def write_stamp(user_id):
+    """When the user's logs last changed, as recorded by invalidate_user; None if unknown"""
+    return cache.get(WRITE_STAMP_KEY.format(user_id))
+
+
+def _chunks(items, size):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+class PrecomputeService:
+    """Build and read precomputed summaries and analytics snapshots"""
+
+    @staticmethod
+    def active_user_ids(day, after_id=0):
+        """Ids of active users who logged anything in the PRECOMPUTE_ACTIVE_DAYS before day"""
+        since = day - timedelta(days=getattr(settings, 'PRECOMPUTE_ACTIVE_DAYS', 30))
+        return list(
+            User.objects.filter(is_active=True, id__gt=after_id)
+            .filter(
+                Exists(HealthLog.objects.filter(user=OuterRef('pk'), date__gte=since))
+                | Exists(Sleep.objects.filter(user=OuterRef('pk'), date__gte=since))
+                | Exists(Meal.objects.filter(user=OuterRef('pk'), local_date__gte=since))
+            )
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def compute_day_summary(user_id, day):
+        """Field values of the DailySummary row for one user and day"""
+        health = HealthLog.objects.filter(user_id=user_id, date=day).first()
+        sleep = Sleep.objects.filter(user_id=user_id, date=day).first()
+        meals = Meal.objects.filter(user_id=user_id, local_date=day).aggregate(
+            meal_count=Count('id', distinct=True),
+            food_count=Count('mealfood'),
+        )
+        return {
+            'physical_feeling': health.physical_feeling if health else None,
+            'mental_feeling': health.mental_feeling if health else None,
+            'stool_count': health.stool_count if health else None,
+            'weight': health.weight if health else None,
+            'sleep_duration': sleep.duration if sleep else None,
+            'sleep_quality': sleep.quality if sleep else None,
+            'energy_level': sleep.energy_level if sleep else None,
+            'meal_count': meals['meal_count'],
+            'food_count': meals['food_count'],
+        }
+
+    @staticmethod
+    def summarise_day(user_id, day):
+        """Write the DailySummary row for one user and day"""
+        summary, _ = DailySummary.objects.update_or_create(
+            user_id=user_id, date=day, defaults=PrecomputeService.compute_day_summary(user_id, day)
+        )
+        return summary
+
+    @staticmethod
+    def compute_user(user_id, day):
+        """Read-only part of a run for one user: yesterday's summary and every snapshot payload"""
+        user = User.objects.get(pk=user_id)
+        return {
+            # Read first, so that any write during the computation changes it
+            'written': write_stamp(user_id),
+            'summary': PrecomputeService.compute_day_summary(user_id, day - timedelta(days=1)),
+            'snapshots': {
+                (kind, days): compute(user, days)
+                for kind, (compute, days) in PRECOMPUTED_ANALYTICS.items()
+            },
+        }
+
+    @staticmethod
+    def store_user(user_id, day, results):
+        """Write what compute_user produced, unless the user wrote since it started"""
+        if write_stamp(user_id) != results['written']:
+            # Snapshots are left to be computed live; the summary is cheap to redo
+            PrecomputeService.summarise_day(user_id, day - timedelta(days=1))
+            return
+        DailySummary.objects.update_or_create(
+            user_id=user_id, date=day - timedelta(days=1), defaults=results['summary']
+        )
+        # Analytics windows always end today, whichever run date is being processed
+        computed_for = timezone.now().date()
+        for (kind, days), payload in results['snapshots'].items():
+            AnalyticsSnapshot.objects.update_or_create(
+                user_id=user_id,
+                kind=kind,
+                days=days,
+                defaults={'computed_for': computed_for, 'payload': payload},
+            )
+
+    @staticmethod
+    def _compute_in_thread(user_id, day):
+        try:
+            return PrecomputeService.compute_user(user_id, day)
+        finally:
+            # Worker threads open their own connections; don't leak them
+            connections.close_all()
+
+    @staticmethod
+    def run(day=None, workers=1, batch_size=100, restart=False, log=None):
+        """
+        Precompute analytics for every active user, resuming an unfinished run for the same day.
+
+        Worker threads only read; each batch's results and its checkpoint are written
+        together by the calling thread, so a resumed run never redoes or skips a user.
+        Returns the PrecomputeRun. A completed run is left untouched unless restart is set.
+        """
+        day = day or timezone.now().date()
+        log = log or (lambda message: None)
+
+        run, created = PrecomputeRun.objects.get_or_create(run_date=day)
+        if restart:
+            run.last_user_id = 0
+            run.users_processed = 0
+        elif run.status == PrecomputeRun.Status.COMPLETED:
+            log(f'Run for {day} already completed')
+            return run
+        elif not created:
+            log(f'Resuming run for {day} after user {run.last_user_id}')
+
+        run.status = PrecomputeRun.Status.RUNNING
+        run.finished_at = None
+        run.save()
+
+        user_ids = PrecomputeService.active_user_ids(day, after_id=run.last_user_id)
+        log(f'{len(user_ids)} active users to process')
+
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for batch in _chunks(user_ids, batch_size):
+                if pool:
+                    results = list(pool.map(lambda user_id: PrecomputeService._compute_in_thread(user_id, day), batch))
+                else:
+                    results = [PrecomputeService.compute_user(user_id, day) for user_id in batch]
+
+                with transaction.atomic():
+                    for user_id, user_results in zip(batch, results):
+                        PrecomputeService.store_user(user_id, day, user_results)
+                    run.last_user_id = batch[-1]
+                    run.users_processed += len(batch)
+                    run.save(update_fields=['last_user_id', 'users_processed'])
+                log(f'Processed {run.users_processed} users (up to id {run.last_user_id})')
+        except Exception:
+            run.status = PrecomputeRun.Status.FAILED
+            run.save(update_fields=['status'])
+            raise
+        finally:
+            if pool:
+                pool.shutdown()
+
+        run.status = PrecomputeRun.Status.COMPLETED
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'finished_at'])
+        return run
+
+    @staticmethod
+    def get_snapshot(user, kind, days):
+        """Return today's precomputed payload, or None if it must be computed live"""
+        return AnalyticsSnapshot.objects.filter(
+            user=user, kind=kind, days=days, computed_for=timezone.now().date()
+        ).values_list('payload', flat=True).first()
+
+    @staticmethod
+    def invalidate_user(user_id):
+        """Stop serving snapshots that predate a write, including ones a run is computing"""
+        cache.set(WRITE_STAMP_KEY.format(user_id), time.time_ns(), None)
+        AnalyticsSnapshot.objects.filter(user_id=user_id).delete()
+
+    @staticmethod
+    def refresh_summaries(user_id, dates):
+        """Recompute the already existing DailySummary rows for the given days"""
+        existing = DailySummary.objects.filter(user_id=user_id, date__in=dates).values_list('date', flat=True)
+        for day in existing:
+            PrecomputeService.summarise_day(user_id, day)
@@ -0,0 +1,86 @@
+"""
+JSON renderer and parser backed by orjson when it is installed.
+
+orjson encodes dicts, lists, strings, numbers, dates and datetimes in C and
+hands everything else, such as Decimal or lazy translations, to DRF's own
+encoder, so responses are byte for byte what JSONRenderer produces. Without
+orjson, or for what it cannot do (indents other than 2, ASCII-only output,
+NaN and Infinity, which orjson writes as null), both classes defer to their
+DRF parents.
+"""
+import math
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib json module is always available
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+    ORJSON_INDENT = {None: ORJSON_OPTIONS, 2: ORJSON_OPTIONS | orjson.OPT_INDENT_2}
+
+# Escaped by JSONRenderer so that the output is also a JavaScript literal
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def has_non_finite(data):
+    """True if data holds a NaN or infinite float"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with orjson when it is installed"""
+    encode_default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (
+            orjson is None or self.ensure_ascii or not self.compact or not self.strict
+            or indent not in ORJSON_INDENT
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            ret = orjson.dumps(data, default=self.encode_default, option=ORJSON_INDENT[indent])
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the json module still encodes
+            return super().render(data, accepted_media_type, renderer_context)
+        # A non-finite float came out as null; the strict json module raises ValueError for it instead
+        if b'null' in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        for raw, escaped in LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser decoding with orjson when it is installed"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        # orjson rejects NaN and Infinity, so it is only as lenient as a strict parser
+        if orjson is None or not self.strict or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,214 @@
+"""
+Per-user prediction of bad days from the previous day's food, sleep and meals.
+
+Every user has a logistic regression with L2 regularisation in a RiskModel
+row. Each health log is one training example: it is a bad day when physical
+feeling is 2 or lower, and its features describe the day before it, which
+is when identify_symptom_triggers looks for triggers as well. New logs are
+folded in with one stochastic gradient step each instead of retraining, and
+a rebuild replays the same steps over the full history.
+
+The weights are a fixed-size float32 vector. The first slots hold the dense
+features below; foods are hashed into the remaining slots, so the model
+stays RISK_MODEL_DIMENSIONS floats however many foods a user eats.
+"""
+import math
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Food, HealthLog, Meal, MealFood, RiskModel, Sleep, User
+
+BAD_DAY_FEELING = 2
+
+# Dense feature slots; sleep values are centred so that a missing log counts as typical
+BIAS = 0
+SLEEP_QUALITY = 1
+SLEEP_DURATION = 2
+SLEEP_ENERGY = 3
+LATE_MEAL = 4
+MEAL_COUNT = 5
+DENSE_FEATURES = ('bias', 'sleep_quality', 'sleep_duration', 'sleep_energy', 'late_meal', 'meal_count')
+
+
+def dimensions():
+    return max(getattr(settings, 'RISK_MODEL_DIMENSIONS', 1024), len(DENSE_FEATURES) + 1)
+
+
+def food_slot(food_id, size):
+    """Weight slot of a food; crc32 rather than hash() so slots survive restarts"""
+    return len(DENSE_FEATURES) + zlib.crc32(b'food:%d' % food_id) % (size - len(DENSE_FEATURES))
+
+
+def pack(weights):
+    weights = array('f', weights)
+    if sys.byteorder == 'big':
+        weights.byteswap()
+    return weights.tobytes()
+
+
+def unpack(data):
+    weights = array('f')
+    weights.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        weights.byteswap()
+    return weights
+
+
+def predict(weights, features):
+    """Probability of a bad day for [(slot, value)] features"""
+    z = sum(weights[slot] * value for slot, value in features)
+    # Clamped so that exp cannot overflow
+    return 1 / (1 + math.exp(-max(min(z, 30.0), -30.0)))
+
+
+def learn(weights, features, bad_day, rate, l2):
+    """One gradient step of the regularised log loss; only the slots in features change"""
+    error = predict(weights, features) - bad_day
+    for slot, value in features:
+        weight = weights[slot]
+        penalty = l2 * weight if slot != BIAS else 0.0
+        weights[slot] = weight - rate * (error * value + penalty)
+
+
+def day_features(user_id, tz_name, start_date, end_date, size):
+    """Day -> [(slot, value)] for every day of the range, and day -> {slot: food id}"""
+    tz = ZoneInfo(tz_name)
+    late_hour = getattr(settings, 'RISK_LATE_MEAL_HOUR', 21)
+    features = defaultdict(lambda: [(BIAS, 1.0)])
+    foods = defaultdict(dict)
+
+    sleep = Sleep.objects.filter(user_id=user_id, date__gte=start_date, date__lte=end_date)
+    for day, quality, duration, energy in sleep.values_list('date', 'quality', 'duration', 'energy_level'):
+        features[day] += [
+            (SLEEP_QUALITY, (quality - 3) / 2),
+            (SLEEP_DURATION, (float(duration) - 7.5) / 2),
+            (SLEEP_ENERGY, (energy - 3) / 2),
+        ]
+
+    meal_count = defaultdict(int)
+    late = set()
+    meals = Meal.objects.filter(user_id=user_id, local_date__gte=start_date, local_date__lte=end_date)
+    for day, moment in meals.values_list('local_date', 'date_time'):
+        meal_count[day] += 1
+        if moment.astimezone(tz).hour >= late_hour:
+            late.add(day)
+    for day, count in meal_count.items():
+        features[day].append((MEAL_COUNT, count / 3))
+        if day in late:
+            features[day].append((LATE_MEAL, 1.0))
+
+    eaten = MealFood.objects.filter(
+        meal__user_id=user_id, meal__local_date__gte=start_date, meal__local_date__lte=end_date
+    )
+    for day, food_id in eaten.values_list('meal__local_date', 'food_id').distinct():
+        foods[day].setdefault(food_slot(food_id, size), food_id)
+    for day, slots in foods.items():
+        features[day].extend((slot, 1.0) for slot in slots)
+    return features, foods
+
+
+class RiskModelService:
+    """Train and score the per-user bad-day risk models"""
+
+    @staticmethod
+    def update(user_id, since=None, rebuild=False):
+        """
+        Fold the user's health logs dated after the model's last_date into it.
+
+        A rebuild, or a change dated on or before last_date (an edit or a
+        backfill), replays the full history instead.
+        """
+        if isinstance(since, str):
+            since = parse_date(since)
+        model = RiskModel.objects.filter(user_id=user_id).first()
+        if (
+            model is None or rebuild
+            or len(unpack(model.weights)) != dimensions()
+            or (since is not None and model.last_date is not None and since <= model.last_date)
+        ):
+            return RiskModelService.rebuild(user_id, model)
+        RiskModelService.train(model, unpack(model.weights))
+        return model
+
+    @staticmethod
+    def rebuild(user_id, model=None):
+        """Retrain a user's model from the full history"""
+        if model is None:
+            model, _ = RiskModel.objects.get_or_create(user_id=user_id, defaults={'weights': b''})
+        model.samples = model.bad_days = 0
+        model.last_date = None
+        return RiskModelService.train(model, array('f', bytes(4 * dimensions())))
+
+    @staticmethod
+    def train(model, weights):
+        logs = HealthLog.objects.filter(user_id=model.user_id)
+        if model.last_date is not None:
+            logs = logs.filter(date__gt=model.last_date)
+        logs = list(logs.order_by('date').values_list('date', 'physical_feeling'))
+        if logs:
+            tz_name = User.objects.filter(pk=model.user_id).values_list('timezone', flat=True).get()
+            features, _ = day_features(
+                model.user_id, tz_name, logs[0][0] - timedelta(days=1), logs[-1][0], len(weights)
+            )
+            rate = getattr(settings, 'RISK_MODEL_LEARNING_RATE', 0.1)
+            l2 = getattr(settings, 'RISK_MODEL_L2', 0.001)
+            for day, feeling in logs:
+                bad_day = feeling <= BAD_DAY_FEELING
+                learn(weights, features[day - timedelta(days=1)], bad_day, rate, l2)
+                model.samples += 1
+                model.bad_days += bad_day
+            model.last_date = logs[-1][0]
+        model.weights = pack(weights)
+        model.save()
+        return model
+
+    @staticmethod
+    def score(user, day=None):
+        """
+        Risk that the day after day (default today) is a bad one, with the weight of each factor.
+
+        A user without a model yet is queued for a rebuild and scored with an untrained one.
+        """
+        if day is None:
+            day = timezone.now().date()
+        model = RiskModel.objects.filter(user=user).first()
+        if model is None:
+            from .tasks import TaskQueue
+
+            # History written before risk models were trained; the worker builds it, reads never write
+            TaskQueue.enqueue('risk_model', user.pk, {'since': str(date.min), 'rebuild': True})
+            model = RiskModel.objects.filter(user=user).first()
+        pending = model is None
+        if pending:
+            model = RiskModel(user=user, weights=bytes(4 * dimensions()))
+        weights = unpack(model.weights)
+
+        features, foods = day_features(user.pk, user.timezone, day, day, len(weights))
+        features, foods = features[day], foods[day]
+        names = dict(Food.objects.filter(pk__in=foods.values()).values_list('id', 'name'))
+        factors = [
+            {
+                'factor': names.get(foods[slot]) if slot in foods else DENSE_FEATURES[slot],
+                'weight': round(weights[slot] * value, 4),
+            }
+            for slot, value in features
+            if slot != BIAS
+        ]
+        factors.sort(key=lambda factor: -abs(factor['weight']))
+        return {
+            'date': str(day),
+            'risk': round(predict(weights, features), 4),
+            'samples': model.samples,
+            'bad_days': model.bad_days,
+            'ready': model.samples >= getattr(settings, 'RISK_MODEL_MIN_SAMPLES', 14),
+            'pending': pending,
+            'factors': factors,
+        }
@@ -0,0 +1,157 @@
+"""
+Incremental rolling statistics over health and sleep metrics.
+
+Every (user, metric) pair keeps an exponentially weighted mean and variance
+in a MetricStat row. New logs fold into that state in O(1) each instead of
+re-reading the whole window, and its z-score against the previous state
+flags sudden changes such as a sharp drop in physical feeling.
+"""
+import math
+from datetime import date
+
+from django.conf import settings
+from django.utils.dateparse import parse_date
+
+from .models import HealthLog, Sleep, MetricStat
+
+# Tracked metric -> model that stores it
+ROLLING_METRICS = {
+    'physical_feeling': HealthLog,
+    'mental_feeling': HealthLog,
+    'weight': HealthLog,
+    'duration': Sleep,
+    'energy_level': Sleep,
+}
+
+
+def smoothing_factor():
+    """EWMA alpha equivalent to a ROLLING_STATS_SPAN-day window"""
+    span = getattr(settings, 'ROLLING_STATS_SPAN', 14)
+    return 2 / (span + 1)
+
+
+def fold(stat, value, alpha):
+    """Fold one observation into stat, recording its z-score against the previous state"""
+    if stat.count == 0 or stat.ewma is None:
+        stat.ewma = value
+        stat.ewm_variance = 0.0
+        zscore = None
+    else:
+        std = math.sqrt(stat.ewm_variance)
+        zscore = (value - stat.ewma) / std if std > 0 else None
+        diff = value - stat.ewma
+        increment = alpha * diff
+        stat.ewma += increment
+        stat.ewm_variance = (1 - alpha) * (stat.ewm_variance + diff * increment)
+    stat.count += 1
+    stat.last_value = value
+    stat.last_zscore = zscore
+
+
+class RollingStatsService:
+    """Maintain and query per-user rolling statistics"""
+
+    @staticmethod
+    def update(user_id, model, since=None, rebuild=False):
+        """
+        Bring the statistics of model's metrics up to date with a user's logs.
+
+        Logs dated after a metric's last_date are folded in order. A rebuild, or a
+        change dated on or before last_date (an edit or a backfill), recomputes the
+        series from the full history instead.
+        """
+        if isinstance(since, str):
+            since = parse_date(since)
+
+        alpha = smoothing_factor()
+        for metric, metric_model in ROLLING_METRICS.items():
+            if metric_model is not model:
+                continue
+            stat, _ = MetricStat.objects.get_or_create(user_id=user_id, metric=metric)
+            if rebuild or (since is not None and stat.last_date is not None and since <= stat.last_date):
+                RollingStatsService.rebuild(user_id, metric, stat)
+                continue
+
+            rows = model.objects.filter(user_id=user_id, **{f'{metric}__isnull': False})
+            if stat.last_date is not None:
+                rows = rows.filter(date__gt=stat.last_date)
+            rows = list(rows.order_by('date').values_list('date', metric))
+            if not rows:
+                continue
+            for log_date, value in rows:
+                fold(stat, float(value), alpha)
+                stat.last_date = log_date
+            stat.save()
+
+    @staticmethod
+    def rebuild(user_id, metric, stat=None):
+        """Recompute a metric's statistics from the user's full history"""
+        model = ROLLING_METRICS[metric]
+        if stat is None:
+            stat, _ = MetricStat.objects.get_or_create(user_id=user_id, metric=metric)
+
+        stat.count = 0
+        stat.ewma = stat.last_date = stat.last_value = stat.last_zscore = None
+        stat.ewm_variance = 0.0
+
+        alpha = smoothing_factor()
+        rows = (
+            model.objects.filter(user_id=user_id, **{f'{metric}__isnull': False})
+            .order_by('date')
+            .values_list('date', metric)
+        )
+        for log_date, value in rows.iterator():
+            fold(stat, float(value), alpha)
+            stat.last_date = log_date
+        stat.save()
+        return stat
+
+    @staticmethod
+    def get_anomalies(user, threshold=None):
+        """
+        Current rolling statistics and anomaly flags for every tracked metric.
+
+        Metrics without statistics yet are queued for a rebuild and reported as pending.
+        """
+        if threshold is None:
+            threshold = getattr(settings, 'ROLLING_STATS_ZSCORE_THRESHOLD', 2.5)
+        min_samples = getattr(settings, 'ROLLING_STATS_MIN_SAMPLES', 5)
+
+        stats = {stat.metric: stat for stat in MetricStat.objects.filter(user=user)}
+        missing = {ROLLING_METRICS[metric] for metric in ROLLING_METRICS if metric not in stats}
+        if missing:
+            from .tasks import TaskQueue
+
+            # History written before statistics were tracked; the worker builds them, reads never write
+            for model in missing:
+                TaskQueue.enqueue('rolling_stats', user.id, {
+                    model._meta.model_name: {'since': str(date.min), 'rebuild': True},
+                })
+            stats = {stat.metric: stat for stat in MetricStat.objects.filter(user=user)}
+
+        results = {}
+        for metric in ROLLING_METRICS:
+            stat = stats.get(metric)
+            pending = stat is None
+            if pending:
+                stat = MetricStat(user=user, metric=metric)
+
+            zscore = stat.last_zscore
+            # The z-score of the latest point is measured against the count - 1 points before it
+            anomaly = (
+                zscore is not None
+                and stat.count - 1 >= min_samples
+                and abs(zscore) >= threshold
+            )
+            results[metric] = {
+                'count': stat.count,
+                'mean': round(stat.ewma, 3) if stat.ewma is not None else None,
+                'std': round(math.sqrt(stat.ewm_variance), 3),
+                'last_date': str(stat.last_date) if stat.last_date else None,
+                'last_value': stat.last_value,
+                'zscore': round(zscore, 3) if zscore is not None else None,
+                'anomaly': anomaly,
+                'direction': ('decline' if zscore < 0 else 'rise') if anomaly else None,
+                'pending': pending,
+            }
+        return results
@@ -0,0 +1,164 @@
+"""
+Full-text search over the free text of a user's diary.
+
+Every health log, sleep log, meal and meal food with symptoms or notes has
+a SearchDocument holding that text. Migration 0010 indexes the documents,
+with an FTS5 table on SQLite and a GIN index over to_tsvector on
+PostgreSQL, so a search reads posting lists instead of scanning the logs.
+Signals keep the documents current on write. Documents stay when their
+entry moves into the archive, so years-old logs can still be found.
+"""
+import re
+from itertools import islice
+from operator import attrgetter
+
+from django.db import connections, router
+
+from .models import HealthLog, Meal, MealFood, SearchDocument, Sleep
+
+# Model -> (document kind, user lookup, date lookup, text fields)
+SEARCH_SOURCES = {
+    HealthLog: (SearchDocument.Kind.HEALTH_LOG, 'user_id', 'date', ('symptoms', 'notes')),
+    Sleep: (SearchDocument.Kind.SLEEP, 'user_id', 'date', ('notes',)),
+    Meal: (SearchDocument.Kind.MEAL, 'user_id', 'local_date', ('notes',)),
+    MealFood: (SearchDocument.Kind.MEAL_FOOD, 'meal__user_id', 'meal__local_date', ('notes',)),
+}
+
+INDEX_BATCH_SIZE = 1000
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+
+SQLITE_SEARCH = """
+    SELECT d.kind, d.object_id, d.date,
+           snippet(core_searchdocument_fts, 1, %s, %s, '…', 16),
+           -bm25(core_searchdocument_fts, 0.0, 1.0) AS score
+    FROM core_searchdocument_fts
+    JOIN core_searchdocument d ON d.id = core_searchdocument_fts.rowid
+    WHERE core_searchdocument_fts MATCH %s
+    ORDER BY score DESC, d.date DESC
+    LIMIT %s
+"""
+
+POSTGRES_SEARCH = """
+    SELECT kind, object_id, date,
+           ts_headline('english', body, query, %s),
+           ts_rank(to_tsvector('english', body), query) AS score
+    FROM core_searchdocument, plainto_tsquery('english', %s) AS query
+    WHERE user_id = %s AND to_tsvector('english', body) @@ query
+    ORDER BY score DESC, date DESC
+    LIMIT %s
+"""
+POSTGRES_HEADLINE = f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxFragments=2, MaxWords=16, MinWords=4'
+
+
+def document_body(texts):
+    return '\n'.join(text for text in texts if text)
+
+
+def match_expression(user_id, query):
+    """FTS5 query for every word of query within the user's documents; None when query has no words"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    # Quoted, so words such as AND or NEAR are searched for rather than parsed
+    return f'user_id:"{user_id}" AND body:(' + ' '.join(f'"{term}"' for term in terms) + ')'
+
+
+class SearchService:
+    """Maintains and queries the diary search documents"""
+
+    @staticmethod
+    def index(queryset):
+        """Write the documents of the rows in queryset; rows without text lose theirs"""
+        kind, user_lookup, date_lookup, text_fields = SEARCH_SOURCES[queryset.model]
+        rows = queryset.values_list('id', user_lookup, date_lookup, *text_fields).order_by().iterator()
+        while True:
+            batch = list(islice(rows, INDEX_BATCH_SIZE))
+            if not batch:
+                return
+            documents, empty = [], []
+            for object_id, user_id, day, *texts in batch:
+                body = document_body(texts)
+                if body:
+                    documents.append(SearchDocument(user_id=user_id, kind=kind, object_id=object_id, date=day, body=body))
+                else:
+                    empty.append(object_id)
+            SearchDocument.objects.bulk_create(
+                documents, update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=['date', 'body']
+            )
+            if empty:
+                SearchDocument.objects.filter(kind=kind, object_id__in=empty).delete()
+
+    @staticmethod
+    def index_instance(instance):
+        """Write or drop the document of one saved row, without reading it back"""
+        kind, user_lookup, date_lookup, text_fields = SEARCH_SOURCES[type(instance)]
+        body = document_body(getattr(instance, field) for field in text_fields)
+        if not body:
+            SearchService.remove(instance)
+            return
+        SearchDocument.objects.update_or_create(
+            kind=kind,
+            object_id=instance.pk,
+            defaults={
+                'user_id': attrgetter(user_lookup.replace('__', '.'))(instance),
+                'date': attrgetter(date_lookup.replace('__', '.'))(instance),
+                'body': body,
+            },
+        )
+
+    @staticmethod
+    def index_days(model, user_id, days):
+        """Index the user's rows of model dated within the span of days, e.g. after bulk_create"""
+        _, user_lookup, date_lookup, _ = SEARCH_SOURCES[model]
+        rows = model.objects.filter(**{
+            user_lookup: user_id, f'{date_lookup}__gte': min(days), f'{date_lookup}__lte': max(days)
+        })
+        SearchService.index(rows)
+        if model is Meal:
+            SearchService.index(MealFood.objects.filter(meal__in=rows))
+
+    @staticmethod
+    def remove(instance):
+        kind = SEARCH_SOURCES[type(instance)][0]
+        SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+    @staticmethod
+    def rebuild(users=None):
+        """Index every row, or the rows of users; returns the number of documents afterwards"""
+        for model, (_, user_lookup, _, _) in SEARCH_SOURCES.items():
+            rows = model.objects.all()
+            if users is not None:
+                rows = rows.filter(**{f'{user_lookup}__in': users})
+            SearchService.index(rows)
+        documents = SearchDocument.objects.all()
+        if users is not None:
+            documents = documents.filter(user__in=users)
+        return documents.count()
+
+    @staticmethod
+    def search(user, query, limit=20):
+        """The user's best-matching entries with highlighted snippets, best first"""
+        connection = connections[router.db_for_read(SearchDocument)]
+        if connection.vendor == 'postgresql':
+            sql, params = POSTGRES_SEARCH, [POSTGRES_HEADLINE, query, user.pk, limit]
+        else:
+            match = match_expression(user.pk, query)
+            if match is None:
+                return []
+            sql, params = SQLITE_SEARCH, [SNIPPET_START, SNIPPET_END, match, limit]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [
+            {
+                'type': kind,
+                'id': object_id,
+                'date': str(day) if day else None,
+                'snippet': snippet,
+                'score': round(score, 4),
+            }
+            for kind, object_id, day, snippet, score in rows
+        ]
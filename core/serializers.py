@@ -1,7 +1,18 @@
-from rest_framework import serializers
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.fields import empty
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth.password_validation import validate_password
-from .models import Profile, Food, Meal, MealFood, HealthLog, Sleep
+from django.db.models import Q
+from .models import (
+    normalize_barcode, local_date, Profile, Food, Meal, MealFood, HealthLog, Sleep, PatientGrant, DailySummary,
+)
 
 User = get_user_model()
 
@@ -12,7 +23,8 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'password', 'password2', 'phone', 
-                  'date_of_birth', 'height', 'is_medical_professional', 'first_name', 'last_name')
+                  'date_of_birth', 'height', 'is_medical_professional', 'first_name', 'last_name',
+                  'timezone')
         extra_kwargs = {
             'first_name': {'required': False},
             'last_name': {'required': False},
@@ -53,12 +65,64 @@ class ProfileSerializer(serializers.ModelSerializer):
             validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class FoodCodeField(serializers.CharField):
+    """Optional food code; blank means none, as '' would collide under the unique constraints"""
+
+    def __init__(self, normalize=str.strip, **kwargs):
+        self.normalize = normalize
+        super().__init__(required=False, allow_null=True, **kwargs)
+
+    def run_validation(self, data=empty):
+        if isinstance(data, str) and not data.strip():
+            data = None
+        return super().run_validation(data)
+
+    def to_internal_value(self, data):
+        try:
+            return self.normalize(super().to_internal_value(data))
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+
 class FoodSerializer(serializers.ModelSerializer):
+    barcode = FoodCodeField(normalize=normalize_barcode, max_length=32)
+    external_id = FoodCodeField(max_length=64)
+
     class Meta:
         model = Food
-        fields = ('id', 'name', 'calories', 'protein', 'carbs', 'fats', 'user', 'is_public')
+        fields = ('id', 'name', 'calories', 'protein', 'carbs', 'fats', 'user', 'is_public', 'barcode', 'external_id')
         read_only_fields = ('id',)
-        
+        # Code uniqueness depends on the owner, which create() fills in, so validate() checks it
+        validators = []
+
+    def validate(self, attrs):
+        """Codes are unique among the owner's foods and, for a public food, among public foods"""
+        attrs = super().validate(attrs)
+        instance = self.instance
+        if instance is None:
+            # A scanned code names nutrients for whoever scans it, so sharing one is opt-in
+            if attrs.get('barcode') or attrs.get('external_id'):
+                attrs.setdefault('is_public', False)
+            request = self.context.get('request')
+            owner = attrs.get('user', request.user if request else None)
+        else:
+            owner = attrs.get('user', instance.user)
+        is_public = attrs.get('is_public', instance.is_public if instance else True)
+
+        errors = {}
+        for name in ('barcode', 'external_id'):
+            code = attrs.get(name, getattr(instance, name, None))
+            if code is None:
+                continue
+            scope = Q(user=owner) | Q(is_public=True) if is_public else Q(user=owner)
+            clashes = Food.objects.filter(scope, **{name: code})
+            if instance is not None:
+                clashes = clashes.exclude(pk=instance.pk)
+            if clashes.exists():
+                errors[name] = [f'food with this {Food._meta.get_field(name).verbose_name} already exists.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
     def create(self, validated_data):
         # If user isn't specified explicitly and we have a request context
         if 'user' not in validated_data and 'request' in self.context:
@@ -78,14 +142,43 @@ class MealFoodSerializer(serializers.ModelSerializer):
         fields = ('id', 'food_id', 'food_name', 'amount', 'notes')
         read_only_fields = ('id',)
 
-class MealSerializer(serializers.ModelSerializer):
+class ArchivedDaysMixin:
+    """
+    Rejects writes dated on or before the user's archived_through. The live
+    row would sit beside the archived one, and export would return the day twice.
+    """
+    date_field = 'date'
+
+    def written_day(self, attrs, user):
+        return attrs.get(self.date_field)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        request = self.context.get('request')
+        user = attrs.get('user') or getattr(self.instance, 'user', None) or getattr(request, 'user', None)
+        archived_through = getattr(user, 'archived_through', None)
+        day = self.written_day(attrs, user)
+        if archived_through is not None and day is not None and day <= archived_through:
+            raise serializers.ValidationError(
+                {self.date_field: f"Days up to {archived_through} are archived and can no longer be logged."}
+            )
+        return attrs
+
+class MealSerializer(ArchivedDaysMixin, serializers.ModelSerializer):
     mealfood_set = MealFoodSerializer(many=True, read_only=True)
     foods = MealFoodSerializer(many=True, write_only=True, required=False)
     
     class Meta:
         model = Meal
-        fields = ('id', 'user', 'date_time', 'meal_type', 'notes', 'mealfood_set', 'foods')
-        read_only_fields = ('id',)
+        fields = ('id', 'user', 'date_time', 'local_date', 'meal_type', 'notes', 'mealfood_set', 'foods')
+        read_only_fields = ('id', 'local_date')
+
+    date_field = 'date_time'
+
+    def written_day(self, attrs, user):
+        if 'date_time' not in attrs or user is None:
+            return None
+        return local_date(attrs['date_time'], user.timezone)
         
     def create(self, validated_data):
         foods_data = validated_data.pop('foods', [])
@@ -120,7 +213,7 @@ class MealSerializer(serializers.ModelSerializer):
                 
         return instance
 
-class HealthLogSerializer(serializers.ModelSerializer):
+class HealthLogSerializer(ArchivedDaysMixin, serializers.ModelSerializer):
     class Meta:
         model = HealthLog
         fields = ('id', 'user', 'date', 'physical_feeling', 'mental_feeling', 
@@ -144,7 +237,7 @@ class HealthLogSerializer(serializers.ModelSerializer):
             
         return super().create(validated_data)
 
-class SleepSerializer(serializers.ModelSerializer):
+class SleepSerializer(ArchivedDaysMixin, serializers.ModelSerializer):
     class Meta:
         model = Sleep
         fields = ('id', 'user', 'date', 'duration', 'quality', 
@@ -167,9 +260,168 @@ class SleepSerializer(serializers.ModelSerializer):
             
         return super().create(validated_data)
 
+class PatientGrantSerializer(serializers.ModelSerializer):
+    clinician_username = serializers.ReadOnlyField(source='clinician.username')
+    
+    class Meta:
+        model = PatientGrant
+        fields = ('id', 'clinician', 'clinician_username', 'patient', 'created_at')
+        read_only_fields = ('id', 'patient', 'created_at')
+    
+    def validate_clinician(self, clinician):
+        if not clinician.is_medical_professional:
+            raise serializers.ValidationError("Access can only be granted to medical professionals.")
+        return clinician
+    
+    def create(self, validated_data):
+        patient = self.context['request'].user
+        clinician = validated_data['clinician']
+        
+        if clinician == patient:
+            raise serializers.ValidationError({"clinician": "You cannot grant access to yourself."})
+        if PatientGrant.objects.filter(clinician=clinician, patient=patient).exists():
+            raise serializers.ValidationError({"clinician": "Access has already been granted."})
+        
+        return PatientGrant.objects.create(clinician=clinician, patient=patient)
+
+class PatientOverviewSerializer(serializers.ModelSerializer):
+    """Triage row for a clinician; the metrics are annotated by the queryset"""
+    last_log_date = serializers.DateField(read_only=True)
+    logs_in_window = serializers.IntegerField(read_only=True)
+    bad_days = serializers.IntegerField(read_only=True)
+    avg_physical_feeling = serializers.FloatField(read_only=True)
+    avg_mental_feeling = serializers.FloatField(read_only=True)
+    avg_sleep_duration = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name', 'last_log_date',
+                  'logs_in_window', 'bad_days', 'avg_physical_feeling',
+                  'avg_mental_feeling', 'avg_sleep_duration')
+        read_only_fields = fields
+
+class DailySummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySummary
+        fields = ('date', 'physical_feeling', 'mental_feeling', 'stool_count', 'weight',
+                  'sleep_duration', 'sleep_quality', 'energy_level', 'meal_count',
+                  'food_count', 'computed_at')
+        read_only_fields = fields
+
 # Serializer for user registration with token response
 class RegisterSerializer(UserSerializer):
     token = serializers.CharField(read_only=True)
     
     class Meta(UserSerializer.Meta):
-        fields = UserSerializer.Meta.fields + ('token',) 
\ No newline at end of file
+        fields = UserSerializer.Meta.fields + ('token',) 
+
+def _converter(field):
+    """
+    Function from a database value to field's representation, None when the value is used as is.
+
+    The shortcuts give what field.to_representation gives for the values the
+    database returns: strings, ints and bools already are their representation,
+    dates are ISO 8601 and decimals come back with the field's decimal places.
+    """
+    if isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                          serializers.ChoiceField, serializers.ReadOnlyField)):
+        return None
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if type(field) is serializers.DateField \
+            and str(getattr(field, 'format', api_settings.DATE_FORMAT)).lower() == ISO_8601:
+        return date.isoformat
+    if type(field) is serializers.DecimalField \
+            and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) \
+            and not field.localize and field.decimal_places is not None:
+        quantum = Decimal(1).scaleb(-field.decimal_places)
+        return lambda value: format(value.quantize(quantum), 'f')
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only rendering of a ModelSerializer's output straight from values_list rows.
+
+    The field list, lookups and converters are worked out once per serializer
+    class, so a row costs a tuple and a dict instead of a model instance and a
+    to_representation call per field. Nested many=True serializers of reverse
+    relations are read with one extra query per chunk of parents.
+    """
+    NESTED_CHUNK_SIZE = 500
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.names = []
+        self.lookups = []
+        self.converters = []  # (column index, converter) for values that need converting
+        self.nested = []  # (name, ValuesSerializer, foreign key column of the child)
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = next(
+                    rel for rel in self.model._meta.related_objects if rel.get_accessor_name() == field.source
+                )
+                self.nested.append((name, values_serializer(type(field.child)), relation.field.attname))
+                continue
+            converter = _converter(field)
+            if converter is not None:
+                self.converters.append((len(self.lookups), converter))
+            self.names.append(name)
+            self.lookups.append('__'.join(field.source_attrs))
+        # Nested rows are matched on the pk, which trails the rendered columns
+        self.columns = self.lookups + ['pk'] if self.nested else self.lookups
+
+    def values(self, queryset):
+        """The queryset's rows as tuples, in the queryset's order"""
+        return queryset.prefetch_related(None).values_list(*self.columns)
+
+    def represent(self, rows):
+        """Representations of rows from values()"""
+        return self.represent_with_extras(rows)[0]
+
+    def represent_with_extras(self, rows):
+        """Representations of rows, and the columns trailing the rendered ones in each row"""
+        names, converters = self.names, self.converters
+        width = len(names)
+        data, extras = [], []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, converter in converters:
+                    value = row[index]
+                    if value is not None:
+                        row[index] = converter(value)
+            data.append(dict(zip(names, row)))
+            extras.append(row[width:])
+        for name, child, foreign_key in self.nested:
+            self.attach(name, child, foreign_key, data, [extra[0] for extra in extras])
+            extras = [extra[1:] for extra in extras]
+        return data, extras
+
+    def attach(self, name, child, foreign_key, data, pks):
+        children = {pk: [] for pk in pks}
+        pks = iter(pks)
+        while True:
+            chunk = list(islice(pks, self.NESTED_CHUNK_SIZE))
+            if not chunk:
+                break
+            rows = child.values(child.model.objects.filter(**{f'{foreign_key}__in': chunk}))
+            # The parent key trails the child's own columns
+            rows = rows.values_list(*child.columns, foreign_key).order_by(*(child.model._meta.ordering or ['pk']))
+            items, parents = child.represent_with_extras(rows)
+            for item, extra in zip(items, parents):
+                children[extra[-1]].append(item)
+        for item, item_children in zip(data, children.values()):
+            item[name] = item_children
+
+    def data(self, queryset):
+        return self.represent(self.values(queryset))
+
+
+@lru_cache(maxsize=None)
+def values_serializer(serializer_class):
+    """The ValuesSerializer of a ModelSerializer class, built once"""
+    return ValuesSerializer(serializer_class)
@@ -1,8 +1,126 @@
-from django.db.models import Avg, Count, Q, F
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Avg, Count, Q, F, Max, Min, DateField, FloatField
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
-from collections import defaultdict
-from .models import HealthLog, Meal, MealFood, Sleep, Food
+from collections import Counter, defaultdict
+from operator import attrgetter
+from .archive import ArchiveService, row_date
+from .columnar import COLUMNAR_TABLES, ColumnarSnapshotService
+from .models import HealthLog, Meal, MealFood, Sleep, Food, ArchiveBlob
+from .symptoms import SYMPTOM_VOCABULARY, extract_symptoms
+
+# Metrics summarised by the bucketed aggregation API, per data source
+AGGREGATE_SOURCES = {
+    'health': (HealthLog, ('physical_feeling', 'mental_feeling', 'stool_count', 'weight')),
+    'sleep': (Sleep, ('duration', 'quality', 'wake_up_ease', 'energy_level')),
+}
+
+# Aggregate source -> its log table in COLUMNAR_TABLES
+AGGREGATE_TABLES = {
+    'health': 'health_logs',
+    'sleep': 'sleep',
+}
+
+BUCKET_TRUNCS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Completed buckets never change unless a log inside them is edited
+COMPLETED_BUCKET_TIMEOUT = 60 * 60 * 24 * 7
+
+def bucket_start(day, bucket):
+    """Return the first day of the week (Monday) or month containing day"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def next_bucket_start(day, bucket):
+    """Return the first day of the bucket following the one containing day"""
+    start = bucket_start(day, bucket)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+def uses_postgres(queryset):
+    """True when queryset will run on PostgreSQL, which has faster native paths"""
+    return connections[queryset.db].vendor == 'postgresql'
+
+def columnar_snapshot(user, table_name, days):
+    """The user's fresh columnar snapshot for windows long enough to be worth scanning it, else None"""
+    if days < getattr(settings, 'COLUMNAR_MIN_DAYS', 180):
+        return None
+    return ColumnarSnapshotService.open(user.pk, table_name)
+
+def load_series(user, table_name, fields, start_date, end_date):
+    """
+    The window's health or sleep logs as compact records of fields, oldest first.
+    
+    Long windows scan a fresh columnar snapshot. Otherwise only the fields are
+    loaded, with values_list, from the log table and then from the archive.
+    """
+    snapshot = columnar_snapshot(user, table_name, (end_date - start_date).days + 1)
+    if snapshot is not None:
+        return snapshot.records(start_date, end_date, fields)
+    
+    table = COLUMNAR_TABLES[table_name]
+    rows = table.model.objects.filter(
+        user=user,
+        date__gte=start_date,
+        date__lte=end_date
+    ).order_by('date').values_list(*fields)
+    records = list(map(table.record_type(fields)._make, rows))
+    if ArchiveService.reaches_archive(user, start_date):
+        records += table.archived_records(user, fields, start_date, end_date)
+        records.sort(key=attrgetter('date'))
+    return records
+
+def symptoms_by_date(user, start_date, end_date):
+    """Map each day in the range to the symptom tags of its health log, archived logs included"""
+    tagged = HealthLog.symptom_tags.through.objects.filter(
+        healthlog__user=user,
+        healthlog__date__gte=start_date,
+        healthlog__date__lte=end_date
+    ).values_list('healthlog__date', 'symptomtag__slug')
+    date_to_symptoms = defaultdict(set)
+    for day, slug in tagged:
+        date_to_symptoms[day].add(slug)
+    for log in ArchiveService.read(user, ArchiveBlob.Kind.HEALTH_LOGS, start_date, end_date):
+        date_to_symptoms[row_date(log)] |= extract_symptoms(log['symptoms'])
+    return date_to_symptoms
+
+def symptom_days(user, symptom, start_date, end_date):
+    """Days in the range whose health log is tagged with symptom, archived logs included"""
+    days = set(
+        HealthLog.objects.filter(
+            user=user,
+            date__gte=start_date,
+            date__lte=end_date,
+            symptom_tags__slug=symptom
+        ).values_list('date', flat=True)
+    )
+    days.update(
+        row_date(log)
+        for log in ArchiveService.read(user, ArchiveBlob.Kind.HEALTH_LOGS, start_date, end_date)
+        if symptom in extract_symptoms(log['symptoms'])
+    )
+    return days
+
+def aggregate_cache_key(user_id, source, bucket, start):
+    return f'aggregates:{user_id}:{source}:{bucket}:{start.isoformat()}'
+
+def invalidate_aggregate_buckets(user_id, source, *days):
+    """Drop the cached week and month buckets containing any of days"""
+    days = {parse_date(day) if isinstance(day, str) else day for day in days}
+    cache.delete_many({
+        aggregate_cache_key(user_id, source, bucket, bucket_start(day, bucket))
+        for day in days
+        for bucket in BUCKET_TRUNCS
+    })
 
 class HealthAnalyticsService:
     """Service for health analytics and insights"""
@@ -13,14 +131,10 @@ class HealthAnalyticsService:
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days-1)  # -1 because end_date is inclusive
         
-        health_logs = HealthLog.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('-date')[:days]  # Limit to exactly 'days' number of records
-        
-        # Convert to list and sort by date for consistent processing
-        health_logs = sorted(list(health_logs), key=lambda log: log.date)
+        health_logs = load_series(
+            user, 'health_logs', ('date', 'physical_feeling', 'mental_feeling', 'stool_quality', 'weight'),
+            start_date, end_date
+        )
         
         # Convert date objects to strings for JSON serialization
         return {
@@ -49,28 +163,13 @@ class HealthAnalyticsService:
         start_date = end_date - timedelta(days=days)
         
         # Get health logs for date range
-        health_logs = HealthLog.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('date')
-        
-        # Get meals from date range
-        meals = Meal.objects.filter(
-            user=user,
-            date_time__date__gte=start_date,
-            date_time__date__lte=end_date
-        ).prefetch_related('mealfood_set__food')
+        health_logs = load_series(
+            user, 'health_logs', ('date', 'physical_feeling', 'mental_feeling', 'stool_quality'),
+            start_date, end_date
+        )
         
-        # Build a map of date -> foods eaten
-        date_to_foods = defaultdict(list)
-        for meal in meals:
-            meal_date = meal.date_time.date()
-            for meal_food in meal.mealfood_set.all():
-                date_to_foods[meal_date].append({
-                    'name': meal_food.food.name,
-                    'amount': str(meal_food.amount)
-                })
+        date_to_foods = HealthAnalyticsService._foods_by_date(user, start_date, end_date)
+        date_to_symptoms = symptoms_by_date(user, start_date, end_date)
         
         # Combine health metrics with foods eaten
         correlations = []
@@ -86,26 +185,70 @@ class HealthAnalyticsService:
                 'physical_feeling': log.physical_feeling,
                 'mental_feeling': log.mental_feeling,
                 'stool_quality': log.stool_quality,
+                'symptoms': sorted(date_to_symptoms.get(log.date, ())),
                 'foods_eaten_same_day': foods_eaten,
                 'foods_eaten_previous_day': prev_day_foods
             })
         
         return correlations
     
+    @staticmethod
+    def _foods_by_date(user, start_date, end_date):
+        """Map each day in the range to the foods eaten that day"""
+        meal_foods = MealFood.objects.filter(
+            meal__user=user,
+            meal__local_date__gte=start_date,
+            meal__local_date__lte=end_date
+        )
+        date_to_foods = defaultdict(list)
+        
+        if uses_postgres(meal_foods):
+            # One row per day, with the foods gathered into arrays by array_agg
+            from django.contrib.postgres.aggregates import ArrayAgg
+            ordering = ('-meal__date_time', 'meal_id', 'id')
+            rows = (
+                meal_foods.values('meal__local_date')
+                .annotate(
+                    names=ArrayAgg('food__name', ordering=ordering),
+                    amounts=ArrayAgg('amount', ordering=ordering),
+                )
+                .order_by()
+            )
+            for row in rows:
+                date_to_foods[row['meal__local_date']] = [
+                    {'name': name, 'amount': str(amount)}
+                    for name, amount in zip(row['names'], row['amounts'])
+                ]
+        else:
+            meals = Meal.objects.filter(
+                user=user,
+                local_date__gte=start_date,
+                local_date__lte=end_date
+            ).prefetch_related('mealfood_set__food')
+            for meal in meals:
+                meal_date = meal.local_date
+                for meal_food in meal.mealfood_set.all():
+                    date_to_foods[meal_date].append({
+                        'name': meal_food.food.name,
+                        'amount': str(meal_food.amount)
+                    })
+        
+        for meal in ArchiveService.read(user, ArchiveBlob.Kind.MEALS, start_date, end_date):
+            date_to_foods[row_date(meal)].extend(
+                {'name': meal_food['food_name'], 'amount': meal_food['amount']}
+                for meal_food in meal['mealfood_set']
+            )
+        return date_to_foods
+    
     @staticmethod
     def analyze_sleep(user, days=30):
         """Analyze sleep patterns"""
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days-1)  # -1 because end_date is inclusive
         
-        sleep_logs = Sleep.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('-date')[:days]  # Limit to exactly 'days' number of records
-        
-        # Convert to list and sort by date for consistent processing
-        sleep_logs = sorted(list(sleep_logs), key=lambda log: log.date)
+        sleep_logs = load_series(
+            user, 'sleep', ('date', 'duration', 'quality', 'energy_level'), start_date, end_date
+        )
         
         # Calculate averages
         if sleep_logs:
@@ -135,49 +278,205 @@ class HealthAnalyticsService:
         }
     
     @staticmethod
-    def identify_symptom_triggers(user, days=60):
-        """Identify potential food triggers for symptoms"""
+    def identify_symptom_triggers(user, days=60, symptom=None):
+        """Identify potential food triggers for a symptom, or for bad days when none is given"""
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=days)
         
-        # Get health logs where physical_feeling is low (1-2)
-        poor_health_days = HealthLog.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date,
-            physical_feeling__lte=2
-        ).values_list('date', flat=True)
+        if symptom is not None:
+            # The day before each log tagged with the symptom
+            potential_trigger_days = {
+                day - timedelta(days=1) for day in symptom_days(user, symptom, start_date, end_date)
+            }
+        else:
+            # Get one day before each day where physical_feeling is low (1-2)
+            health_logs = load_series(user, 'health_logs', ('date', 'physical_feeling'), start_date, end_date)
+            potential_trigger_days = {
+                log.date - timedelta(days=1) for log in health_logs if log.physical_feeling <= 2
+            }
+        reaches_archive = ArchiveService.reaches_archive(user, start_date - timedelta(days=1))
         
-        # Convert QuerySet to list for debugging
-        poor_health_days = list(poor_health_days)
+        # Count foods eaten on potential trigger days in one grouped query
+        triggers = (
+            MealFood.objects.filter(
+                meal__user=user,
+                meal__local_date__in=potential_trigger_days
+            )
+            .values('food__name')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'food__name')
+        )
+        if not reaches_archive:
+            return [{'food': row['food__name'], 'count': row['count']} for row in triggers[:10]]
         
-        # Log for debugging
-        print(f"Found {len(poor_health_days)} poor health days")
+        # Windows reaching the archive also count archived meals
+        counts = defaultdict(int)
+        for row in triggers:
+            counts[row['food__name']] += row['count']
+        for meal in ArchiveService.read(user, ArchiveBlob.Kind.MEALS, start_date - timedelta(days=1), end_date):
+            if row_date(meal) in potential_trigger_days:
+                for meal_food in meal['mealfood_set']:
+                    counts[meal_food['food_name']] += 1
         
-        # Get one day before each poor health day
-        potential_trigger_days = [day - timedelta(days=1) for day in poor_health_days]
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{'food': food, 'count': count} for food, count in ranked[:10]]
+    
+    @staticmethod
+    def get_symptom_counts(user, days=30):
+        """Number of days with each symptom over the last n days, most frequent first"""
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=days-1)  # -1 because end_date is inclusive
         
-        # Get foods eaten on potential trigger days
-        potential_triggers = {}
-        for trigger_day in potential_trigger_days:
-            meals = Meal.objects.filter(
-                user=user,
-                date_time__date=trigger_day
-            ).prefetch_related('mealfood_set__food')
-            
-            for meal in meals:
-                for meal_food in meal.mealfood_set.all():
-                    food_name = meal_food.food.name
-                    if food_name in potential_triggers:
-                        potential_triggers[food_name] += 1
-                    else:
-                        potential_triggers[food_name] = 1
-        
-        # Sort by frequency
-        sorted_triggers = sorted(
-            [{'food': k, 'count': v} for k, v in potential_triggers.items()],
-            key=lambda x: x['count'],
-            reverse=True
+        counts = Counter(dict(
+            HealthLog.symptom_tags.through.objects.filter(
+                healthlog__user=user,
+                healthlog__date__gte=start_date,
+                healthlog__date__lte=end_date
+            )
+            .values('symptomtag__slug')
+            .annotate(count=Count('id'))
+            .values_list('symptomtag__slug', 'count')
+        ))
+        for log in ArchiveService.read(user, ArchiveBlob.Kind.HEALTH_LOGS, start_date, end_date):
+            counts.update(extract_symptoms(log['symptoms']))
+        
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            {'symptom': slug, 'name': SYMPTOM_VOCABULARY.get(slug, (slug,))[0], 'days': count}
+            for slug, count in ranked
+        ]
+    
+    @staticmethod
+    def get_bucketed_aggregates(user, source='health', bucket='week', count=12):
+        """
+        Summarise the last `count` weekly or monthly buckets of health or sleep logs.
+        
+        Each bucket has the mean, min and max of every metric, the number of logs
+        and, for health logs, the stool quality distribution. Completed buckets are
+        cached, so normally only the current bucket is computed in SQL.
+        """
+        fields = AGGREGATE_SOURCES[source][1]
+        current = bucket_start(timezone.now().date(), bucket)
+        
+        starts = [current]
+        for _ in range(count - 1):
+            starts.insert(0, bucket_start(starts[0] - timedelta(days=1), bucket))
+        
+        keys = {start: aggregate_cache_key(user.id, source, bucket, start) for start in starts[:-1]}
+        cached = cache.get_many(keys.values())
+        missing = [start for start in starts[:-1] if keys[start] not in cached] + [current]
+        
+        last_day = next_bucket_start(current, bucket) - timedelta(days=1)
+        snapshot = columnar_snapshot(user, AGGREGATE_TABLES[source], (last_day - missing[0]).days + 1)
+        if snapshot is not None:
+            computed = HealthAnalyticsService._snapshot_buckets(snapshot, missing, bucket, fields, source)
+        else:
+            computed = HealthAnalyticsService._query_buckets(user, source, bucket, missing, last_day)
+        
+        fresh = {}
+        results = []
+        for start in starts:
+            key = keys.get(start)
+            if key in cached:
+                results.append(cached[key])
+                continue
+            summary = HealthAnalyticsService._summarise_bucket(start, fields, source, computed.get(start))
+            if key is not None:
+                fresh[key] = summary
+            results.append(summary)
+        
+        if fresh:
+            cache.set_many(fresh, COMPLETED_BUCKET_TIMEOUT)
+        return results
+    
+    @staticmethod
+    def _query_buckets(user, source, bucket, missing, last_day):
+        """Aggregate rows of the buckets from missing[0] to last_day, from the log table and the archive"""
+        model, fields = AGGREGATE_SOURCES[source]
+        aggregates = {'count': Count('id')}
+        for field in fields:
+            aggregates[f'{field}__n'] = Count(field)
+            aggregates[f'{field}__mean'] = Avg(field, output_field=FloatField())
+            aggregates[f'{field}__min'] = Min(field)
+            aggregates[f'{field}__max'] = Max(field)
+        if source == 'health':
+            for quality in HealthLog.StoolQuality.values:
+                aggregates[f'stool_quality__{quality}'] = Count('id', filter=Q(stool_quality=quality))
+        
+        # Cached buckets are older than missing ones, so one query from the oldest miss covers them all
+        rows = (
+            model.objects.filter(user=user, date__gte=missing[0], date__lte=last_day)
+            .annotate(bucket=BUCKET_TRUNCS[bucket]('date', output_field=DateField()))
+            .values('bucket')
+            .annotate(**aggregates)
+            .order_by('bucket')
         )
+        computed = {row['bucket']: row for row in rows}
         
-        return sorted_triggers[:10]  # Return top 10 potential triggers 
\ No newline at end of file
+        if ArchiveService.reaches_archive(user, missing[0]):
+            archived = defaultdict(list)
+            table = COLUMNAR_TABLES[AGGREGATE_TABLES[source]]
+            loaded = ('date',) + fields + (('stool_quality',) if source == 'health' else ())
+            for log in table.archived_records(user, loaded, missing[0], last_day):
+                archived[bucket_start(log.date, bucket)].append(log)
+            for start, logs in archived.items():
+                computed[start] = HealthAnalyticsService._fold_archived(computed.get(start), logs, fields, source)
+        return computed
+    
+    @staticmethod
+    def _snapshot_buckets(snapshot, missing, bucket, fields, source):
+        """Aggregate rows of the missing buckets, scanned from a columnar snapshot"""
+        computed = {}
+        for start in missing:
+            lo, hi = snapshot.span(start, next_bucket_start(start, bucket) - timedelta(days=1))
+            if lo == hi:
+                continue
+            row = snapshot.aggregate(lo, hi, fields)
+            if source == 'health':
+                for quality, count in snapshot.choice_counts('stool_quality', lo, hi).items():
+                    row[f'stool_quality__{quality}'] = count
+            computed[start] = row
+        return computed
+    
+    @staticmethod
+    def _fold_archived(row, logs, fields, source):
+        """Add archived logs to a bucket's aggregate row, as if SQL had seen them"""
+        row = dict(row or {'count': 0})
+        row['count'] += len(logs)
+        for field in fields:
+            values = [float(getattr(log, field)) for log in logs if getattr(log, field) is not None]
+            if not values:
+                continue
+            n = row.get(f'{field}__n') or 0
+            total = (row.get(f'{field}__mean') or 0) * n + sum(values)
+            row[f'{field}__n'] = n + len(values)
+            row[f'{field}__mean'] = total / row[f'{field}__n']
+            row[f'{field}__min'] = min(v for v in (row.get(f'{field}__min'), min(values)) if v is not None)
+            row[f'{field}__max'] = max(v for v in (row.get(f'{field}__max'), max(values)) if v is not None)
+        if source == 'health':
+            for quality in HealthLog.StoolQuality.values:
+                row[f'stool_quality__{quality}'] = row.get(f'stool_quality__{quality}', 0) + sum(
+                    1 for log in logs if log.stool_quality == quality
+                )
+        return row
+    
+    @staticmethod
+    def _summarise_bucket(start, fields, source, row):
+        """Shape one aggregate row (or an empty bucket) for the API"""
+        row = row or {}
+        summary = {'bucket': str(start), 'count': row.get('count', 0)}
+        for field in fields:
+            mean = row.get(f'{field}__mean')
+            minimum = row.get(f'{field}__min')
+            maximum = row.get(f'{field}__max')
+            summary[field] = {
+                'mean': round(mean, 2) if mean is not None else None,
+                'min': float(minimum) if minimum is not None else None,
+                'max': float(maximum) if maximum is not None else None,
+            }
+        if source == 'health':
+            summary['stool_quality'] = {
+                quality: row.get(f'stool_quality__{quality}', 0)
+                for quality in HealthLog.StoolQuality.values
+            }
+        return summary
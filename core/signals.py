@@ -0,0 +1,280 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import archive, db_router
+from . import sqlite
+from .authentication import invalidate_cached_user
+from .catalog import bump_catalog_version
+from .columnar import COLUMNAR_MODELS, ColumnarSnapshotService
+from .crossmetric import CrossCorrelationService
+from .models import User, Food, HealthLog, Sleep, Meal, MealFood
+from .precompute import PrecomputeService
+from .search import SearchService
+from .symptoms import tag_logs
+from .services import invalidate_aggregate_buckets
+from .tasks import TaskQueue
+
+
+def bulk_removal(signal_kwargs):
+    """
+    True while rows are removed by the user deletion cascade or moved into the archive.
+
+    Neither changes what the user's derived data should contain.
+    """
+    origin = signal_kwargs.get('origin')
+    return archive.is_archiving() or isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """Apply the SQLite performance pragmas to every new connection when enabled"""
+    if connection.vendor == 'sqlite' and getattr(settings, 'SQLITE_PERFORMANCE_MODE', False):
+        sqlite.apply_pragmas(connection.connection, sqlite.performance_pragmas())
+
+
+@receiver(request_finished)
+def reset_database_routing(sender, **kwargs):
+    db_router.end_request()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Keep the JWT user cache in step with profile updates and deactivation"""
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def recompute_meal_days(sender, instance, created, **kwargs):
+    """Queue moving the user's meals to their days in a new time zone"""
+    changed = not created and instance.timezone_changed()
+    instance._loaded_timezone = instance.timezone
+    if changed:
+        TaskQueue.enqueue('meal_local_dates', instance.pk, {})
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def refresh_food_catalog(sender, instance, created=False, **kwargs):
+    """Cached catalog reads cover public foods, including ones that just stopped being public"""
+    if instance.is_public or not created:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=HealthLog)
+@receiver(post_delete, sender=HealthLog)
+def invalidate_health_aggregates(sender, instance, **kwargs):
+    """Recompute the cached buckets that contain a changed health log, before and after an edit"""
+    if bulk_removal(kwargs):
+        return
+    invalidate_aggregate_buckets(instance.user_id, 'health', *instance.changed_days())
+
+
+@receiver(post_save, sender=Sleep)
+@receiver(post_delete, sender=Sleep)
+def invalidate_sleep_aggregates(sender, instance, **kwargs):
+    """Recompute the cached buckets that contain a changed sleep log"""
+    if bulk_removal(kwargs):
+        return
+    invalidate_aggregate_buckets(instance.user_id, 'sleep', *instance.changed_days())
+
+
+def rolling_change(instance, rebuild):
+    return {instance._meta.model_name: {'since': str(instance.changed_days()[0]), 'rebuild': rebuild}}
+
+
+@receiver(post_save, sender=HealthLog)
+@receiver(post_save, sender=Sleep)
+def update_rolling_stats(sender, instance, created, **kwargs):
+    """Queue folding a new log into the user's rolling statistics"""
+    # Edits change a value already folded in, so the series is rebuilt
+    TaskQueue.enqueue('rolling_stats', instance.user_id, rolling_change(instance, rebuild=not created))
+
+
+@receiver(post_delete, sender=HealthLog)
+@receiver(post_delete, sender=Sleep)
+def rebuild_rolling_stats(sender, instance, **kwargs):
+    """Queue recomputing rolling statistics once a log has been removed"""
+    if bulk_removal(kwargs):
+        return
+    TaskQueue.enqueue('rolling_stats', instance.user_id, rolling_change(instance, rebuild=True))
+
+
+@receiver(post_save, sender=HealthLog)
+def train_risk_model(sender, instance, created, **kwargs):
+    """Queue folding a new health log into the user's risk model"""
+    # An edit changes an example already learnt from, so the model is retrained
+    TaskQueue.enqueue('risk_model', instance.user_id, {
+        'since': str(instance.changed_days()[0]), 'rebuild': not created,
+    })
+
+
+@receiver(post_delete, sender=HealthLog)
+def retrain_risk_model(sender, instance, **kwargs):
+    # Archived logs stay learnt
+    if bulk_removal(kwargs):
+        return
+    TaskQueue.enqueue('risk_model', instance.user_id, {'since': str(instance.changed_days()[0]), 'rebuild': True})
+
+
+def risk_feature_change(user_id, *days):
+    """Queue relearning the health logs that the meals and sleep of days are features of"""
+    days = [day for day in days if day is not None]
+    if not days:
+        return
+    # A day already learnt from retrains the model; a later one is picked up with its health log
+    TaskQueue.enqueue('risk_model', user_id, {'since': str(min(days) + timedelta(days=1)), 'rebuild': False})
+
+
+@receiver(post_save, sender=Sleep)
+@receiver(post_delete, sender=Sleep)
+def update_risk_features_sleep(sender, instance, **kwargs):
+    if bulk_removal(kwargs):
+        return
+    risk_feature_change(instance.user_id, *instance.changed_days())
+
+
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+def update_risk_features_meal(sender, instance, **kwargs):
+    if bulk_removal(kwargs):
+        return
+    risk_feature_change(instance.user_id, *instance.changed_days())
+
+
+@receiver(post_save, sender=MealFood)
+@receiver(post_delete, sender=MealFood)
+def update_risk_features_meal_food(sender, instance, **kwargs):
+    if bulk_removal(kwargs):
+        return
+    try:
+        meal = instance.meal
+    except Meal.DoesNotExist:
+        return
+    risk_feature_change(meal.user_id, meal.local_date)
+
+
+@receiver(post_delete, sender=User)
+def remove_columnar_snapshots(sender, instance, **kwargs):
+    ColumnarSnapshotService.remove_user(instance.pk)
+
+
+@receiver(post_save, sender=HealthLog)
+@receiver(post_delete, sender=HealthLog)
+@receiver(post_save, sender=Sleep)
+@receiver(post_delete, sender=Sleep)
+def refresh_columnar_snapshot(sender, instance, **kwargs):
+    """Stop reading a user's columnar snapshot until it includes this write"""
+    table_name = COLUMNAR_MODELS[sender]
+    # Archived rows stay in the snapshot, so moving them changes nothing
+    if bulk_removal(kwargs) or not ColumnarSnapshotService.exists(instance.user_id, table_name):
+        return
+    ColumnarSnapshotService.mark_stale(instance.user_id, table_name)
+    # New logs are appended; edits and deletions rebuild the snapshot
+    TaskQueue.enqueue('columnar_snapshots', instance.user_id, {
+        table_name: {'since': str(instance.changed_days()[0]), 'rebuild': not kwargs.get('created', False)}
+    })
+
+
+@receiver(post_save, sender=HealthLog)
+@receiver(post_save, sender=Sleep)
+@receiver(post_save, sender=Meal)
+@receiver(post_save, sender=MealFood)
+def index_text(sender, instance, **kwargs):
+    """Queue the search document of a saved row and, for health logs, its symptom tags"""
+    user_id = instance.meal.user_id if sender is MealFood else instance.user_id
+    TaskQueue.enqueue('text_index', user_id, {sender._meta.model_name: [instance.pk]})
+
+
+@receiver(post_delete, sender=HealthLog)
+@receiver(post_delete, sender=Sleep)
+@receiver(post_delete, sender=Meal)
+@receiver(post_delete, sender=MealFood)
+def remove_search_document(sender, instance, **kwargs):
+    # Archived entries stay searchable; a deleted user's documents go with the user
+    if bulk_removal(kwargs):
+        return
+    SearchService.remove(instance)
+
+
+def invalidate_precomputed(user_id, *days):
+    # Stale snapshots must not be served, so they go right away; summaries are rebuilt by the worker
+    PrecomputeService.invalidate_user(user_id)
+    # None for meals that backfill_meal_local_dates has not reached yet
+    dates = sorted({str(day) for day in days if day is not None})
+    if dates:
+        TaskQueue.enqueue('daily_summaries', user_id, {'dates': dates})
+
+
+def bulk_created(model, user_id, days):
+    """
+    Derived-data updates for one user's rows of model written with bulk_create.
+
+    bulk_create sends no post_save, so importers call this once with the
+    days of every row they wrote instead.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    invalidate_precomputed(user_id, *days)
+    SearchService.index_days(model, user_id, days)
+    # Imports of days after the ones learnt from are folded in; earlier ones retrain
+    if model is HealthLog:
+        TaskQueue.enqueue('risk_model', user_id, {'since': str(days[0]), 'rebuild': False})
+    else:
+        risk_feature_change(user_id, days[0])
+    if model is Meal:
+        return
+    if model is HealthLog:
+        tag_logs(
+            HealthLog.objects.filter(user_id=user_id, date__gte=days[0], date__lte=days[-1])
+            .values_list('id', 'symptoms')
+        )
+
+    invalidate_aggregate_buckets(user_id, 'health' if model is HealthLog else 'sleep', *days)
+    CrossCorrelationService.invalidate_user(user_id)
+    # Rows may land before values already folded in, so the series is rebuilt
+    change = {'since': str(days[0]), 'rebuild': True}
+    TaskQueue.enqueue('rolling_stats', user_id, {model._meta.model_name: change})
+    table_name = COLUMNAR_MODELS[model]
+    if ColumnarSnapshotService.exists(user_id, table_name):
+        ColumnarSnapshotService.mark_stale(user_id, table_name)
+        TaskQueue.enqueue('columnar_snapshots', user_id, {table_name: change})
+
+
+@receiver(post_save, sender=HealthLog)
+@receiver(post_delete, sender=HealthLog)
+@receiver(post_save, sender=Sleep)
+@receiver(post_delete, sender=Sleep)
+def invalidate_precomputed_logs(sender, instance, **kwargs):
+    """Stop serving precomputed analytics that no longer include every log"""
+    if bulk_removal(kwargs):
+        return
+    invalidate_precomputed(instance.user_id, *instance.changed_days())
+    CrossCorrelationService.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+def invalidate_precomputed_meals(sender, instance, **kwargs):
+    if bulk_removal(kwargs):
+        return
+    # A meal moved to another day leaves the old day's summary as well
+    invalidate_precomputed(instance.user_id, *instance.changed_days())
+
+
+@receiver(post_save, sender=MealFood)
+@receiver(post_delete, sender=MealFood)
+def invalidate_precomputed_meal_foods(sender, instance, **kwargs):
+    if bulk_removal(kwargs):
+        return
+    try:
+        meal = instance.meal
+    except Meal.DoesNotExist:
+        return
+    invalidate_precomputed(meal.user_id, meal.local_date)
@@ -0,0 +1,34 @@
+"""
+Opt-in SQLite tuning for small deployments.
+
+With SQLITE_PERFORMANCE_MODE enabled, every new SQLite connection runs the
+SQLITE_PRAGMAS. WAL lets readers and a writer proceed concurrently.
+synchronous=NORMAL only syncs at checkpoints, which is safe under WAL.
+busy_timeout makes writers from several processes wait for the lock
+instead of failing with "database is locked".
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    # First, so that the pragmas below wait for locks too
+    'busy_timeout': 5000,  # milliseconds
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # negative means KiB, so 64 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def performance_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
@@ -0,0 +1,104 @@
+"""
+Normalised symptom tags extracted from the free text of health logs.
+
+SYMPTOM_VOCABULARY maps every tag to the phrases that mean it; mentions
+negated within their clause ("no bloating") do not count. Extraction runs
+when a health log is saved, for bulk imports, and in batch through
+manage.py tag_symptoms. Tags live in the HealthLog.symptom_tags table, so
+analytics find the days with a symptom through indexed joins rather than
+by matching text. Archived logs keep only their text and are tagged when
+read.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+
+from .models import HealthLog, SymptomTag
+
+# Tag slug -> (display name, phrases as regular expressions over casefolded text)
+SYMPTOM_VOCABULARY = {
+    'bloating': ('Bloating', [r'bloat\w*', r'distend\w*', r'distension']),
+    'gas': ('Gas', [r'gas', r'gassy', r'flatulen\w*', r'fart\w*']),
+    'abdominal_pain': ('Abdominal pain', [
+        r'(?:stomach|abdominal|belly|tummy|gut) (?:pain|ache)s?', r'(?:stomach|tummy|belly) ?aches?', r'cramp\w*',
+    ]),
+    'nausea': ('Nausea', [r'nause\w*', r'queasy', r'sick to (?:my|the) stomach']),
+    'vomiting': ('Vomiting', [r'vomit\w*', r'threw up', r'throw\w* up']),
+    'heartburn': ('Heartburn', [r'heartburn', r'reflux', r'indigestion', r'gerd']),
+    'diarrhea': ('Diarrhea', [r'diarrh\w*', r'loose (?:stool|bowel)s?']),
+    'constipation': ('Constipation', [r'constipat\w*']),
+    'urgency': ('Urgency', [r'urgency', r'urgent']),
+    'belching': ('Belching', [r'burp\w*', r'belch\w*']),
+    'fatigue': ('Fatigue', [r'fatigue\w*', r'tired\w*', r'exhaust\w*', r'letharg\w*', r'low energy']),
+    'headache': ('Headache', [r'headaches?', r'migraines?']),
+    'brain_fog': ('Brain fog', [r'brain ?fog', r'foggy']),
+    'rash': ('Rash', [r'rash\w*', r'hives', r'itch\w*']),
+    'anxiety': ('Anxiety', [r'anxi\w*', r'nervous\w*']),
+    'joint_pain': ('Joint pain', [r'joint (?:pain|ache)s?', r'aching joints']),
+}
+
+SYMPTOM_PATTERNS = {
+    slug: re.compile(r'\b(?:' + '|'.join(phrases) + r')\b')
+    for slug, (_, phrases) in SYMPTOM_VOCABULARY.items()
+}
+
+NEGATIONS = {'no', 'not', 'without', 'never', 'none', 'nor', 'zero'}
+CLAUSE_BREAK = re.compile(r'[.,;:!?]|\bbut\b')
+
+
+def _negated(text, position):
+    """Whether one of the three words before position, within its clause, negates it"""
+    clause = CLAUSE_BREAK.split(text[:position])[-1]
+    return any(word in NEGATIONS or word.endswith(("n't", "n’t")) for word in clause.split()[-3:])
+
+
+def extract_symptoms(text):
+    """Slugs of the vocabulary symptoms that text mentions"""
+    text = ' '.join(unicodedata.normalize('NFKC', text or '').casefold().split())
+    found = set()
+    for slug, pattern in SYMPTOM_PATTERNS.items():
+        if any(not _negated(text, match.start()) for match in pattern.finditer(text)):
+            found.add(slug)
+    return found
+
+
+def symptom_tag_ids(slugs):
+    """Slug -> SymptomTag id, creating the rows of tags used for the first time"""
+    ids = dict(SymptomTag.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+    missing = set(slugs) - ids.keys()
+    if missing:
+        SymptomTag.objects.bulk_create(
+            [SymptomTag(slug=slug, name=SYMPTOM_VOCABULARY[slug][0]) for slug in missing], ignore_conflicts=True
+        )
+        ids.update(SymptomTag.objects.filter(slug__in=missing).values_list('slug', 'id'))
+    return ids
+
+
+def tag_logs(rows):
+    """Replace the tags of (health log id, symptoms) rows; returns the number of tags written"""
+    Tagging = HealthLog.symptom_tags.through
+    extracted = {log_id: extract_symptoms(symptoms) for log_id, symptoms in rows}
+    ids = symptom_tag_ids(set().union(*extracted.values()))
+    links = [
+        Tagging(healthlog_id=log_id, symptomtag_id=ids[slug])
+        for log_id, slugs in extracted.items()
+        for slug in slugs
+    ]
+    with transaction.atomic():
+        Tagging.objects.filter(healthlog_id__in=extracted).delete()
+        Tagging.objects.bulk_create(links)
+    return len(links)
+
+
+def tag_queryset(logs, batch_size=1000):
+    """Retag the health logs queryset in id-ordered batches; returns (logs, tags) written"""
+    tagged = tags = 0
+    last_id = 0
+    while True:
+        batch = list(logs.filter(id__gt=last_id).order_by('id').values_list('id', 'symptoms')[:batch_size])
+        if not batch:
+            return tagged, tags
+        tags += tag_logs(batch)
+        tagged += len(batch)
+        last_id = batch[-1][0]
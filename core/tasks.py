@@ -0,0 +1,239 @@
+"""
+Database-backed queue for the side effects of writes.
+
+Signal receivers enqueue tasks right after each write, so the request
+returns without doing the derived work. Writers that hold a transaction
+(importers, archival, the worker itself) enqueue inside it, so their tasks
+exist exactly when the writes commit. API views run in autocommit
+(ATOMIC_REQUESTS is off): their saves commit first and the task follows in
+its own transaction, so a crash in between leaves derived data behind until
+the next write or a rebuild. A pending task is unique per (user, kind): a burst
+of writes merges into one row through the kind's merge function and is
+processed once by the run_tasks worker. Failing tasks are retried with
+exponential backoff until TASK_QUEUE_MAX_ATTEMPTS.
+"""
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .columnar import ColumnarSnapshotService
+from .localdates import backfill
+from .models import BackgroundTask, DailySummary, HealthLog, Meal, MealFood, Sleep
+from .precompute import PrecomputeService
+from .risk import RiskModelService
+from .rolling import ROLLING_METRICS, RollingStatsService
+from .search import SearchService
+from .symptoms import tag_logs
+
+# Task kind -> (handler(user_id, payload), merge(pending_payload, new_payload))
+TASK_KINDS = {}
+
+ROLLING_MODELS = {model._meta.model_name: model for model in ROLLING_METRICS.values()}
+
+TEXT_MODELS = {model._meta.model_name: model for model in (HealthLog, Sleep, Meal, MealFood)}
+
+
+def task(kind, merge):
+    """Register a handler for a task kind"""
+    def register(handler):
+        TASK_KINDS[kind] = (handler, merge)
+        return handler
+    return register
+
+
+def merge_dated_changes(pending, new):
+    merged = dict(pending)
+    for model_name, change in new.items():
+        if model_name not in merged:
+            merged[model_name] = change
+            continue
+        current = merged[model_name]
+        merged[model_name] = {
+            'since': min(current['since'], change['since']),
+            'rebuild': current['rebuild'] or change['rebuild'],
+        }
+    return merged
+
+
+@task('rolling_stats', merge=merge_dated_changes)
+def update_rolling_stats(user_id, payload):
+    # payload: model name -> {'since': earliest changed date, 'rebuild': bool}
+    for model_name, change in payload.items():
+        RollingStatsService.update(
+            user_id, ROLLING_MODELS[model_name], since=change['since'], rebuild=change['rebuild']
+        )
+
+
+@task('risk_model', merge=lambda pending, new: {
+    'since': min(pending['since'], new['since']),
+    'rebuild': pending['rebuild'] or new['rebuild'],
+})
+def update_risk_model(user_id, payload):
+    # payload: {'since': earliest changed health log date, 'rebuild': bool}
+    RiskModelService.update(user_id, since=payload['since'], rebuild=payload['rebuild'])
+
+
+@task('columnar_snapshots', merge=merge_dated_changes)
+def refresh_columnar_snapshots(user_id, payload):
+    # payload: snapshot table -> {'since': earliest changed date, 'rebuild': bool}
+    for table_name, change in payload.items():
+        ColumnarSnapshotService.refresh(user_id, table_name, since=change['since'], rebuild=change['rebuild'])
+
+
+@task('daily_summaries', merge=lambda pending, new: {'dates': sorted(set(pending['dates']) | set(new['dates']))})
+def refresh_daily_summaries(user_id, payload):
+    PrecomputeService.refresh_summaries(user_id, payload['dates'])
+
+
+@task('text_index', merge=lambda pending, new: {
+    model_name: sorted(set(pending.get(model_name, [])) | set(new.get(model_name, [])))
+    for model_name in {*pending, *new}
+})
+def index_text(user_id, payload):
+    # payload: model name -> ids of saved rows; rows deleted since are skipped
+    for model_name, ids in payload.items():
+        rows = TEXT_MODELS[model_name].objects.filter(pk__in=ids)
+        if rows.model is HealthLog:
+            tag_logs(rows.values_list('id', 'symptoms'))
+        SearchService.index(rows)
+        if rows.model is Meal:
+            # Meal foods are filed under their meal's day, which may have moved
+            SearchService.index(MealFood.objects.filter(meal__in=rows))
+
+
+@task('meal_local_dates', merge=lambda pending, new: {})
+def recompute_meal_local_dates(user_id, payload):
+    # The user changed time zone: meals may move to another day, and with them the day summaries and search dates
+    backfill(Meal.objects.filter(user_id=user_id))
+    SearchService.index(Meal.objects.filter(user_id=user_id))
+    SearchService.index(MealFood.objects.filter(meal__user_id=user_id))
+    PrecomputeService.invalidate_user(user_id)
+    PrecomputeService.refresh_summaries(
+        user_id, list(DailySummary.objects.filter(user_id=user_id).values_list('date', flat=True))
+    )
+
+
+def backoff(attempts):
+    """Delay before retrying a task that has failed attempts times"""
+    return timedelta(seconds=getattr(settings, 'TASK_QUEUE_RETRY_DELAY', 30) * 2 ** (attempts - 1))
+
+
+class TaskQueue:
+    """Enqueue, claim and run background tasks"""
+
+    @staticmethod
+    def enqueue(kind, user_id, payload):
+        """
+        Queue a task, merging it into the user's pending task of the same kind.
+
+        With TASK_QUEUE_EAGER the handler runs immediately instead.
+        """
+        handler, merge = TASK_KINDS[kind]
+        if getattr(settings, 'TASK_QUEUE_EAGER', False):
+            handler(user_id, payload)
+            return None
+
+        # The pending row is read to be written, so even a request reading a replica looks on default
+        db = router.db_for_write(BackgroundTask)
+        with transaction.atomic(using=db):
+            pending = (
+                BackgroundTask.objects.using(db).select_for_update()
+                .filter(user_id=user_id, kind=kind, status=BackgroundTask.Status.PENDING)
+                .first()
+            )
+            if pending is not None:
+                pending.payload = merge(pending.payload, payload)
+                pending.save(update_fields=['payload'])
+                return pending
+            try:
+                with transaction.atomic(using=db):
+                    # Short delay so that a burst of writes coalesces into this row
+                    run_after = timezone.now() + timedelta(
+                        seconds=getattr(settings, 'TASK_QUEUE_COALESCE_SECONDS', 2)
+                    )
+                    return BackgroundTask.objects.using(db).create(
+                        user_id=user_id, kind=kind, payload=payload, run_after=run_after
+                    )
+            except IntegrityError:
+                # A concurrent writer created the pending task first; merge into it
+                pass
+        return TaskQueue.enqueue(kind, user_id, payload)
+
+    @staticmethod
+    def claim(limit=50):
+        """Mark up to limit due tasks as running and return them"""
+        now = timezone.now()
+        lease_expired = now - timedelta(seconds=getattr(settings, 'TASK_QUEUE_LEASE_SECONDS', 300))
+        claimable = (
+            Q(status=BackgroundTask.Status.PENDING, run_after__lte=now)
+            # Tasks left running by a worker that died
+            | Q(status=BackgroundTask.Status.RUNNING, claimed_at__lt=lease_expired)
+        )
+        candidates = list(BackgroundTask.objects.filter(claimable).values_list('id', flat=True)[:limit])
+
+        claimed = []
+        for task_id in candidates:
+            # Conditional update: only one worker wins each task
+            won = BackgroundTask.objects.filter(claimable, pk=task_id).update(
+                status=BackgroundTask.Status.RUNNING, claimed_at=now, attempts=F('attempts') + 1
+            )
+            if won:
+                claimed.append(task_id)
+        return list(BackgroundTask.objects.filter(pk__in=claimed))
+
+    @staticmethod
+    def process(task):
+        """Run a claimed task; returns True on success"""
+        try:
+            handler, _ = TASK_KINDS[task.kind]
+            with transaction.atomic():
+                handler(task.user_id, task.payload)
+        except Exception:
+            TaskQueue.fail(task, traceback.format_exc())
+            return False
+        BackgroundTask.objects.filter(pk=task.pk).delete()
+        return True
+
+    @staticmethod
+    def fail(task, error):
+        """Schedule a retry, or give up once the task has used all its attempts"""
+        if task.attempts >= getattr(settings, 'TASK_QUEUE_MAX_ATTEMPTS', 5):
+            BackgroundTask.objects.filter(pk=task.pk).update(
+                status=BackgroundTask.Status.FAILED, last_error=error
+            )
+            return
+
+        with transaction.atomic():
+            pending = (
+                BackgroundTask.objects.select_for_update()
+                .filter(user_id=task.user_id, kind=task.kind, status=BackgroundTask.Status.PENDING)
+                .first()
+            )
+            if pending is not None:
+                # Writes arrived while this task ran; their pending task now covers both
+                _, merge = TASK_KINDS[task.kind]
+                pending.payload = merge(task.payload, pending.payload)
+                pending.save(update_fields=['payload'])
+                BackgroundTask.objects.filter(pk=task.pk).delete()
+                return
+            BackgroundTask.objects.filter(pk=task.pk).update(
+                status=BackgroundTask.Status.PENDING,
+                run_after=timezone.now() + backoff(task.attempts),
+                claimed_at=None,
+                last_error=error,
+            )
+
+    @staticmethod
+    def run_pending(limit=50):
+        """Claim and run one batch of due tasks; returns (succeeded, failed)"""
+        succeeded = failed = 0
+        for task in TaskQueue.claim(limit):
+            if TaskQueue.process(task):
+                succeeded += 1
+            else:
+                failed += 1
+        return succeeded, failed
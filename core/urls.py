@@ -14,6 +14,14 @@ from .views import (
     AnalyticsViewSet,
     UserView,
     ExportViewSet,
+    CompressionStatsView,
+    DiaryImportView,
+    DiarySearchView,
+    PatientGrantViewSet,
+    ClinicianPatientViewSet,
+    ClinicianHealthLogViewSet,
+    ClinicianSleepViewSet,
+    ClinicianMealViewSet,
 )
 
 router = DefaultRouter()
@@ -23,6 +31,11 @@ router.register(r'health-logs', HealthLogViewSet, basename='healthlog')
 router.register(r'sleep', SleepViewSet, basename='sleep')
 router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 router.register(r'export', ExportViewSet, basename='export')
+router.register(r'grants', PatientGrantViewSet, basename='grant')
+router.register(r'clinician/patients', ClinicianPatientViewSet, basename='clinician-patient')
+router.register(r'clinician/health-logs', ClinicianHealthLogViewSet, basename='clinician-healthlog')
+router.register(r'clinician/sleep', ClinicianSleepViewSet, basename='clinician-sleep')
+router.register(r'clinician/meals', ClinicianMealViewSet, basename='clinician-meal')
 
 urlpatterns = [
     # Authentication endpoints
@@ -55,4 +68,13 @@ urlpatterns = [
     path('export/health-data/', ExportViewSet.as_view({'get': 'health_data'}), name='export-health-data'),
     path('export/meal-data/', ExportViewSet.as_view({'get': 'meal_data'}), name='export-meal-data'),
     path('export/all-data/', ExportViewSet.as_view({'get': 'all_data'}), name='export-all-data'),
+    
+    # Bulk import
+    path('import/<str:kind>/', DiaryImportView.as_view(), name='diary-import'),
+    
+    # Full-text search
+    path('search/', DiarySearchView.as_view(), name='diary-search'),
+    
+    # Operational metrics
+    path('metrics/compression/', CompressionStatsView.as_view(), name='compression-stats'),
 ] 
\ No newline at end of file
@@ -1,17 +1,29 @@
+import hashlib
+import json
+
 from django.shortcuts import render
 from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
+from django.db.models import Avg, Case, Count, DateField, F, FloatField, Max, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from django.utils import timezone
 from rest_framework import generics, filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny, SAFE_METHODS
+from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 
-from .models import Profile, Food, Meal, MealFood, HealthLog, Sleep
+from .models import (
+    Profile, Food, Meal, MealFood, HealthLog, Sleep, PatientGrant, DailySummary, AnalyticsSnapshot,
+    ArchiveBlob, local_date, normalize_barcode,
+)
 from .serializers import (
     UserSerializer, 
     ProfileSerializer, 
@@ -20,8 +32,26 @@ from .serializers import (
     HealthLogSerializer, 
     SleepSerializer,
     RegisterSerializer,
+    PatientGrantSerializer,
+    PatientOverviewSerializer,
+    DailySummarySerializer,
+    values_serializer,
 )
 from .services import HealthAnalyticsService
+from .rolling import RollingStatsService
+from .risk import RiskModelService
+from .cohort import CohortAnalyticsEngine
+from .permissions import IsMedicalProfessional
+from .precompute import PrecomputeService
+from .db_router import route_reads
+from .archive import ArchiveService
+from .catalog import catalog_cache_key
+from .columnar import ColumnarSnapshotService
+from .crossmetric import CrossCorrelationService
+from .importer import IMPORT_FORMATS, IMPORT_KINDS, READERS, DiaryImporter
+from .search import SearchService
+from .symptoms import SYMPTOM_VOCABULARY
+from .middleware import compression_stats
 
 User = get_user_model()
 
@@ -65,6 +95,12 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         parameters=[
             OpenApiParameter(name="query", description="Search query", required=True, type=str),
         ]
+    ),
+    by_code=extend_schema(
+        description="Look up a food by barcode (EAN-8, UPC-A, EAN-13, GTIN-14) or external identifier",
+        parameters=[
+            OpenApiParameter(name="code", description="Barcode or external identifier", location=OpenApiParameter.PATH, type=str),
+        ]
     )
 )
 class FoodViewSet(viewsets.ModelViewSet):
@@ -90,9 +126,158 @@ class FoodViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        foods = self.get_queryset().filter(name__icontains=query)
-        serializer = self.get_serializer(foods, many=True)
-        return Response(serializer.data)
+        # Public matches are shared by every user until the catalog changes
+        public_key = catalog_cache_key('search', hashlib.md5(query.lower().encode()).hexdigest())
+        public = cache.get_or_set(
+            public_key,
+            lambda: list(self.get_serializer(Food.objects.filter(is_public=True, name__icontains=query), many=True).data),
+            getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600)
+        )
+        private = Food.objects.filter(user=request.user, is_public=False, name__icontains=query)
+        return Response(public + self.get_serializer(private, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path=r'by-code/(?P<code>[^/]+)')
+    def by_code(self, request, code):
+        """Food with a barcode or external identifier, for scan-to-log"""
+        code = code.strip()
+        lookup = Q(external_id=code)
+        try:
+            lookup |= Q(barcode=normalize_barcode(code))
+        except DjangoValidationError:
+            pass
+        # One indexed query; the user's own food wins over the public one, so that a personal entry can
+        # correct the catalog. A cached copy would cost more round-trips than it saves.
+        food = (
+            self.get_queryset().filter(lookup)
+            .order_by(Case(When(user=request.user, then=0), default=1), 'pk')
+            .first()
+        )
+        if food is None:
+            return Response({"error": "No food with this code"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(food).data)
+
+def local_today(user):
+    """Today in the user's time zone, the day their meals and summaries are filed under"""
+    return local_date(timezone.now(), user.timezone)
+
+def parse_date(value, default=None):
+    """Parse a YYYY-MM-DD string, raising ValueError on bad input"""
+    if not value:
+        return default
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def month_end(start_date):
+    """Return the last day of the month containing start_date"""
+    if start_date.month == 12:
+        return start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
+    return start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
+
+INVALID_DATE_RESPONSE = {"error": "Invalid date format. Use YYYY-MM-DD"}
+
+BUCKET_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+class ReadReplicaMixin:
+    """Serve safe requests from the database configured for `read_route`"""
+    read_route = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            route_reads(self.read_route, request.user)
+
+class ValuesListMixin:
+    """
+    GET lists rendered from values_list rows by the serializer's ValuesSerializer.
+
+    The output is that of the serializer class; writes and single objects
+    still go through it.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fast = values_serializer(self.get_serializer_class())
+        rows = fast.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.represent(page))
+        return Response(fast.represent(rows))
+
+class DateRangeMixin:
+    """
+    Shared date-window queries for resources keyed by a date.
+
+    Subclasses set `date_field` (the model field holding the calendar day),
+    optionally `window_ordering` for rows within a window, plus
+    `range_aggregates` used when a bucket is requested.
+    """
+    date_field = 'date'
+    window_ordering = None
+    range_aggregates = {}
+
+    def filter_date_range(self, queryset, start_date, end_date):
+        return queryset.filter(**{
+            f'{self.date_field}__gte': start_date,
+            f'{self.date_field}__lte': end_date,
+        }).order_by(*(self.window_ordering or [self.date_field]))
+
+    def window_response(self, start_date, end_date):
+        rows = self.filter_date_range(self.get_queryset(), start_date, end_date)
+        return Response(values_serializer(self.get_serializer_class()).data(rows))
+
+    @extend_schema(
+        description="Get entries between two dates, optionally aggregated into day, week or month buckets",
+        parameters=[
+            OpenApiParameter(name="from", description="Start date in YYYY-MM-DD format (default: 29 days before 'to'); raw windows span at most DATE_RANGE_MAX_DAYS", required=False, type=str),
+            OpenApiParameter(name="to", description="End date in YYYY-MM-DD format (default: today)", required=False, type=str),
+            OpenApiParameter(name="bucket", description="Aggregate into buckets: day, week or month", required=False, type=str),
+        ]
+    )
+    @action(detail=False, methods=['get'], url_path='range', url_name='range')
+    def date_range(self, request):
+        """Get raw or bucketed entries for an arbitrary date window"""
+        try:
+            end_date = parse_date(request.query_params.get('to'), local_today(request.user))
+            start_date = parse_date(request.query_params.get('from'), end_date - timedelta(days=29))
+        except ValueError:
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+
+        if start_date > end_date:
+            return Response(
+                {"error": "'from' must not be after 'to'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        bucket = request.query_params.get('bucket')
+        if not bucket:
+            # Raw rows grow with the window, buckets only with the number of buckets
+            max_days = getattr(settings, 'DATE_RANGE_MAX_DAYS', 366)
+            if (end_date - start_date).days >= max_days:
+                return Response(
+                    {"error": f"Raw windows span at most {max_days} days; use bucket for longer ones"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self.window_response(start_date, end_date)
+
+        if bucket not in BUCKET_FUNCTIONS:
+            return Response(
+                {"error": "Invalid bucket. Use one of: day, week, month"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # One GROUP BY query over the whole window
+        buckets = (
+            self.filter_date_range(self.get_queryset(), start_date, end_date)
+            .annotate(bucket=BUCKET_FUNCTIONS[bucket](self.date_field, output_field=DateField()))
+            .values('bucket')
+            .annotate(**self.range_aggregates)
+            .order_by('bucket')
+        )
+        return Response([
+            dict(row, bucket=str(row['bucket'])) for row in buckets
+        ])
 
 @extend_schema_view(
     daily=extend_schema(
@@ -108,77 +293,38 @@ class FoodViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class MealViewSet(viewsets.ModelViewSet):
+class MealViewSet(ValuesListMixin, DateRangeMixin, viewsets.ModelViewSet):
     """API endpoint for meals"""
     serializer_class = MealSerializer
     permission_classes = [IsAuthenticated]
+    date_field = 'local_date'
+    window_ordering = ['date_time']
+    range_aggregates = {
+        'meal_count': Count('id', distinct=True),
+        'food_count': Count('mealfood'),
+    }
     
     def get_queryset(self):
         """Return meals for the current user"""
-        return Meal.objects.filter(user=self.request.user)
+        return Meal.objects.filter(user=self.request.user).prefetch_related('mealfood_set__food')
     
     @action(detail=False, methods=['get'])
     def daily(self, request, date=None):
         """Get meals for a specific day"""
         try:
-            if date:
-                target_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                target_date = timezone.now().date()
-                
-            meals = self.get_queryset().filter(
-                date_time__date=target_date
-            ).order_by('date_time')
-            
-            serializer = self.get_serializer(meals, many=True)
-            return Response(serializer.data)
+            target_date = parse_date(date, local_today(request.user))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(target_date, target_date)
     
     @action(detail=False, methods=['get'])
     def weekly(self, request, date=None):
         """Get meals for a week starting at a specific date"""
         try:
-            if date:
-                start_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                start_date = timezone.now().date()
-                
-            end_date = start_date + timedelta(days=6)
-            
-            # Debug logging to understand the date range
-            print(f"Weekly meals query: start_date={start_date}, end_date={end_date}")
-            
-            # Get all meals within date range
-            meals = self.get_queryset().filter(
-                date_time__date__gte=start_date,
-                date_time__date__lte=end_date
-            ).order_by('date_time')
-            
-            # Debug counts
-            print(f"Found {meals.count()} meals in date range")
-            
-            # Print meals details for debugging
-            for meal in meals:
-                print(f"Meal: {meal.id}, date: {meal.date_time.date()}, type: {meal.meal_type}")
-            
-            # List ALL meals
-            all_meals = self.get_queryset()
-            print(f"Total meals in database: {all_meals.count()}")
-            if all_meals.count() > 0:
-                for meal in all_meals:
-                    print(f"ALL Meal: {meal.id}, date: {meal.date_time.date()}, type: {meal.meal_type}")
-            
-            serializer = self.get_serializer(meals, many=True)
-            return Response(serializer.data)
+            start_date = parse_date(date, local_today(request.user))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(start_date, start_date + timedelta(days=6))
 
 @extend_schema_view(
     daily=extend_schema(
@@ -200,10 +346,17 @@ class MealViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class HealthLogViewSet(viewsets.ModelViewSet):
+class HealthLogViewSet(ValuesListMixin, DateRangeMixin, viewsets.ModelViewSet):
     """API endpoint for health logs"""
     serializer_class = HealthLogSerializer
     permission_classes = [IsAuthenticated]
+    range_aggregates = {
+        'count': Count('id'),
+        'avg_physical_feeling': Avg('physical_feeling', output_field=FloatField()),
+        'avg_mental_feeling': Avg('mental_feeling', output_field=FloatField()),
+        'avg_weight': Avg('weight', output_field=FloatField()),
+        'total_stool_count': Sum('stool_count'),
+    }
     
     def get_queryset(self):
         """Return health logs for the current user"""
@@ -213,77 +366,37 @@ class HealthLogViewSet(viewsets.ModelViewSet):
     def daily(self, request, date=None):
         """Get health log for a specific day"""
         try:
-            if date:
-                target_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                target_date = timezone.now().date()
-                
-            try:
-                health_log = self.get_queryset().get(date=target_date)
-                serializer = self.get_serializer(health_log)
-                return Response(serializer.data)
-            except HealthLog.DoesNotExist:
-                return Response(
-                    {"detail": "No health log found for this date"}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
+            target_date = parse_date(date, local_today(request.user))
         except ValueError:
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+            
+        try:
+            health_log = self.get_queryset().get(date=target_date)
+            serializer = self.get_serializer(health_log)
+            return Response(serializer.data)
+        except HealthLog.DoesNotExist:
             return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {"detail": "No health log found for this date"}, 
+                status=status.HTTP_404_NOT_FOUND
             )
     
     @action(detail=False, methods=['get'])
     def weekly(self, request, date=None):
         """Get health logs for a week starting at a specific date"""
         try:
-            if date:
-                start_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                start_date = timezone.now().date()
-                
-            end_date = start_date + timedelta(days=6)
-            
-            health_logs = self.get_queryset().filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).order_by('date')
-            
-            serializer = self.get_serializer(health_logs, many=True)
-            return Response(serializer.data)
+            start_date = parse_date(date, local_today(request.user))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(start_date, start_date + timedelta(days=6))
     
     @action(detail=False, methods=['get'])
     def monthly(self, request, date=None):
         """Get health logs for a month starting at a specific date"""
         try:
-            if date:
-                start_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                start_date = timezone.now().date().replace(day=1)
-                
-            # Calculate end of month
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
-            
-            health_logs = self.get_queryset().filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).order_by('date')
-            
-            serializer = self.get_serializer(health_logs, many=True)
-            return Response(serializer.data)
+            start_date = parse_date(date, local_today(request.user).replace(day=1))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(start_date, month_end(start_date))
 
 @extend_schema_view(
     weekly=extend_schema(
@@ -299,10 +412,17 @@ class HealthLogViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class SleepViewSet(viewsets.ModelViewSet):
+class SleepViewSet(ValuesListMixin, DateRangeMixin, viewsets.ModelViewSet):
     """API endpoint for sleep logs"""
     serializer_class = SleepSerializer
     permission_classes = [IsAuthenticated]
+    range_aggregates = {
+        'count': Count('id'),
+        'avg_duration': Avg('duration', output_field=FloatField()),
+        'avg_quality': Avg('quality', output_field=FloatField()),
+        'avg_wake_up_ease': Avg('wake_up_ease', output_field=FloatField()),
+        'avg_energy_level': Avg('energy_level', output_field=FloatField()),
+    }
     
     def get_queryset(self):
         """Return sleep logs for the current user"""
@@ -312,111 +432,207 @@ class SleepViewSet(viewsets.ModelViewSet):
     def weekly(self, request, date=None):
         """Get sleep logs for a week starting at a specific date"""
         try:
-            if date:
-                start_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                start_date = timezone.now().date()
-                
-            end_date = start_date + timedelta(days=6)
-            
-            sleep_logs = self.get_queryset().filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).order_by('date')
-            
-            serializer = self.get_serializer(sleep_logs, many=True)
-            return Response(serializer.data)
+            start_date = parse_date(date, local_today(request.user))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(start_date, start_date + timedelta(days=6))
     
     @action(detail=False, methods=['get'])
     def monthly(self, request, date=None):
         """Get sleep logs for a month starting at a specific date"""
         try:
-            if date:
-                start_date = datetime.strptime(date, "%Y-%m-%d").date()
-            else:
-                start_date = timezone.now().date().replace(day=1)
-                
-            # Calculate end of month
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
-            
-            sleep_logs = self.get_queryset().filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).order_by('date')
-            
-            serializer = self.get_serializer(sleep_logs, many=True)
-            return Response(serializer.data)
+            start_date = parse_date(date, local_today(request.user).replace(day=1))
         except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response(INVALID_DATE_RESPONSE, status=status.HTTP_400_BAD_REQUEST)
+        return self.window_response(start_date, month_end(start_date))
 
-class AnalyticsViewSet(viewsets.ViewSet):
+class AnalyticsViewSet(ReadReplicaMixin, viewsets.ViewSet):
     """API endpoints for analytics and insights"""
     permission_classes = [IsAuthenticated]
+    read_route = 'analytics'
+    
+    def precomputed_or_live(self, kind, days, compute):
+        """Serve tonight's precomputed snapshot when it covers this window"""
+        payload = PrecomputeService.get_snapshot(self.request.user, kind, days)
+        if payload is None:
+            payload = compute(self.request.user, days)
+        return Response(payload)
     
     @action(detail=False, methods=['get'])
     def health_trends(self, request):
         """Get health trends over time"""
         days = int(request.query_params.get('days', 30))
-        user = request.user
-        
-        # Debug logging
-        print(f"Fetching health trends for user {user.id} for the last {days} days")
-        
-        # Get the date range
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days)
-        print(f"Date range: {start_date} to {end_date}")
-        
-        # Check if there are any health logs
-        health_logs_count = HealthLog.objects.filter(user=user).count()
-        print(f"Total health logs for user: {health_logs_count}")
-        
-        # Check for health logs in the date range
-        health_logs_in_range = HealthLog.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).count()
-        print(f"Health logs in date range: {health_logs_in_range}")
-        
-        # Get trends
-        trends = HealthAnalyticsService.get_health_trends(user, days)
-        print(f"Trends: {trends}")
-        
-        return Response(trends)
+        return self.precomputed_or_live(
+            AnalyticsSnapshot.Kind.HEALTH_TRENDS, days, HealthAnalyticsService.get_health_trends
+        )
     
     @action(detail=False, methods=['get'])
     def food_correlations(self, request):
         """Analyze correlation between foods and health metrics"""
         days = int(request.query_params.get('days', 30))
-        correlations = HealthAnalyticsService.get_food_correlations(request.user, days)
-        return Response(correlations)
+        return self.precomputed_or_live(
+            AnalyticsSnapshot.Kind.FOOD_CORRELATIONS, days, HealthAnalyticsService.get_food_correlations
+        )
     
     @action(detail=False, methods=['get'])
     def sleep_analysis(self, request):
         """Analyze sleep patterns"""
         days = int(request.query_params.get('days', 30))
-        analysis = HealthAnalyticsService.analyze_sleep(request.user, days)
-        return Response(analysis)
+        return self.precomputed_or_live(
+            AnalyticsSnapshot.Kind.SLEEP_ANALYSIS, days, HealthAnalyticsService.analyze_sleep
+        )
     
+    @extend_schema(
+        description="Foods most often eaten the day before a symptom, or before a bad day when no symptom is given",
+        parameters=[
+            OpenApiParameter(name="days", description="Number of days to analyse (default: 60)", required=False, type=int),
+            OpenApiParameter(name="symptom", description="Symptom tag, e.g. bloating", required=False, type=str),
+        ]
+    )
     @action(detail=False, methods=['get'])
     def symptoms_triggers(self, request):
         """Identify potential food triggers for symptoms"""
         days = int(request.query_params.get('days', 60))
-        triggers = HealthAnalyticsService.identify_symptom_triggers(request.user, days)
-        return Response(triggers)
+        symptom = request.query_params.get('symptom')
+        if symptom is None:
+            return self.precomputed_or_live(
+                AnalyticsSnapshot.Kind.SYMPTOM_TRIGGERS, days, HealthAnalyticsService.identify_symptom_triggers
+            )
+        if symptom not in SYMPTOM_VOCABULARY:
+            return Response(
+                {"error": f"Unknown symptom. Use one of: {', '.join(SYMPTOM_VOCABULARY)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(HealthAnalyticsService.identify_symptom_triggers(request.user, days, symptom))
+    
+    @extend_schema(
+        description="Number of days with each normalised symptom tag, most frequent first",
+        parameters=[
+            OpenApiParameter(name="days", description="Number of days to count (default: 30)", required=False, type=int),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def symptoms(self, request):
+        """Count symptom tags over time"""
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 3650:
+            return Response({"error": "days must be between 1 and 3650"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(HealthAnalyticsService.get_symptom_counts(request.user, days))
+    
+    @extend_schema(
+        description=(
+            "Pearson correlation matrices between sleep metrics (rows) and health metrics (columns), "
+            "pairing the sleep of each day with the health log `lag` days later"
+        ),
+        parameters=[
+            OpenApiParameter(name="days", description="Window length in days (default: 90)", required=False, type=int),
+            OpenApiParameter(name="lags", description="Comma-separated lags in days (default: 0,1)", required=False, type=str),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def sleep_health_correlations(self, request):
+        """Correlate sleep with same-day and following-day health metrics"""
+        max_lag = getattr(settings, 'CROSS_CORRELATION_MAX_LAG', 7)
+        try:
+            days = int(request.query_params.get('days', 90))
+            lags = request.query_params.get('lags')
+            lags = [int(lag) for lag in lags.split(',')] if lags else None
+        except ValueError:
+            return Response({"error": "days and lags must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 3 <= days <= 3650:
+            return Response({"error": "days must be between 3 and 3650"}, status=status.HTTP_400_BAD_REQUEST)
+        if lags is not None and not all(0 <= lag <= max_lag for lag in lags):
+            return Response({"error": f"lags must be between 0 and {max_lag}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(CrossCorrelationService.get(request.user, days, lags))
+    
+    @extend_schema(
+        description="Precomputed daily summaries of health, sleep and meal logs",
+        parameters=[
+            OpenApiParameter(name="days", description="Number of days to return (default: 30)", required=False, type=int),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def summaries(self, request):
+        """Get the nightly per-day summaries for the current user"""
+        days = int(request.query_params.get('days', 30))
+        start_date = local_today(request.user) - timedelta(days=days)
+        summaries = DailySummary.objects.filter(user=request.user, date__gte=start_date)
+        serializer = DailySummarySerializer(summaries, many=True)
+        return Response(serializer.data)
+        
+    @extend_schema(
+        description="Weekly or monthly mean/min/max/count summaries of health and sleep metrics",
+        parameters=[
+            OpenApiParameter(name="bucket", description="Bucket size: week or month (default: week)", required=False, type=str),
+            OpenApiParameter(name="count", description="Number of buckets ending with the current one (default: 12, max: 120)", required=False, type=int),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def aggregates(self, request):
+        """Get server-side bucketed aggregates of health and sleep logs"""
+        bucket = request.query_params.get('bucket', 'week')
+        if bucket not in ('week', 'month'):
+            return Response(
+                {"error": "Invalid bucket. Use one of: week, month"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            count = int(request.query_params.get('count', 12))
+        except ValueError:
+            count = 0
+        if not 1 <= count <= 120:
+            return Response(
+                {"error": "count must be an integer between 1 and 120"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'bucket': bucket,
+            'health': HealthAnalyticsService.get_bucketed_aggregates(request.user, 'health', bucket, count),
+            'sleep': HealthAnalyticsService.get_bucketed_aggregates(request.user, 'sleep', bucket, count),
+        })
+        
+    @extend_schema(
+        description="Rolling mean, standard deviation and z-score anomaly flags for key health and sleep metrics",
+        parameters=[
+            OpenApiParameter(name="threshold", description="Absolute z-score at which the latest value is flagged (default: 2.5)", required=False, type=float),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def anomalies(self, request):
+        """Detect sudden changes in health and sleep metrics"""
+        threshold = request.query_params.get('threshold')
+        try:
+            threshold = float(threshold) if threshold is not None else None
+        except ValueError:
+            return Response(
+                {"error": "threshold must be a number"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(RollingStatsService.get_anomalies(request.user, threshold))
+        
+    @extend_schema(
+        description=(
+            "Probability that tomorrow is a bad day (physical feeling 2 or lower), from the user's "
+            "model of today's foods, meal times and last night's sleep, with each factor's weight"
+        )
+    )
+    @action(detail=False, methods=['get'])
+    def risk(self, request):
+        """Score today's meals with the user's bad-day risk model"""
+        return Response(RiskModelService.score(request.user))
         
+    @extend_schema(
+        description="Cohort distributions and correlations across patients (medical professionals only)",
+        parameters=[
+            OpenApiParameter(name="patients", description="Comma-separated patient ids (default: all granted patients)", required=False, type=str),
+            OpenApiParameter(name="days", description="Window length in days, clamped to 3-3650 (default: 90)", required=False, type=int),
+            OpenApiParameter(name="stream", description="Stream partial results as NDJSON, one line per processed chunk", required=False, type=bool),
+        ]
+    )
     @action(detail=False, methods=['get'])
     def detailed_analysis(self, request):
         """Detailed health analysis (only for medical professionals)"""
@@ -426,9 +642,149 @@ class AnalyticsViewSet(viewsets.ViewSet):
                 {"detail": "You don't have permission to access this resource."},
                 status=status.HTTP_403_FORBIDDEN
             )
-            
-        # Advanced analytics for medical professionals would go here
-        return Response({"detail": "Detailed analysis available"})
+        
+        try:
+            days = int(request.query_params.get('days', 90))
+            patients = request.query_params.get('patients')
+            # Cohorts are limited to patients who granted this clinician access
+            patient_ids = PatientGrant.objects.filter(clinician=user).values_list('patient_id', flat=True)
+            if patients:
+                patient_ids = patient_ids.filter(
+                    patient_id__in=[int(patient_id) for patient_id in patients.split(',') if patient_id]
+                )
+        except ValueError:
+            days = 0
+        if days < 1:
+            return Response(
+                {"error": "days must be a positive integer and patients a list of ids"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Windows beyond ten years overflow date arithmetic
+        days = min(max(days, 3), 3650)
+        
+        engine = CohortAnalyticsEngine(patient_ids, days=days)
+        if request.query_params.get('stream', '').lower() in ('1', 'true'):
+            lines = (json.dumps(snapshot) + '\n' for snapshot in engine.run())
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        
+        *_, result = engine.run()
+        return Response(result)
+
+class PatientGrantViewSet(viewsets.ModelViewSet):
+    """API endpoint for patients to grant or revoke clinician access"""
+    serializer_class = PatientGrantSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    
+    def get_queryset(self):
+        """Return grants given by or to the current user"""
+        user = self.request.user
+        return PatientGrant.objects.filter(
+            Q(patient=user) | Q(clinician=user)
+        ).select_related('clinician')
+
+@extend_schema_view(
+    list=extend_schema(
+        description="Triage overview of all granted patients, most concerning first",
+        parameters=[
+            OpenApiParameter(name="days", description="Window for the triage metrics in days (default: 7)", required=False, type=int),
+        ]
+    )
+)
+class ClinicianPatientViewSet(viewsets.ReadOnlyModelViewSet):
+    """API endpoint for clinicians to review the patients who granted them access"""
+    serializer_class = PatientOverviewSerializer
+    permission_classes = [IsAuthenticated, IsMedicalProfessional]
+    
+    def get_queryset(self):
+        """Granted patients annotated with triage metrics in a single query"""
+        try:
+            days = max(int(self.request.query_params.get('days', 7)), 1)
+        except ValueError:
+            days = 7
+        window_start = local_today(self.request.user) - timedelta(days=days - 1)
+        in_window = Q(health_logs__date__gte=window_start)
+        
+        sleep_average = (
+            Sleep.objects.filter(user=OuterRef('pk'), date__gte=window_start)
+            .values('user')
+            .annotate(average=Avg('duration', output_field=FloatField()))
+            .values('average')
+        )
+        return (
+            User.objects.filter(clinician_grants__clinician=self.request.user)
+            .annotate(
+                last_log_date=Max('health_logs__date'),
+                logs_in_window=Count('health_logs', filter=in_window),
+                bad_days=Count('health_logs', filter=in_window & Q(health_logs__physical_feeling__lte=2)),
+                avg_physical_feeling=Avg('health_logs__physical_feeling', filter=in_window, output_field=FloatField()),
+                avg_mental_feeling=Avg('health_logs__mental_feeling', filter=in_window, output_field=FloatField()),
+                avg_sleep_duration=Subquery(sleep_average, output_field=FloatField()),
+            )
+            .order_by('-bad_days', F('avg_physical_feeling').asc(nulls_last=True), 'username')
+        )
+
+class ClinicianScopedMixin:
+    """
+    Read-only access to the logs of every patient who granted the clinician access.
+    
+    Rows are selected with a subquery on the (clinician, patient) grant index, so
+    a page spanning many patients is still one query; ?patient=<id> narrows it.
+    """
+    permission_classes = [IsAuthenticated, IsMedicalProfessional]
+    model = None
+    ordering = ('-date', 'user_id')
+    
+    def get_queryset(self):
+        patient_ids = PatientGrant.objects.filter(clinician=self.request.user).values('patient_id')
+        queryset = self.model.objects.filter(user_id__in=patient_ids).order_by(*self.ordering)
+        
+        patient = self.request.query_params.get('patient')
+        if patient is not None:
+            if not patient.isdigit():
+                return queryset.none()
+            queryset = queryset.filter(user_id=patient)
+        return queryset
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(name="patient", description="Only show this patient's logs", required=False, type=int),
+        ]
+    )
+)
+class ClinicianHealthLogViewSet(ValuesListMixin, ClinicianScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint for clinicians to page through patients' health logs"""
+    serializer_class = HealthLogSerializer
+    model = HealthLog
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(name="patient", description="Only show this patient's logs", required=False, type=int),
+        ]
+    )
+)
+class ClinicianSleepViewSet(ValuesListMixin, ClinicianScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint for clinicians to page through patients' sleep logs"""
+    serializer_class = SleepSerializer
+    model = Sleep
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(name="patient", description="Only show this patient's meals", required=False, type=int),
+        ]
+    )
+)
+class ClinicianMealViewSet(ValuesListMixin, ClinicianScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint for clinicians to page through patients' meals"""
+    serializer_class = MealSerializer
+    model = Meal
+    ordering = ('-date_time', 'user_id')
+    
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related('mealfood_set__food')
 
 class UserView(generics.RetrieveUpdateDestroyAPIView):
     """API endpoint for user account management"""
@@ -436,7 +792,8 @@ class UserView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        # request.user only carries the cached authentication fields
+        return User.objects.get(pk=self.request.user.pk)
     
     def destroy(self, request, *args, **kwargs):
         user = self.get_object()
@@ -444,52 +801,126 @@ class UserView(generics.RetrieveUpdateDestroyAPIView):
         user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class ExportViewSet(viewsets.ViewSet):
+class ExportViewSet(ReadReplicaMixin, viewsets.ViewSet):
     """API endpoints for data export"""
     permission_classes = [IsAuthenticated]
+    read_route = 'export'
+    
+    # Snapshot table -> archive kind of the same logs
+    LOG_ARCHIVES = {
+        'health_logs': ArchiveBlob.Kind.HEALTH_LOGS,
+        'sleep': ArchiveBlob.Kind.SLEEP,
+    }
+    
+    def export_logs(self, user, table_name, serializer_class):
+        """Every health or sleep log of user, newest first, from the columnar snapshot when it is fresh"""
+        snapshot = ColumnarSnapshotService.open(user.pk, table_name)
+        if snapshot is not None:
+            return snapshot.representation(user.pk)
+        logs = serializer_class.Meta.model.objects.filter(user=user)
+        return values_serializer(serializer_class).data(logs) + ArchiveService.read(user, self.LOG_ARCHIVES[table_name])
     
     @action(detail=False, methods=['get'])
     def health_data(self, request):
         """Export health log data to JSON"""
-        health_logs = HealthLog.objects.filter(user=request.user)
-        serializer = HealthLogSerializer(health_logs, many=True)
         return Response({
-            'health_logs': serializer.data
+            'health_logs': self.export_logs(request.user, 'health_logs', HealthLogSerializer)
         })
     
     @action(detail=False, methods=['get'])
     def meal_data(self, request):
         """Export meal data to JSON"""
-        meals = Meal.objects.filter(user=request.user)
-        serializer = MealSerializer(meals, many=True)
+        meals = values_serializer(MealSerializer).data(Meal.objects.filter(user=request.user))
         return Response({
-            'meals': serializer.data
+            'meals': meals + ArchiveService.read(request.user, ArchiveBlob.Kind.MEALS)
         })
     
     @action(detail=False, methods=['get'])
     def all_data(self, request):
         """Export all user data to JSON"""
-        user = request.user
+        user = User.objects.get(pk=request.user.pk)
         
         # Get profile or create one if it doesn't exist
         profile, created = Profile.objects.get_or_create(user=user)
         if created:
             print(f"Created new profile for user {user.id}")
             
-        meals = Meal.objects.filter(user=user)
-        health_logs = HealthLog.objects.filter(user=user)
-        sleep_logs = Sleep.objects.filter(user=user)
+        meals = values_serializer(MealSerializer).data(Meal.objects.filter(user=user))
         
         user_serializer = UserSerializer(user)
         profile_serializer = ProfileSerializer(profile)
-        meal_serializer = MealSerializer(meals, many=True)
-        health_log_serializer = HealthLogSerializer(health_logs, many=True)
-        sleep_serializer = SleepSerializer(sleep_logs, many=True)
         
         return Response({
             'user': user_serializer.data,
             'profile': profile_serializer.data,
-            'meals': meal_serializer.data,
-            'health_logs': health_log_serializer.data,
-            'sleep_logs': sleep_serializer.data
+            'meals': meals + ArchiveService.read(user, ArchiveBlob.Kind.MEALS),
+            'health_logs': self.export_logs(user, 'health_logs', HealthLogSerializer),
+            'sleep_logs': self.export_logs(user, 'sleep', SleepSerializer)
         })
+
+class CompressionStatsView(APIView):
+    """API endpoint exposing response compression metrics (staff only)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(compression_stats.snapshot())
+
+
+class DiaryImportView(APIView):
+    """API endpoint importing a CSV or NDJSON upload of one kind of diary record"""
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Import diary records",
+        description=(
+            "Streams a CSV (text/csv) or NDJSON (application/x-ndjson) body of health_logs, sleep or meals "
+            "into the user's diary in chunks. Invalid lines are skipped and reported with their line number."
+        ),
+        request={'text/csv': str, 'application/x-ndjson': str},
+    )
+    def post(self, request, kind):
+        if kind not in IMPORT_KINDS:
+            return Response(
+                {"error": f"Unknown import kind, expected one of: {', '.join(IMPORT_KINDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        media_type = request.content_type.split(';')[0].strip().lower()
+        if media_type not in IMPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported content type, expected one of: {', '.join(IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # The body is read line by line rather than through request.data
+        lines = request.stream or []
+        records = READERS[IMPORT_FORMATS[media_type]](lines)
+        return Response(DiaryImporter(request.user, kind).run(records))
+
+
+class DiarySearchView(APIView):
+    """API endpoint for full-text search across the user's symptoms and notes"""
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Search the diary",
+        description=(
+            "Ranked matches across health logs, sleep logs, meals and meal foods, including archived "
+            "entries, with <mark>-highlighted snippets"
+        ),
+        parameters=[
+            OpenApiParameter(name="q", description="Words to search for", required=True, type=str),
+            OpenApiParameter(name="limit", description="Maximum number of results (default 20)", required=False, type=int),
+        ]
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Query parameter q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 100)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), max_results)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'query': query, 'results': SearchService.search(request.user, query, limit)})
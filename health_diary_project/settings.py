@@ -56,11 +56,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.DatabaseRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,12 +91,79 @@ WSGI_APPLICATION = 'health_diary_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the profile: sqlite (default, development) or postgresql (production)
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'health_diary'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Persistent connections, checked before each request reuses them
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Required behind a transaction-pooling PgBouncer
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER', '').lower() == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Opt-in SQLite tuning (WAL, synchronous=NORMAL, busy_timeout, ...) for several worker processes;
+# see core/sqlite.py, SQLITE_PRAGMAS overrides the pragmas applied
+SQLITE_PERFORMANCE_MODE = os.getenv('SQLITE_PERFORMANCE_MODE', 'False').lower() == 'true'
+
+# Optional read-only copies of the database (e.g. replicas): a SQLite file path
+# in DATABASE_<ALIAS>_NAME, or a PostgreSQL host in DATABASE_<ALIAS>_HOST
+for alias in ('replica', 'analytics'):
+    prefix = f'DATABASE_{alias.upper()}_'
+    if os.getenv(prefix + 'NAME') or os.getenv(prefix + 'HOST'):
+        DATABASES[alias] = dict(
+            DATABASES['default'],
+            NAME=os.getenv(prefix + 'NAME', DATABASES['default']['NAME']),
+            HOST=os.getenv(prefix + 'HOST', DATABASES['default'].get('HOST', '')),
+        )
+
+DATABASE_ROUTERS = ['core.db_router.ReadReplicaRouter']
+
+# Read route -> database alias; routes whose alias isn't configured read from default
+DATABASE_READ_ROUTES = {
+    'analytics': 'analytics',
+    'export': 'replica',
 }
+DATABASE_STICKY_SECONDS = 5  # reads stay on default this long after a user writes
+
+
+# Shared cache: web workers, run_tasks and management commands invalidate each other's entries
+# (authenticated users, catalog versions, read stickiness, ...), so it must not be per-process.
+# Redis when REDIS_URL is set, otherwise a table in the default database (manage.py createcachetable).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'core_cache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000))},
+        }
+    }
 
 
 # Password validation
@@ -148,7 +217,7 @@ AUTH_USER_MODEL = 'core.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -156,6 +225,16 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # orjson-backed when it is installed; the rest_framework JSON classes are drop-in replacements
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # JWT Settings
@@ -174,8 +253,12 @@ SIMPLE_JWT = {
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    'TOKEN_REFRESH_SERIALIZER': 'core.authentication.CachedTokenRefreshSerializer',
 }
 
+# How long an authenticated user is cached per token subject (seconds)
+JWT_USER_CACHE_TIMEOUT = int(os.getenv('JWT_USER_CACHE_TIMEOUT', 60))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')
@@ -197,3 +280,57 @@ REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {
     'anon': '10000/minute',
     'user': '10000/minute'
 }
+
+# Response compression
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # bytes
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))
+COMPRESSION_CACHE_TIMEOUT = 300  # seconds
+COMPRESSION_MAX_RANDOM_BYTES = 100  # random gzip header padding against BREACH; 0 disables it
+
+# Date range endpoints
+DATE_RANGE_MAX_DAYS = 366  # longest window returned as raw rows; longer ones must be bucketed
+
+# Rolling statistics and anomaly detection
+ROLLING_STATS_SPAN = 14  # days; EWMA alpha = 2 / (span + 1)
+ROLLING_STATS_MIN_SAMPLES = 5
+ROLLING_STATS_ZSCORE_THRESHOLD = 2.5
+
+# Sleep/health cross-correlation (GET /api/analytics/sleep-health-correlations/)
+CROSS_CORRELATION_LAGS = (0, 1)  # days between a night's sleep and the health log it is paired with
+CROSS_CORRELATION_MAX_LAG = 7
+CROSS_CORRELATION_CACHE_TIMEOUT = 3600  # seconds; writes to the user's logs invalidate earlier
+
+# Per-user bad-day risk model (GET /api/analytics/risk/)
+RISK_MODEL_DIMENSIONS = 1024  # float32 weights per user; foods are hashed into the slots after the dense features
+RISK_MODEL_LEARNING_RATE = 0.1
+RISK_MODEL_L2 = 0.001
+RISK_MODEL_MIN_SAMPLES = 14  # health logs learnt from before scores are marked ready
+RISK_LATE_MEAL_HOUR = 21  # local hour from which a meal counts as late
+
+# Logs older than this move to compressed archive blobs (manage.py archive_old_data)
+ARCHIVE_HORIZON_DAYS = int(os.getenv('ARCHIVE_HORIZON_DAYS', 730))
+
+# Columnar per-user snapshots of health and sleep logs (manage.py build_columnar_snapshots)
+COLUMNAR_SNAPSHOT_DIR = os.getenv('COLUMNAR_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+COLUMNAR_MIN_DAYS = 180  # shorter analytics windows keep reading the database
+
+# Bulk import of CSV/NDJSON diary data (POST /api/import/<kind>/, manage.py import_diary_data)
+IMPORT_CHUNK_SIZE = 1000  # rows per bulk_create transaction
+IMPORT_MAX_REPORTED_ERRORS = 1000  # invalid lines listed in the summary; all are counted
+
+# Public food catalog (manage.py load_food_catalog)
+CATALOG_CHUNK_SIZE = 5000  # foods per upsert chunk
+CATALOG_CACHE_TIMEOUT = 3600  # seconds; catalog changes invalidate earlier
+
+# Diary full-text search (GET /api/search/?q=)
+SEARCH_MAX_RESULTS = 100
+
+# Cohort analytics: patients summarised per batch of grouped queries
+COHORT_CHUNK_SIZE = 500
+
+# Background task queue (run with `manage.py run_tasks`)
+TASK_QUEUE_EAGER = os.getenv('TASK_QUEUE_EAGER', 'False').lower() == 'true'  # run side effects inline, without a worker
+TASK_QUEUE_COALESCE_SECONDS = 2  # writes within this window merge into one task
+TASK_QUEUE_MAX_ATTEMPTS = 5
+TASK_QUEUE_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+TASK_QUEUE_LEASE_SECONDS = 300  # a running task is reclaimed after this long
@@ -1,4 +1,7 @@
 import pytest
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connections
 from rest_framework.test import APIClient
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -13,6 +16,45 @@ from .factories import (
     SleepFactory
 )
 
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    # Separate read-only databases on the same backend, so tests can tell which alias served a read
+    default = django_settings.DATABASES['default']
+    for alias in ('replica', 'analytics'):
+        django_settings.DATABASES.setdefault(alias, dict(
+            default,
+            NAME=f"{default['NAME']}_{alias}",
+            TEST={'NAME': f"test_{default['NAME']}_{alias}"} if default['ENGINE'].endswith('postgresql') else {},
+        ))
+    connections.configure_settings(django_settings.DATABASES)
+    # They are databases of their own rather than replicated copies, so they need the schema
+    django_settings.DATABASE_STANDALONE_ALIASES = ('replica', 'analytics')
+
+@pytest.fixture(autouse=True)
+def primary_database_only(settings):
+    # Tests read from default unless they opt in to read routing
+    settings.DATABASE_READ_ROUTES = {}
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    # Tests run in a single process, and a LocMemCache keeps cache traffic out of query counts
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    # Cache keys embed primary keys, which the test database reuses between tests
+    cache.clear()
+    yield
+    cache.clear()
+
+@pytest.fixture(autouse=True)
+def eager_tasks(settings):
+    # Run queued side effects inline so tests see derived data right after a write
+    settings.TASK_QUEUE_EAGER = True
+
+@pytest.fixture
+def queued_tasks(settings):
+    # Leave side effects in the queue, due at once, for tests of what gets enqueued
+    settings.TASK_QUEUE_EAGER = False
+    settings.TASK_QUEUE_COALESCE_SECONDS = 0
+
 @pytest.fixture
 def api_client():
     return APIClient()
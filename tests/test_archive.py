@@ -0,0 +1,181 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.archive import ArchiveService, decode_rows
+from core.importer import DiaryImporter
+from core.models import ArchiveBlob, HealthLog, Meal, MealFood, MetricStat, Sleep
+from core.services import HealthAnalyticsService
+from tests.factories import (
+    FoodFactory, MealFactory, MealFoodFactory, HealthLogFactory, SleepFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+@pytest.fixture
+def horizon(settings):
+    settings.ARCHIVE_HORIZON_DAYS = 30
+    return timezone.now().date() - timedelta(days=30)
+
+@pytest.fixture
+def history(user):
+    """Daily logs and meals for the last 60 days, 29 of them older than a 30-day horizon"""
+    today = timezone.now().date()
+    dairy = FoodFactory.create(name="Dairy", user=user)
+    bread = FoodFactory.create(name="Bread", user=user)
+    for i in range(60):
+        day = today - timedelta(days=i)
+        HealthLogFactory.create(user=user, date=day, physical_feeling=2 if i % 3 == 0 else 4)
+        SleepFactory.create(user=user, date=day)
+        meal = MealFactory.create(
+            user=user,
+            date_time=timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+        )
+        MealFoodFactory.create(meal=meal, food=dairy if i % 3 == 1 else bread, amount=100)
+    return user
+
+class TestArchiveService:
+    def test_moves_old_rows_into_yearly_blobs(self, history, horizon):
+        counts = ArchiveService.archive_user(history)
+
+        assert counts == {'health_logs': 29, 'sleep': 29, 'meals': 29}
+        assert not HealthLog.objects.filter(user=history, date__lt=horizon).exists()
+        assert HealthLog.objects.filter(user=history).count() == 31
+        assert not Meal.objects.filter(user=history, date_time__date__lt=horizon).exists()
+        assert MealFood.objects.filter(meal__user=history).count() == 31
+
+        history.refresh_from_db()
+        assert history.archived_through == horizon - timedelta(days=1)
+        blobs = ArchiveBlob.objects.filter(user=history, kind=ArchiveBlob.Kind.HEALTH_LOGS)
+        assert sum(blob.row_count for blob in blobs) == 29
+        rows = [row for blob in blobs for row in decode_rows(blob.data)]
+        assert {row['date'] for row in rows} == {
+            str(horizon - timedelta(days=i)) for i in range(1, 30)
+        }
+
+    def test_archiving_twice_merges(self, history, horizon, settings):
+        settings.ARCHIVE_HORIZON_DAYS = 45
+        ArchiveService.archive_user(history)
+        settings.ARCHIVE_HORIZON_DAYS = 30
+        ArchiveService.archive_user(history)
+
+        assert len(ArchiveService.read(history, ArchiveBlob.Kind.SLEEP)) == 29
+        assert Sleep.objects.filter(user=history).count() == 31
+
+    def test_months_move_in_separate_transactions(self, history, horizon, monkeypatch):
+        archive_rows = ArchiveService._archive_rows
+        moved = []
+
+        def fail_after_first_month(user, start, end):
+            if moved:
+                raise RuntimeError('interrupted')
+            moved.append(start)
+            return archive_rows(user, start, end)
+
+        monkeypatch.setattr(ArchiveService, '_archive_rows', fail_after_first_month)
+        with pytest.raises(RuntimeError):
+            ArchiveService.archive_user(history)
+
+        # The first month stays archived, and archived_through covers exactly it
+        history.refresh_from_db()
+        next_month = (moved[0].replace(day=28) + timedelta(days=4)).replace(day=1)
+        assert history.archived_through == next_month - timedelta(days=1)
+        assert not HealthLog.objects.filter(user=history, date__lt=next_month).exists()
+        assert HealthLog.objects.filter(user=history, date__gte=next_month, date__lt=horizon).exists()
+        archived = ArchiveService.read(history, ArchiveBlob.Kind.HEALTH_LOGS)
+        assert all(row['date'] < str(next_month) for row in archived)
+
+    def test_rejects_cutoff_inside_horizon(self, user, horizon):
+        with pytest.raises(ValueError):
+            ArchiveService.archive_user(user, before=timezone.now().date())
+
+    def test_derived_data_untouched(self, history, horizon):
+        stats = list(MetricStat.objects.filter(user=history).values('metric', 'count', 'ewma'))
+        ArchiveService.archive_user(history)
+        assert list(MetricStat.objects.filter(user=history).values('metric', 'count', 'ewma')) == stats
+
+    def test_analytics_read_archived_rows(self, history, horizon):
+        before = {
+            'trends': HealthAnalyticsService.get_health_trends(history, days=50),
+            'correlations': HealthAnalyticsService.get_food_correlations(history, days=50),
+            'sleep': HealthAnalyticsService.analyze_sleep(history, days=50),
+            'triggers': HealthAnalyticsService.identify_symptom_triggers(history, days=50),
+            'aggregates': HealthAnalyticsService.get_bucketed_aggregates(history, 'health', 'week', 10),
+        }
+        ArchiveService.archive_user(history)
+        history.refresh_from_db()
+        cache.clear()
+
+        after = {
+            'trends': HealthAnalyticsService.get_health_trends(history, days=50),
+            'correlations': HealthAnalyticsService.get_food_correlations(history, days=50),
+            'sleep': HealthAnalyticsService.analyze_sleep(history, days=50),
+            'triggers': HealthAnalyticsService.identify_symptom_triggers(history, days=50),
+            'aggregates': HealthAnalyticsService.get_bucketed_aggregates(history, 'health', 'week', 10),
+        }
+        assert after == before
+
+    def test_recent_windows_skip_archive(self, history, horizon, django_assert_num_queries):
+        ArchiveService.archive_user(history)
+        history.refresh_from_db()
+        with django_assert_num_queries(1):
+            HealthAnalyticsService.get_health_trends(history, days=7)
+
+class TestArchivedDays:
+    def test_api_rejects_archived_days(self, authenticated_client, history, horizon):
+        ArchiveService.archive_user(history)
+        archived_day = horizon - timedelta(days=40)
+
+        response = authenticated_client.post(reverse('healthlog-list'), {
+            'user': history.pk, 'date': str(archived_day), 'physical_feeling': 3, 'mental_feeling': 3,
+        })
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'archived' in str(response.data['date'])
+        response = authenticated_client.post(reverse('meal-list'), {
+            'user': history.pk, 'date_time': f'{archived_day}T12:00:00Z', 'meal_type': 'lunch',
+        }, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'date_time' in response.data
+
+        meal = Meal.objects.filter(user=history).first()
+        response = authenticated_client.patch(
+            reverse('meal-detail', args=[meal.pk]), {'date_time': f'{archived_day}T12:00:00Z'}, format='json'
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not HealthLog.objects.filter(user=history, date__lte=history.archived_through).exists()
+
+    def test_import_rejects_archived_days(self, history, horizon):
+        ArchiveService.archive_user(history)
+        records = [
+            (1, {'date': str(horizon - timedelta(days=40)), 'duration': '7', 'quality': '3',
+                 'wake_up_ease': '3', 'energy_level': '3'}),
+            (2, {'date': str(horizon + timedelta(days=60)), 'duration': '7', 'quality': '3',
+                 'wake_up_ease': '3', 'energy_level': '3'}),
+        ]
+        summary = DiaryImporter(history, 'sleep').run(records)
+
+        assert summary['imported'] == 1
+        assert summary['errors'] == [{'line': 1, 'error': f'date: {horizon - timedelta(days=40)} is archived'}]
+
+class TestArchiveExport:
+    def test_export_includes_archived_rows(self, authenticated_client, history, horizon):
+        url = reverse('export-all-data')
+        before = authenticated_client.get(url).data
+        ArchiveService.archive_user(history)
+
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        for key in ('meals', 'health_logs', 'sleep_logs'):
+            assert response.data[key] == before[key]
+
+    def test_archive_command(self, history, horizon):
+        out = StringIO()
+        call_command('archive_old_data', stdout=out)
+        assert 'Archived rows dated before' in out.getvalue()
+        assert '29 health_logs, 29 sleep, 29 meals' in out.getvalue()
+        assert ArchiveBlob.objects.filter(user=history).exists()
@@ -0,0 +1,91 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import USER_CACHE_KEY, get_cached_user
+from core.models import User
+from tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+@pytest.fixture
+def token_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+class TestCachedJWTAuthentication:
+    def test_user_lookup_is_cached(self, token_client, user):
+        url = reverse('healthlog-list')
+        assert token_client.get(url).status_code == status.HTTP_200_OK
+        assert cache.get(USER_CACHE_KEY.format(user.id)) is not None
+
+        # Second request resolves the user from the cache
+        with CaptureQueriesContext(connection) as queries:
+            response = token_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert not [query for query in queries if 'core_user' in query['sql']]
+
+    def test_cache_holds_only_authentication_fields(self, token_client, user):
+        token_client.get(reverse('healthlog-list'))
+        entry = cache.get(USER_CACHE_KEY.format(user.id))
+        assert entry['fields']['username'] == user.username
+        assert 'password' not in entry['fields']
+        assert user.password not in str(entry)
+
+        # Other fields load on access
+        cached = get_cached_user(user.id)
+        assert cached.email == user.email
+        assert cached.timezone == user.timezone
+
+    def test_queryset_update_invalidates_cache(self, token_client, user):
+        url = reverse('healthlog-list')
+        token_client.get(url)
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        assert cache.get(USER_CACHE_KEY.format(user.id)) is None
+        assert token_client.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_update_invalidates_cache(self, token_client, user):
+        url = reverse('user-detail')
+        token_client.get(url)
+        response = token_client.patch(url, {'first_name': 'Changed'})
+        assert response.status_code == status.HTTP_200_OK
+        assert cache.get(USER_CACHE_KEY.format(user.id)) is None
+
+        response = token_client.get(url)
+        assert response.data['first_name'] == 'Changed'
+
+    def test_deactivated_user_rejected_immediately(self, token_client):
+        url = reverse('user-detail')
+        token_client.get(url)
+        response = token_client.delete(reverse('user-delete'))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        response = token_client.get(url)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_unknown_user_not_cached(self):
+        assert get_cached_user(999999) is None
+        assert cache.get(USER_CACHE_KEY.format(999999)) is None
+
+class TestCachedTokenRefresh:
+    def test_refresh_rotates_token(self, api_client, user):
+        refresh = RefreshToken.for_user(user)
+        response = api_client.post(reverse('token-refresh'), {'refresh': str(refresh)})
+        assert response.status_code == status.HTTP_200_OK
+        assert 'access' in response.data
+        assert response.data['refresh'] != str(refresh)
+
+    def test_refresh_rejected_for_inactive_user(self, api_client):
+        user = UserFactory.create()
+        refresh = RefreshToken.for_user(user)
+        user.is_active = False
+        user.save()
+        response = api_client.post(reverse('token-refresh'), {'refresh': str(refresh)})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
@@ -0,0 +1,235 @@
+import pytest
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from core.catalog import (
+    CATALOG_VERSION_KEY, CatalogLoader, bump_catalog_version, catalog_key, catalog_version, normalize_food_name,
+)
+from core.importer import read_csv, read_ndjson
+from core.models import Food, normalize_barcode
+from tests.factories import FoodFactory
+
+pytestmark = pytest.mark.django_db
+
+CATALOG_CSV = """name,calories,protein,carbs,fats
+Greek Yogurt,59,10,3.6,0.4
+Apple,52,0.3,14,0.2
+"greek  yogurt!",61,10.2,3.6,0.4
+Mystery,-5,,,
+,10,1,1,1
+"""
+
+def load(text):
+    return CatalogLoader().run(read_csv(text.splitlines(keepends=True)))
+
+class TestNormalization:
+    def test_variants_share_a_key(self):
+        assert normalize_food_name('  Ben & Jerry’s  Ice-Cream ') == 'ben jerrys ice cream'
+        assert catalog_key('Greek Yogurt') == catalog_key('GREEK yogurt.')
+        assert catalog_key('Greek Yogurt') != catalog_key('Greek Yoghurt')
+        assert len(catalog_key('Apple')) == 32
+
+class TestCatalogLoader:
+    def test_load_dedupes_and_reports(self):
+        summary = load(CATALOG_CSV)
+
+        assert summary['created'] == 2
+        assert summary['duplicates'] == 1
+        assert [error['line'] for error in summary['errors']] == [5, 6]
+        yogurt = Food.objects.get(catalog_key=catalog_key('greek yogurt'))
+        # The last spelling in the file wins within a load
+        assert yogurt.calories == 61
+        assert yogurt.user is None and yogurt.is_public
+
+    def test_reload_upserts_changed_nutrients(self):
+        load(CATALOG_CSV)
+        apple = Food.objects.get(name='Apple')
+
+        summary = load('name,calories,protein,carbs,fats\nAPPLE,95,0.5,25,0.3\nGreek Yogurt,61,10.2,3.6,0.4\nPear,57,,,\n')
+
+        assert (summary['created'], summary['updated'], summary['unchanged']) == (1, 1, 1)
+        apple.refresh_from_db()
+        assert apple.name == 'Apple'
+        assert (apple.calories, apple.carbs) == (95, Decimal('25'))
+        assert Food.objects.filter(catalog_key__isnull=False).count() == 3
+
+    def test_user_foods_untouched(self, user):
+        own = FoodFactory.create(name='Apple', user=user, is_public=False, calories=1)
+        load(CATALOG_CSV)
+        own.refresh_from_db()
+        assert own.calories == 1 and own.catalog_key is None
+
+    def test_existing_public_foods_adopted(self, user):
+        old = FoodFactory.create(name='Apple', user=None, is_public=True, calories=50)
+        variant = FoodFactory.create(name='APPLE!', user=None, is_public=True, calories=51)
+        own = FoodFactory.create(name='Greek yogurt', user=user, is_public=False)
+
+        summary = load(CATALOG_CSV)
+        assert summary['adopted'] == 1
+        assert summary['created'] == 1 and summary['updated'] == 1
+        old.refresh_from_db()
+        assert (old.catalog_key, old.calories) == (catalog_key('apple'), 52)
+        variant.refresh_from_db()
+        own.refresh_from_db()
+        assert variant.catalog_key is None and own.catalog_key is None
+        assert Food.objects.filter(user=None, name__istartswith='apple').count() == 2
+
+    def test_ndjson_and_version_bump(self):
+        version = catalog_version()
+        summary = CatalogLoader().run(read_ndjson(['{"name": "Rice", "calories": 130, "carbs": 28}\n']))
+        assert summary['created'] == 1
+        assert catalog_version() != version
+
+        version = catalog_version()
+        CatalogLoader().run(read_ndjson(['{"name": "rice", "calories": 130, "carbs": 28}\n']))
+        assert catalog_version() == version
+
+    def test_bump_increments_shared_version(self):
+        version = catalog_version()
+        bump_catalog_version()
+        bump_catalog_version()
+        assert catalog_version() == version + 2
+
+        cache.delete(CATALOG_VERSION_KEY)
+        bump_catalog_version()
+        assert catalog_version() > version + 2
+
+    def test_bumped_version_never_expires_in_database_cache(self, settings):
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'core_cache'}}
+        call_command('createcachetable', verbosity=0)
+        version = catalog_version()
+        bump_catalog_version()
+
+        assert catalog_version() == version + 1
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT expires FROM core_cache')
+            (expires,), = cursor.fetchall()
+        assert str(expires).startswith('9999')
+
+class TestCatalogCache:
+    def test_search_sees_new_catalog_foods(self, authenticated_client):
+        url = reverse('food-search')
+        assert authenticated_client.get(url, {'query': 'quinoa'}).data == []
+
+        load('name,calories\nQuinoa,120\n')
+        response = authenticated_client.get(url, {'query': 'quinoa'})
+        assert [food['name'] for food in response.data] == ['Quinoa']
+
+    def test_search_keeps_private_foods_per_user(self, authenticated_client, user):
+        FoodFactory.create(name='Quinoa salad', user=user, is_public=False)
+        FoodFactory.create(name='Quinoa bowl', is_public=False)
+        response = authenticated_client.get(reverse('food-search'), {'query': 'quinoa'})
+        assert [food['name'] for food in response.data] == ['Quinoa salad']
+
+class TestLoadCatalogCommand:
+    def test_loads_file(self, tmp_path):
+        path = tmp_path / 'foods.csv'
+        path.write_text(CATALOG_CSV)
+
+        out, err = StringIO(), StringIO()
+        call_command('load_food_catalog', str(path), stdout=out, stderr=err)
+
+        assert '2 new, 0 updated' in out.getvalue()
+        assert '1 duplicate names, 2 invalid lines' in out.getvalue()
+        assert 'line 5:' in err.getvalue()
+
+    def test_skips_undecodable_lines(self, tmp_path):
+        path = tmp_path / 'foods.csv'
+        path.write_bytes(b'\xef\xbb\xbfname,calories\nCr\xe8me,300\nRice,130\n')
+
+        out, err = StringIO(), StringIO()
+        call_command('load_food_catalog', str(path), stdout=out, stderr=err)
+
+        assert '1 new' in out.getvalue() and '1 invalid lines' in out.getvalue()
+        assert 'line 2: Not UTF-8 encoded' in err.getvalue()
+        assert Food.objects.filter(catalog_key=catalog_key('rice')).exists()
+
+class TestFoodCodes:
+    def test_barcode_normalization(self):
+        assert normalize_barcode('0 12345-67890 5') == '00012345678905'
+        assert normalize_barcode('4006381333931') == '04006381333931'
+        with pytest.raises(Exception):
+            normalize_barcode('12ab')
+
+    def test_create_with_codes(self, authenticated_client):
+        url = reverse('food-list')
+        response = authenticated_client.post(url, {'name': 'Cereal', 'barcode': '012345678905', 'external_id': ''})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['barcode'] == '00012345678905'
+        assert response.data['external_id'] is None
+
+        # The same product scanned as EAN-13 is the same barcode
+        response = authenticated_client.post(url, {'name': 'Cereal again', 'barcode': '0012345678905'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'barcode' in response.data
+        response = authenticated_client.post(url, {'name': 'Bad', 'barcode': 'abc'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        # Several foods without codes do not collide
+        assert authenticated_client.post(url, {'name': 'Plain', 'barcode': ''}).status_code == status.HTTP_201_CREATED
+
+    def test_codes_unique_per_owner(self, authenticated_client, user):
+        url = reverse('food-list')
+        FoodFactory.create(name='Secret', barcode='00012345678905', is_public=False)
+        FoodFactory.create(name='Catalog', external_id='fdc:171287')
+
+        # Another user's private food neither blocks nor reveals the code
+        response = authenticated_client.post(url, {'name': 'Cereal', 'barcode': '012345678905'})
+        assert response.status_code == status.HTTP_201_CREATED
+        # Foods with codes are private unless shared explicitly
+        assert response.data['is_public'] is False
+        assert response.data['user'] == user.pk
+
+        # A private food may shadow a public code, but a public one may not claim it
+        response = authenticated_client.post(url, {'name': 'Mine', 'external_id': 'fdc:171287'})
+        assert response.status_code == status.HTTP_201_CREATED
+        response = authenticated_client.post(url, {'name': 'Shared', 'external_id': 'fdc:171287', 'is_public': True})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'external_id' in response.data
+
+    def test_lookup_by_code(self, authenticated_client):
+        food = FoodFactory.create(name='Cereal', barcode='00012345678905', external_id='fdc:171287')
+
+        response = authenticated_client.get(reverse('food-by-code', args=['012345678905']))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == food.id
+        response = authenticated_client.get(reverse('food-by-code', args=['fdc:171287']))
+        assert response.data['id'] == food.id
+
+        # A scan is one query, with no cache round-trips
+        with CaptureQueriesContext(connection) as ctx:
+            authenticated_client.get(reverse('food-by-code', args=['012345678905']))
+        assert len(ctx.captured_queries) == 1
+        assert 'core_food' in ctx.captured_queries[0]['sql']
+
+    def test_lookup_refreshes_with_catalog(self, authenticated_client):
+        food = FoodFactory.create(name='Cereal', barcode='00012345678905')
+        url = reverse('food-by-code', args=['012345678905'])
+        authenticated_client.get(url)
+
+        food.name = 'Corn flakes'
+        food.save()
+        assert authenticated_client.get(url).data['name'] == 'Corn flakes'
+
+    def test_lookup_respects_visibility(self, authenticated_client, user):
+        FoodFactory.create(name='Secret', barcode='00000000000017', is_public=False)
+        own = FoodFactory.create(name='Mine', barcode='00000000000024', user=user, is_public=False)
+
+        assert authenticated_client.get(reverse('food-by-code', args=['00000017'])).status_code == status.HTTP_404_NOT_FOUND
+        assert authenticated_client.get(reverse('food-by-code', args=['00000024'])).data['id'] == own.id
+        assert authenticated_client.get(reverse('food-by-code', args=['nothing'])).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_lookup_prefers_own_food(self, authenticated_client, user):
+        public = FoodFactory.create(name='Cereal', barcode='00012345678905')
+        FoodFactory.create(name='Their cereal', barcode='00012345678905', is_public=False)
+        url = reverse('food-by-code', args=['012345678905'])
+        assert authenticated_client.get(url).data['id'] == public.id
+
+        own = FoodFactory.create(name='My cereal', barcode='00012345678905', user=user, is_public=False)
+        assert authenticated_client.get(url).data['id'] == own.id
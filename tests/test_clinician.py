@@ -0,0 +1,116 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.models import PatientGrant
+from tests.factories import (
+    UserFactory, FoodFactory, MealFactory, MealFoodFactory,
+    HealthLogFactory, SleepFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+@pytest.fixture
+def clinician():
+    return UserFactory.create(is_medical_professional=True)
+
+@pytest.fixture
+def clinician_client(api_client, clinician):
+    api_client.force_authenticate(user=clinician)
+    return api_client
+
+def grant(clinician, patient=None):
+    patient = patient or UserFactory.create()
+    PatientGrant.objects.create(clinician=clinician, patient=patient)
+    return patient
+
+class TestPatientGrantViews:
+    def test_patient_grants_access(self, authenticated_client, clinician):
+        url = reverse('grant-list')
+        response = authenticated_client.post(url, {'clinician': clinician.id})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['clinician_username'] == clinician.username
+        
+        # Granting twice is rejected
+        response = authenticated_client.post(url, {'clinician': clinician.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_grant_requires_medical_professional(self, authenticated_client):
+        other = UserFactory.create()
+        response = authenticated_client.post(reverse('grant-list'), {'clinician': other.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'clinician' in response.data
+
+    def test_patient_revokes_access(self, authenticated_client, user, clinician):
+        access = PatientGrant.objects.create(clinician=clinician, patient=user)
+        response = authenticated_client.delete(reverse('grant-detail', args=[access.id]))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not PatientGrant.objects.exists()
+
+class TestClinicianViews:
+    def test_requires_medical_professional(self, authenticated_client):
+        response = authenticated_client.get(reverse('clinician-patient-list'))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_triage_overview_orders_by_concern(self, clinician_client, clinician):
+        today = timezone.now().date()
+        healthy = grant(clinician)
+        struggling = grant(clinician)
+        UserFactory.create()  # Not granted, must not appear
+        for i in range(3):
+            HealthLogFactory.create(user=healthy, date=today - timedelta(days=i), physical_feeling=5)
+            HealthLogFactory.create(user=struggling, date=today - timedelta(days=i), physical_feeling=1)
+        SleepFactory.create(user=struggling, date=today, duration=Decimal('4.50'))
+        
+        response = clinician_client.get(reverse('clinician-patient-list'))
+        assert response.status_code == status.HTTP_200_OK
+        rows = response.data['results']
+        assert [row['id'] for row in rows] == [struggling.id, healthy.id]
+        assert rows[0]['bad_days'] == 3
+        assert rows[0]['avg_physical_feeling'] == 1.0
+        assert rows[0]['avg_sleep_duration'] == 4.5
+        assert rows[1]['avg_sleep_duration'] is None
+
+    def test_triage_query_count_independent_of_patients(self, clinician_client, clinician, django_assert_max_num_queries):
+        for _ in range(25):
+            patient = grant(clinician)
+            HealthLogFactory.create(user=patient)
+            SleepFactory.create(user=patient)
+        
+        # Pagination count + one annotated page query
+        with django_assert_max_num_queries(3):
+            response = clinician_client.get(reverse('clinician-patient-list'))
+        assert response.data['count'] == 25
+
+    def test_health_logs_across_patients(self, clinician_client, clinician):
+        first = grant(clinician)
+        second = grant(clinician)
+        HealthLogFactory.create(user=first)
+        HealthLogFactory.create(user=second)
+        HealthLogFactory.create()  # Another user's log
+        
+        response = clinician_client.get(reverse('clinician-healthlog-list'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 2
+        
+        response = clinician_client.get(reverse('clinician-healthlog-list'), {'patient': first.id})
+        assert [row['user'] for row in response.data['results']] == [first.id]
+
+    def test_ungranted_log_not_readable(self, clinician_client):
+        log = SleepFactory.create()
+        response = clinician_client.get(reverse('clinician-sleep-detail', args=[log.id]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_meals_serialized_without_per_patient_queries(self, clinician_client, clinician, django_assert_max_num_queries):
+        for _ in range(5):
+            meal = MealFactory.create(user=grant(clinician))
+            MealFoodFactory.create(meal=meal, food=FoodFactory.create())
+        
+        # Count, page, prefetch of meal foods and of foods
+        with django_assert_max_num_queries(5):
+            response = clinician_client.get(reverse('clinician-meal-list'))
+        assert response.data['count'] == 5
+        assert all(len(meal['mealfood_set']) == 1 for meal in response.data['results'])
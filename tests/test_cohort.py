@@ -0,0 +1,133 @@
+import json
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.cohort import CohortAnalyticsEngine
+from core.models import PatientGrant
+from tests.factories import (
+    UserFactory, FoodFactory, MealFactory, MealFoodFactory,
+    HealthLogFactory, SleepFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+def make_patient(sleep_hours, physical_feeling, days=5):
+    """Create a patient whose feeling tracks their sleep"""
+    patient = UserFactory.create()
+    today = timezone.now().date()
+    for i in range(days):
+        day = today - timedelta(days=i)
+        HealthLogFactory.create(user=patient, date=day, physical_feeling=physical_feeling, mental_feeling=3)
+        SleepFactory.create(user=patient, date=day, duration=Decimal(sleep_hours), quality=3, energy_level=3)
+    return patient
+
+class TestCohortAnalyticsEngine:
+    def test_distributions_and_correlations(self):
+        patients = [
+            make_patient('5.00', 1),
+            make_patient('6.00', 2),
+            make_patient('7.00', 3),
+            make_patient('8.00', 4),
+        ]
+        engine = CohortAnalyticsEngine([p.id for p in patients], days=30, chunk_size=2)
+        snapshots = list(engine.run())
+
+        # One partial snapshot after the first chunk, then the final result
+        assert [s['done'] for s in snapshots] == [False, True]
+        assert snapshots[0]['processed'] == 2
+
+        result = snapshots[-1]
+        assert result['with_data'] == 4
+        physical = result['distributions']['physical_feeling']
+        assert physical['count'] == 4
+        assert physical['mean'] == 2.5
+        assert sum(bin['count'] for bin in physical['histogram']) == 4
+        assert result['distributions']['bad_day_rate']['mean'] == 0.5
+
+        sleep_vs_feeling = next(
+            c for c in result['correlations']
+            if c['x'] == 'sleep_duration' and c['y'] == 'physical_feeling'
+        )
+        assert sleep_vs_feeling['n'] == 4
+        assert sleep_vs_feeling['r'] == 1.0
+
+    def test_meal_summaries(self):
+        patient = UserFactory.create()
+        meal = MealFactory.create(user=patient)
+        MealFoodFactory.create(meal=meal, food=FoodFactory.create())
+        MealFoodFactory.create(meal=meal, food=FoodFactory.create())
+
+        *_, result = CohortAnalyticsEngine([patient.id], days=10).run()
+        assert result['distributions']['foods_per_meal']['mean'] == 2.0
+        assert result['distributions']['meals_per_day']['mean'] == 0.1
+
+    def test_query_count_independent_of_cohort_size(self, django_assert_num_queries):
+        patients = [make_patient('7.00', 3, days=2) for _ in range(6)]
+        engine = CohortAnalyticsEngine([p.id for p in patients], days=30, chunk_size=100)
+        with django_assert_num_queries(3):
+            list(engine.run())
+
+class TestDetailedAnalysisView:
+    def test_cohort_for_selected_patients(self, authenticated_client, user):
+        user.is_medical_professional = True
+        user.save()
+        patient = make_patient('7.50', 4)
+        other = make_patient('5.00', 2)
+        ungranted = make_patient('9.00', 5)
+        PatientGrant.objects.create(clinician=user, patient=patient)
+        PatientGrant.objects.create(clinician=user, patient=other)
+
+        url = reverse('analytics-detailed-analysis')
+        response = authenticated_client.get(url, {'patients': f'{patient.id},{ungranted.id}'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['patients'] == 1
+        assert response.data['distributions']['sleep_duration']['mean'] == 7.5
+
+    def test_cohort_defaults_to_granted_patients(self, authenticated_client, user):
+        user.is_medical_professional = True
+        user.save()
+        for hours in ('6.00', '8.00'):
+            PatientGrant.objects.create(clinician=user, patient=make_patient(hours, 3))
+        make_patient('4.00', 1)
+
+        response = authenticated_client.get(reverse('analytics-detailed-analysis'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['patients'] == 2
+        assert response.data['distributions']['sleep_duration']['mean'] == 7.0
+
+    def test_streaming_ndjson(self, authenticated_client, user):
+        user.is_medical_professional = True
+        user.save()
+        patient = make_patient('7.00', 3)
+        PatientGrant.objects.create(clinician=user, patient=patient)
+
+        url = reverse('analytics-detailed-analysis')
+        response = authenticated_client.get(url, {'patients': str(patient.id), 'stream': 'true'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert json.loads(lines[-1])['done'] is True
+
+    def test_invalid_patients(self, authenticated_client, user):
+        user.is_medical_professional = True
+        user.save()
+        url = reverse('analytics-detailed-analysis')
+        response = authenticated_client.get(url, {'patients': 'abc'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_days_clamped(self, authenticated_client, user):
+        user.is_medical_professional = True
+        user.save()
+        PatientGrant.objects.create(clinician=user, patient=make_patient('7.00', 3))
+
+        url = reverse('analytics-detailed-analysis')
+        today = timezone.now().date()
+        response = authenticated_client.get(url, {'days': 10 ** 9})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['window']['from'] == str(today - timedelta(days=3649))
+        response = authenticated_client.get(url, {'days': 1})
+        assert response.data['window']['from'] == str(today - timedelta(days=2))
@@ -0,0 +1,193 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.archive import ArchiveService
+from core.columnar import ColumnarSnapshotService
+from core.models import BackgroundTask, HealthLog, Sleep
+from core.services import HealthAnalyticsService
+from tests.factories import HealthLogFactory, SleepFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(settings, tmp_path):
+    settings.COLUMNAR_SNAPSHOT_DIR = tmp_path / 'snapshots'
+    settings.COLUMNAR_MIN_DAYS = 30
+    return settings.COLUMNAR_SNAPSHOT_DIR
+
+@pytest.fixture
+def history(user):
+    """120 days of daily health and sleep logs, some with empty optional fields"""
+    today = timezone.now().date()
+    for i in range(1, 121):
+        day = today - timedelta(days=i)
+        HealthLogFactory.create(
+            user=user, date=day,
+            weight=None if i % 7 == 0 else Decimal('70.25') + i % 5,
+            stool_quality=None if i % 11 == 0 else 'normal',
+            complete_evacuation=None if i % 13 == 0 else i % 2 == 0,
+            notes='' if i % 2 else f'Day {i} – café',
+        )
+        SleepFactory.create(user=user, date=day, duration=Decimal('7.50') + i % 3)
+    return user
+
+def build(user):
+    for table_name in ('health_logs', 'sleep'):
+        ColumnarSnapshotService.build(user, table_name)
+
+def analytics(user):
+    cache.clear()
+    return {
+        'trends': HealthAnalyticsService.get_health_trends(user, days=150),
+        'correlations': HealthAnalyticsService.get_food_correlations(user, days=150),
+        'sleep': HealthAnalyticsService.analyze_sleep(user, days=150),
+        'triggers': HealthAnalyticsService.identify_symptom_triggers(user, days=150),
+        'health_weeks': HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'week', 22),
+        'sleep_months': HealthAnalyticsService.get_bucketed_aggregates(user, 'sleep', 'month', 6),
+    }
+
+class TestColumnarSnapshot:
+    def test_build_and_open(self, history):
+        build(history)
+        snapshot = ColumnarSnapshotService.open(history.pk, 'health_logs')
+
+        assert snapshot.rows == 120
+        assert snapshot.last_date == timezone.now().date() - timedelta(days=1)
+        records = snapshot.records()
+        assert [record.date for record in records] == sorted(
+            HealthLog.objects.filter(user=history).values_list('date', flat=True)
+        )
+        assert records[-1].weight == Decimal('71.25')
+
+    def test_blank_choice_round_trips(self, user, authenticated_client):
+        today = timezone.now().date()
+        for i, quality in enumerate(('', None, 'soft'), start=1):
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i), stool_quality=quality)
+        expected = authenticated_client.get(reverse('export-health-data')).data['health_logs']
+
+        ColumnarSnapshotService.build(user, 'health_logs')
+        snapshot = ColumnarSnapshotService.open(user.pk, 'health_logs')
+        assert [row['stool_quality'] for row in snapshot.representation(user.pk)] == ['', None, 'soft']
+        assert authenticated_client.get(reverse('export-health-data')).data['health_logs'] == expected
+
+    def test_missing_snapshot(self, user):
+        assert ColumnarSnapshotService.open(user.pk, 'sleep') is None
+
+    def test_analytics_match_database(self, history):
+        expected = analytics(history)
+        build(history)
+        assert ColumnarSnapshotService.open(history.pk, 'health_logs') is not None
+        assert analytics(history) == expected
+
+    def test_long_windows_skip_log_tables(self, history, django_assert_num_queries):
+        build(history)
+        with django_assert_num_queries(0):
+            HealthAnalyticsService.get_health_trends(history, days=120)
+            HealthAnalyticsService.analyze_sleep(history, days=120)
+            HealthAnalyticsService.get_bucketed_aggregates(history, 'health', 'month', 4)
+
+    def test_short_windows_read_database(self, history, settings, django_assert_num_queries):
+        settings.COLUMNAR_MIN_DAYS = 180
+        build(history)
+        with django_assert_num_queries(1):
+            HealthAnalyticsService.get_health_trends(history, days=30)
+
+    def test_includes_archived_rows(self, history, settings):
+        settings.ARCHIVE_HORIZON_DAYS = 60
+        ArchiveService.archive_user(history)
+        history.refresh_from_db()
+        expected = analytics(history)
+
+        build(history)
+        assert ColumnarSnapshotService.open(history.pk, 'sleep').rows == 120
+        assert analytics(history) == expected
+
+class TestColumnarRefresh:
+    def test_new_day_is_appended(self, history):
+        build(history)
+        generation = ColumnarSnapshotService.open(history.pk, 'health_logs').directory
+
+        HealthLogFactory.create(user=history, date=timezone.now().date(), notes='Appended')
+
+        snapshot = ColumnarSnapshotService.open(history.pk, 'health_logs')
+        assert snapshot.directory == generation
+        assert snapshot.rows == 121
+        assert snapshot.representation(history.pk)[0]['notes'] == 'Appended'
+        previous = HealthLog.objects.get(user=history, date=snapshot.last_date - timedelta(days=1))
+        assert snapshot.text('notes')[-2] == previous.notes
+
+    def test_edit_rebuilds(self, history):
+        build(history)
+        generation = ColumnarSnapshotService.open(history.pk, 'sleep').directory
+        log = Sleep.objects.filter(user=history).last()
+        log.quality = 1
+        log.save()
+
+        snapshot = ColumnarSnapshotService.open(history.pk, 'sleep')
+        assert snapshot.directory != generation
+        assert not generation.exists()
+        assert snapshot.records(log.date, log.date)[0].quality == 1
+
+    def test_delete_rebuilds(self, history):
+        build(history)
+        HealthLog.objects.filter(user=history).first().delete()
+        assert ColumnarSnapshotService.open(history.pk, 'health_logs').rows == 119
+
+    def test_stale_until_task_runs(self, history, settings):
+        build(history)
+        settings.TASK_QUEUE_EAGER = False
+        HealthLogFactory.create(user=history, date=timezone.now().date())
+
+        assert ColumnarSnapshotService.open(history.pk, 'health_logs') is None
+        assert ColumnarSnapshotService.open(history.pk, 'sleep') is not None
+        task = BackgroundTask.objects.get(user=history, kind='columnar_snapshots')
+        assert task.payload == {'health_logs': {'since': str(timezone.now().date()), 'rebuild': False}}
+
+        ColumnarSnapshotService.refresh(history.pk, 'health_logs', **task.payload['health_logs'])
+        assert ColumnarSnapshotService.open(history.pk, 'health_logs').rows == 121
+
+    def test_users_without_snapshot_are_not_queued(self, user, settings):
+        settings.TASK_QUEUE_EAGER = False
+        HealthLogFactory.create(user=user)
+        assert not BackgroundTask.objects.filter(kind='columnar_snapshots').exists()
+
+    def test_user_deletion_removes_snapshots(self, history, snapshot_dir):
+        build(history)
+        user_dir = snapshot_dir / str(history.pk)
+        assert user_dir.exists()
+        history.delete()
+        assert not user_dir.exists()
+
+class TestColumnarExport:
+    def test_export_matches_database(self, authenticated_client, history):
+        url = reverse('export-all-data')
+        expected = authenticated_client.get(url).data
+        build(history)
+
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['health_logs'] == expected['health_logs']
+        assert response.data['sleep_logs'] == expected['sleep_logs']
+        assert response.data['meals'] == expected['meals']
+
+    def test_health_data_export(self, authenticated_client, history):
+        build(history)
+        response = authenticated_client.get(reverse('export-health-data'))
+        assert len(response.data['health_logs']) == 120
+
+    def test_command(self, history, snapshot_dir):
+        UserFactory.create()
+        out = StringIO()
+        call_command('build_columnar_snapshots', stdout=out)
+        assert 'Built 2 and refreshed 0 snapshots' in out.getvalue()
+
+        call_command('build_columnar_snapshots', stdout=out)
+        assert 'Built 0 and refreshed 2 snapshots' in out.getvalue()
+        assert sorted(path.name for path in (snapshot_dir / str(history.pk)).iterdir()) == ['health_logs', 'sleep']
@@ -0,0 +1,69 @@
+import pytest
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.crossmetric import HEALTH_METRICS, SLEEP_METRICS, CrossCorrelationService
+from tests.factories import HealthLogFactory, SleepFactory
+
+pytestmark = pytest.mark.django_db
+
+QUALITY = [3, 1, 4, 1, 5, 2, 2, 4, 3, 5, 1, 3, 4, 2, 5, 3, 2, 4, 1, 5]
+
+def cell(result, lag, sleep_metric, health_metric):
+    matrix = next(entry for entry in result['lags'] if entry['lag'] == lag)
+    i, j = SLEEP_METRICS.index(sleep_metric), HEALTH_METRICS.index(health_metric)
+    return matrix['r'][i][j], matrix['n'][i][j]
+
+@pytest.fixture
+def next_day_pattern(user):
+    """Physical feeling echoes the previous night's sleep quality"""
+    today = timezone.now().date()
+    for i, quality in enumerate(QUALITY):
+        day = today - timedelta(days=len(QUALITY) - i)
+        SleepFactory.create(user=user, date=day, quality=quality, duration=6 + quality / 2)
+        HealthLogFactory.create(
+            user=user, date=day + timedelta(days=1), physical_feeling=quality,
+            stool_quality='diarrhea' if quality == 1 else 'normal', weight=None
+        )
+    return user
+
+class TestCrossCorrelation:
+    def test_lagged_matrix(self, next_day_pattern):
+        result = CrossCorrelationService.get(next_day_pattern, days=30, lags=[0, 1])
+
+        assert [entry['lag'] for entry in result['lags']] == [0, 1]
+        r, n = cell(result, 1, 'quality', 'physical_feeling')
+        assert (r, n) == (1.0, 20)
+        assert cell(result, 1, 'duration', 'physical_feeling')[0] == 1.0
+        assert cell(result, 1, 'quality', 'stool_quality')[0] < 0
+        assert cell(result, 0, 'quality', 'physical_feeling')[0] < 1.0
+        # No weights were logged
+        assert cell(result, 1, 'quality', 'weight') == (None, 0)
+
+    def test_sleep_before_window_pairs_at_lag(self, next_day_pattern):
+        # The oldest health log in a 20-day window pairs with sleep from the day before it
+        result = CrossCorrelationService.get(next_day_pattern, days=20, lags=[1])
+        assert cell(result, 1, 'quality', 'physical_feeling')[1] == 20
+
+    def test_cached_until_logs_change(self, next_day_pattern, django_assert_num_queries):
+        first = CrossCorrelationService.get(next_day_pattern, days=30)
+        with django_assert_num_queries(0):
+            assert CrossCorrelationService.get(next_day_pattern, days=30) == first
+
+        SleepFactory.create(user=next_day_pattern, date=timezone.now().date(), quality=5)
+        assert CrossCorrelationService.get(next_day_pattern, days=30) != first
+
+class TestSleepHealthCorrelationsView:
+    def test_endpoint(self, authenticated_client, next_day_pattern):
+        url = reverse('analytics-sleep-health-correlations')
+        response = authenticated_client.get(url, {'days': 30, 'lags': '1,2'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [entry['lag'] for entry in response.data['lags']] == [1, 2]
+        assert response.data['sleep_metrics'] == list(SLEEP_METRICS)
+
+    @pytest.mark.parametrize('params', [{'lags': '1,x'}, {'lags': '30'}, {'days': '1'}])
+    def test_rejects_bad_parameters(self, authenticated_client, params):
+        response = authenticated_client.get(reverse('analytics-sleep-health-correlations'), params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
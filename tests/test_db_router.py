@@ -0,0 +1,108 @@
+import pytest
+from django.core.cache.backends.db import DatabaseCache
+from django.urls import reverse
+from rest_framework import status
+
+from core import db_router
+from core.models import HealthLog, User
+from tests.factories import HealthLogFactory
+
+pytestmark = pytest.mark.django_db(databases=['default', 'replica', 'analytics'])
+
+@pytest.fixture
+def read_routes(settings):
+    settings.DATABASE_READ_ROUTES = {'analytics': 'analytics', 'export': 'replica'}
+
+def copy_user(user, alias):
+    """Mirror a user onto a read-only database, as replication would"""
+    User.objects.using(alias).create(id=user.id, username=user.username, email=user.email)
+
+def replicated_log(user, alias, **kwargs):
+    log = HealthLogFactory.build(user=user, **kwargs)
+    log.save(using=alias)
+    return log
+
+class TestReadReplicaRouter:
+    def test_no_request_reads_default(self):
+        router = db_router.ReadReplicaRouter()
+        assert router.db_for_read(HealthLog) is None
+        assert router.db_for_write(HealthLog) == 'default'
+
+    def test_write_switches_request_back_to_default(self, read_routes, user):
+        router = db_router.ReadReplicaRouter()
+        state = db_router.begin_request()
+        try:
+            assert db_router.route_reads('analytics', user) == 'analytics'
+            assert router.db_for_read(HealthLog) == 'analytics'
+            router.db_for_write(HealthLog)
+            assert router.db_for_read(HealthLog) is None
+            assert state.wrote
+        finally:
+            db_router.end_request()
+
+    def test_unconfigured_alias_falls_back(self, settings, user):
+        settings.DATABASE_READ_ROUTES = {'analytics': 'warehouse'}
+        db_router.begin_request()
+        try:
+            assert db_router.route_reads('analytics', user) is None
+        finally:
+            db_router.end_request()
+
+    def test_only_default_is_migrated(self, settings):
+        settings.DATABASE_STANDALONE_ALIASES = ()
+        router = db_router.ReadReplicaRouter()
+        assert router.allow_migrate('default', 'core')
+        assert not router.allow_migrate('replica', 'core')
+        assert not router.allow_migrate('analytics', 'core', model_name='healthlog')
+
+    def test_cache_table_stays_on_default(self, read_routes, user):
+        cache_model = DatabaseCache('core_cache', {}).cache_model_class
+        router = db_router.ReadReplicaRouter()
+        state = db_router.begin_request()
+        try:
+            db_router.route_reads('analytics', user)
+            assert router.db_for_read(cache_model) == 'default'
+            # Cache writes are not the request's writes
+            assert router.db_for_write(cache_model) == 'default'
+            assert not state.wrote
+            assert router.db_for_read(HealthLog) == 'analytics'
+        finally:
+            db_router.end_request()
+
+class TestRoutedViews:
+    def test_analytics_reads_analytics_alias(self, read_routes, authenticated_client, user, today):
+        copy_user(user, 'analytics')
+        replicated_log(user, 'analytics', date=today, physical_feeling=2)
+
+        response = authenticated_client.get(reverse('analytics-health-trends'), {'days': 7})
+        assert response.status_code == status.HTTP_200_OK
+        assert [point['value'] for point in response.data['physical_feeling']] == [2]
+
+    def test_export_reads_replica(self, read_routes, authenticated_client, user):
+        copy_user(user, 'replica')
+        replicated_log(user, 'replica')
+
+        response = authenticated_client.get(reverse('export-health-data'))
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['health_logs']) == 1
+        assert not HealthLog.objects.filter(user=user).exists()
+
+    def test_reads_stick_to_primary_after_write(self, read_routes, authenticated_client, user, today):
+        # The analytics copy lags behind and hasn't seen the new log yet
+        copy_user(user, 'analytics')
+
+        data = {
+            'user': user.id,
+            'date': str(today),
+            'physical_feeling': 4,
+            'mental_feeling': 4,
+            'stool_count': 1,
+            'stool_quality': 'normal',
+            'complete_evacuation': True,
+        }
+        response = authenticated_client.post(reverse('healthlog-list'), data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert db_router.is_pinned(user.id)
+
+        response = authenticated_client.get(reverse('analytics-health-trends'), {'days': 7})
+        assert [point['value'] for point in response.data['physical_feeling']] == [4]
@@ -0,0 +1,214 @@
+import json
+import pytest
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.urls import reverse
+from rest_framework import status
+
+from core.importer import DiaryImporter, read_csv, read_ndjson
+from core.models import DailySummary, Food, HealthLog, Meal, MetricStat, Sleep
+from core.precompute import PrecomputeService
+from tests.factories import FoodFactory, HealthLogFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+HEALTH_CSV = """date,physical_feeling,mental_feeling,stool_count,stool_quality,complete_evacuation,weight,symptoms,notes
+2024-01-01,4,3,1,normal,yes,70.5,,
+2024-01-02,9,3,1,normal,no,,,out of range
+2024-01-03,2,2,,,,,bloating,"after ""pizza"" night"
+not a date,3,3,1,soft,,,,
+"""
+
+def ndjson(*records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+class TestReaders:
+    def test_csv_line_numbers(self):
+        rows = list(read_csv(HEALTH_CSV.splitlines(keepends=True)))
+        assert [line for line, _ in rows] == [2, 3, 4, 5]
+        assert rows[2][1]['notes'] == 'after "pizza" night'
+
+    def test_csv_wrong_column_count(self):
+        (line, error), = read_csv(['date,quality\n', '2024-01-01\n'])
+        assert line == 2
+        assert 'Expected 2 columns' in str(error)
+
+    def test_ndjson_invalid_lines(self):
+        rows = list(read_ndjson([b'{"date": "2024-01-01"}\n', b'\n', b'{broken\n', b'[1]\n']))
+        assert [line for line, _ in rows] == [1, 3, 4]
+        assert isinstance(rows[0][1], dict)
+        assert all(isinstance(record, Exception) for _, record in rows[1:])
+
+    def test_undecodable_lines_reported(self):
+        rows = list(read_csv([b'date,quality\n', b'2024-01-01,3\n', b'2024-01-02,\xff\n', b'2024-01-03,4\n']))
+        assert [line for line, _ in rows] == [2, 3, 4]
+        assert str(rows[1][1]) == 'Not UTF-8 encoded'
+        assert rows[2][1] == {'date': '2024-01-03', 'quality': '4'}
+
+        rows = list(read_ndjson([b'{"date": "2024-01-01"}\n', b'{"notes": "\xe9"}\n', b'{"date": "2024-01-03"}\n']))
+        assert [line for line, _ in rows] == [1, 2, 3]
+        assert isinstance(rows[1][1], Exception)
+
+class TestDiaryImporter:
+    def test_health_logs_from_csv(self, user):
+        summary = DiaryImporter(user, 'health_logs').run(read_csv(HEALTH_CSV.splitlines(keepends=True)))
+
+        assert summary['imported'] == 2
+        assert summary['error_count'] == 2
+        assert [error['line'] for error in summary['errors']] == [3, 5]
+        assert 'physical_feeling' in summary['errors'][0]['error']
+        first, third = HealthLog.objects.filter(user=user).order_by('date')
+        assert first.complete_evacuation is True
+        assert first.weight == Decimal('70.5')
+        assert third.stool_count == 0
+        assert third.stool_quality is None
+        assert third.notes == 'after "pizza" night'
+
+    def test_duplicate_dates_rejected(self, user):
+        HealthLogFactory.create(user=user, date=date(2024, 1, 1))
+        records = read_ndjson(ndjson(*(
+            {'date': day, 'duration': 7.5, 'quality': 4, 'wake_up_ease': 3, 'energy_level': 4}
+            for day in ('2024-01-02', '2024-01-03', '2024-01-02')
+        )).splitlines())
+        summary = DiaryImporter(user, 'sleep', chunk_size=2).run(records)
+
+        assert summary['imported'] == 2
+        assert summary['errors'] == [{'line': 3, 'error': 'date: 2024-01-02 is already logged'}]
+        assert Sleep.objects.filter(user=user).count() == 2
+
+        records = read_csv(['date,physical_feeling,mental_feeling\n', '2024-01-01,3,3\n'])
+        assert DiaryImporter(user, 'health_logs').run(records)['error_count'] == 1
+
+    def test_meals_resolve_and_create_foods(self, user):
+        user.timezone = 'America/Los_Angeles'
+        user.save()
+        own = FoodFactory.create(name='Oatmeal', user=user, is_public=False)
+        FoodFactory.create(name='Oatmeal', is_public=True)
+        milk = FoodFactory.create(name='Milk', is_public=True)
+        FoodFactory.create(name='Kimchi', user=UserFactory.create(), is_public=False)
+
+        records = read_ndjson(ndjson(
+            {'date_time': '2024-03-09T19:30:00', 'meal_type': 'dinner',
+             'foods': [{'name': 'Oatmeal', 'amount': 80}, {'name': 'Kimchi', 'amount': 30}]},
+            {'date_time': '2024-03-10T08:00:00+00:00', 'meal_type': 'breakfast',
+             'foods': [{'name': 'Milk', 'amount': 200.5}, {'name': 'Kimchi', 'amount': 15}]},
+            {'date_time': '2024-03-10T09:00:00', 'meal_type': 'brunch'},
+        ).splitlines())
+        summary = DiaryImporter(user, 'meals', chunk_size=1).run(records)
+
+        assert summary['imported'] == 2
+        assert summary['foods_created'] == 1
+        assert summary['errors'][0]['line'] == 3
+        kimchi = Food.objects.get(name='Kimchi', user=user)
+        assert kimchi.is_public is False
+
+        dinner, breakfast = Meal.objects.filter(user=user).order_by('date_time')
+        assert dinner.date_time == datetime(2024, 3, 10, 3, 30, tzinfo=dt_timezone.utc)
+        assert dinner.local_date == date(2024, 3, 9)
+        assert breakfast.local_date == date(2024, 3, 10)
+        assert {(mf.food_id, mf.amount) for mf in dinner.mealfood_set.all()} == {
+            (own.id, Decimal('80')), (kimchi.id, Decimal('30'))
+        }
+        assert {mf.food_id for mf in breakfast.mealfood_set.all()} == {milk.id, kimchi.id}
+
+    def test_csv_meal_foods(self, user):
+        FoodFactory.create(name='Rice', is_public=True)
+        records = read_csv([
+            'date_time,meal_type,foods\n',
+            '2024-03-10T12:00:00,lunch,Rice:150|Chicken: 120\n',
+            '2024-03-10T13:00:00,snack,Rice\n',
+        ])
+        summary = DiaryImporter(user, 'meals').run(records)
+
+        assert summary['imported'] == 1
+        assert summary['errors'][0]['line'] == 3
+        meal = Meal.objects.get(user=user)
+        assert sorted(meal.mealfood_set.values_list('food__name', 'amount')) == [
+            ('Chicken', Decimal('120')), ('Rice', Decimal('150'))
+        ]
+
+    def test_rolled_back_chunk_not_counted(self, user, monkeypatch):
+        importer = DiaryImporter(user, 'meals')
+        write_meals = importer.write_meals
+
+        def write_then_conflict(valid):
+            write_meals(valid)
+            raise IntegrityError('conflict')
+
+        monkeypatch.setattr(importer, 'write_meals', write_then_conflict)
+        summary = importer.run(read_ndjson(ndjson(
+            {'date_time': '2024-03-10T12:00:00', 'meal_type': 'lunch', 'foods': [{'name': 'Tofu', 'amount': 100}]},
+        ).splitlines()))
+
+        assert summary['imported'] == 0
+        assert summary['foods_created'] == 0
+        assert summary['error_count'] == 1
+        assert not Meal.objects.filter(user=user).exists()
+        assert not Food.objects.filter(name='Tofu').exists()
+
+    def test_derived_data_updated(self, user):
+        PrecomputeService.summarise_day(user.pk, date(2024, 1, 5))
+        records = read_ndjson(ndjson(*(
+            {'date': f'2024-01-{day:02d}', 'duration': 7, 'quality': 3, 'wake_up_ease': 3, 'energy_level': 3}
+            for day in range(1, 11)
+        )).splitlines())
+        DiaryImporter(user, 'sleep').run(records)
+
+        assert MetricStat.objects.get(user=user, metric='duration').count == 10
+        assert DailySummary.objects.get(user=user, date=date(2024, 1, 5)).sleep_duration == Decimal('7')
+
+class TestDiaryImportView:
+    def test_csv_upload(self, authenticated_client, user):
+        response = authenticated_client.generic(
+            'POST', reverse('diary-import', args=['health_logs']), HEALTH_CSV, content_type='text/csv; charset=utf-8'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['imported'] == 2
+        assert response.data['error_count'] == 2
+        assert HealthLog.objects.filter(user=user).count() == 2
+
+    def test_ndjson_upload(self, authenticated_client, user):
+        body = ndjson({'date': '2024-01-01', 'duration': 8, 'quality': 4, 'wake_up_ease': 4, 'energy_level': 4})
+        response = authenticated_client.generic(
+            'POST', reverse('diary-import', args=['sleep']), body, content_type='application/x-ndjson'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['imported'] == 1
+
+    def test_undecodable_line_skipped(self, authenticated_client, user):
+        body = HEALTH_CSV.encode().replace(b'night', b'\xe9t\xe9')
+        response = authenticated_client.generic(
+            'POST', reverse('diary-import', args=['health_logs']), body, content_type='text/csv'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['imported'] == 1
+        assert {'line': 4, 'error': 'Not UTF-8 encoded'} in response.data['errors']
+
+    def test_rejects_unknown_kind_and_format(self, authenticated_client):
+        response = authenticated_client.generic(
+            'POST', reverse('diary-import', args=['workouts']), '', content_type='text/csv'
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = authenticated_client.post(reverse('diary-import', args=['sleep']), [], format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_requires_authentication(self, api_client):
+        response = api_client.generic('POST', reverse('diary-import', args=['sleep']), '', content_type='text/csv')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+class TestImportCommand:
+    def test_imports_file(self, user, tmp_path):
+        path = tmp_path / 'health.csv'
+        path.write_text(HEALTH_CSV, encoding='utf-8-sig')
+
+        out, err = StringIO(), StringIO()
+        call_command('import_diary_data', str(path), '--user', str(user.pk), '--kind', 'health_logs',
+                     stdout=out, stderr=err)
+
+        assert 'Imported 2 health_logs' in out.getvalue()
+        assert '2 invalid lines' in out.getvalue()
+        assert 'line 3:' in err.getvalue()
+        assert HealthLog.objects.filter(user=user).count() == 2
@@ -0,0 +1,104 @@
+import pytest
+from datetime import date, datetime, timezone as dt_timezone
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from core.models import DailySummary, Meal
+from core.precompute import PrecomputeService
+from core.services import HealthAnalyticsService
+from tests.factories import (
+    FoodFactory, MealFactory, MealFoodFactory, HealthLogFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+# 02:30 UTC on March 10th is still the evening of March 9th in Los Angeles
+LATE_EVENING = datetime(2024, 3, 10, 2, 30, tzinfo=dt_timezone.utc)
+
+@pytest.fixture
+def west_coast_user(user):
+    user.timezone = 'America/Los_Angeles'
+    user.save()
+    return user
+
+class TestMealLocalDate:
+    def test_set_on_save(self, west_coast_user):
+        meal = MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+        assert meal.local_date == date(2024, 3, 9)
+        assert MealFactory.create(date_time=LATE_EVENING).local_date == date(2024, 3, 10)
+
+    def test_updated_with_date_time(self, west_coast_user):
+        meal = MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+        meal.date_time = datetime(2024, 3, 10, 20, 0, tzinfo=dt_timezone.utc)
+        meal.save(update_fields=['date_time'])
+        meal.refresh_from_db()
+        assert meal.local_date == date(2024, 3, 10)
+
+    def test_timezone_change_moves_meals(self, authenticated_client, user):
+        meal = MealFactory.create(user=user, date_time=LATE_EVENING)
+        assert meal.local_date == date(2024, 3, 10)
+
+        response = authenticated_client.patch(
+            reverse('user-detail'), {'timezone': 'America/Los_Angeles'}, format='json'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        meal.refresh_from_db()
+        assert meal.local_date == date(2024, 3, 9)
+
+    def test_unknown_timezone_rejected(self, authenticated_client):
+        response = authenticated_client.patch(reverse('user-detail'), {'timezone': 'Mars/Olympus'}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'timezone' in response.data
+
+    def test_backfill_command(self, west_coast_user):
+        meals = MealFactory.create_batch(3, user=west_coast_user, date_time=LATE_EVENING)
+        Meal.objects.update(local_date=None)
+
+        out = StringIO()
+        call_command('backfill_meal_local_dates', '--batch-size', '2', stdout=out)
+
+        assert 'Set the local date of 3 meals' in out.getvalue()
+        assert set(Meal.objects.filter(pk__in=[m.pk for m in meals]).values_list('local_date', flat=True)) == {
+            date(2024, 3, 9)
+        }
+
+class TestLocalDayQueries:
+    def test_daily_meals_use_local_day(self, authenticated_client, west_coast_user):
+        meal = MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = authenticated_client.get(reverse('meal-daily', args=['2024-03-09']))
+        assert [row['id'] for row in response.data] == [meal.id]
+        assert response.data[0]['local_date'] == '2024-03-09'
+        meal_query = next(q['sql'] for q in ctx.captured_queries if 'FROM "core_meal"' in q['sql'])
+        assert '"core_meal"."local_date"' in meal_query
+        assert 'cast_date' not in meal_query
+
+        response = authenticated_client.get(reverse('meal-daily', args=['2024-03-10']))
+        assert response.data == []
+
+    def test_default_day_is_local_today(self, authenticated_client, west_coast_user, monkeypatch):
+        monkeypatch.setattr('django.utils.timezone.now', lambda: LATE_EVENING)
+        meal = MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+
+        response = authenticated_client.get(reverse('meal-daily'))
+        assert [row['id'] for row in response.data] == [meal.id]
+
+    def test_triggers_use_local_day(self, west_coast_user, monkeypatch):
+        monkeypatch.setattr('django.utils.timezone.now', lambda: datetime(2024, 3, 20, 12, tzinfo=dt_timezone.utc))
+        meal = MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+        MealFoodFactory.create(meal=meal, food=FoodFactory.create(name='Late snack'))
+        HealthLogFactory.create(user=west_coast_user, date=date(2024, 3, 10), physical_feeling=1)
+
+        assert HealthAnalyticsService.identify_symptom_triggers(west_coast_user, days=30) == [
+            {'food': 'Late snack', 'count': 1}
+        ]
+
+    def test_day_summary_uses_local_day(self, west_coast_user):
+        MealFactory.create(user=west_coast_user, date_time=LATE_EVENING)
+        PrecomputeService.summarise_day(west_coast_user.pk, date(2024, 3, 9))
+        assert DailySummary.objects.get(user=west_coast_user, date=date(2024, 3, 9)).meal_count == 1
@@ -0,0 +1,134 @@
+import gzip
+import pytest
+from datetime import timedelta
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from core.middleware import CompressionMiddleware, brotli, compression_stats
+from tests.factories import HealthLogFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+PAYLOAD = b'{"health_logs": [' + b'{"physical_feeling": 3, "mental_feeling": 4},' * 200 + b'{}]}'
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    compression_stats.reset()
+    yield
+    compression_stats.reset()
+
+def make_middleware(response):
+    return CompressionMiddleware(lambda request: response)
+
+def gzip_request():
+    return RequestFactory().get('/api/export/all-data/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+class TestCompressionMiddleware:
+    def test_compresses_large_payload(self):
+        response = make_middleware(HttpResponse(PAYLOAD))(gzip_request())
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == PAYLOAD
+        assert int(response['Content-Length']) == len(response.content)
+        assert 'Accept-Encoding' in response['Vary']
+
+    def test_skips_tiny_payload(self):
+        response = make_middleware(HttpResponse(b'{"ok": true}'))(gzip_request())
+        assert not response.has_header('Content-Encoding')
+        assert compression_stats.snapshot()['responses_skipped'] == 1
+
+    def test_skips_client_without_gzip(self):
+        request = RequestFactory().get('/api/export/all-data/')
+        response = make_middleware(HttpResponse(PAYLOAD))(request)
+        assert not response.has_header('Content-Encoding')
+        assert response.content == PAYLOAD
+
+    def test_compresses_streaming_response(self):
+        chunks = [PAYLOAD[i:i + 512] for i in range(0, len(PAYLOAD), 512)]
+        response = make_middleware(StreamingHttpResponse(iter(chunks)))(gzip_request())
+        assert response['Content-Encoding'] == 'gzip'
+        body = b''.join(response.streaming_content)
+        assert gzip.decompress(body) == PAYLOAD
+        stats = compression_stats.snapshot()
+        assert stats['bytes_in'] == len(PAYLOAD)
+        assert stats['bytes_out'] == len(body)
+
+    def test_reuses_cached_body_for_same_payload(self):
+        first = make_middleware(HttpResponse(PAYLOAD))(gzip_request())
+        second = make_middleware(HttpResponse(PAYLOAD))(gzip_request())
+        assert gzip.decompress(first.content) == gzip.decompress(second.content) == PAYLOAD
+        assert first['ETag'].startswith('W/')
+        stats = compression_stats.snapshot()
+        assert stats['responses_compressed'] == 2
+        assert stats['cache_hits'] == 1
+        assert stats['bytes_saved'] > 0
+
+    def test_cache_keyed_on_body_not_etag(self):
+        other = PAYLOAD.replace(b'3', b'4')
+        first = HttpResponse(PAYLOAD, headers={'ETag': '"same"'})
+        second = HttpResponse(other, headers={'ETag': '"same"'})
+        make_middleware(first)(gzip_request())
+        response = make_middleware(second)(gzip_request())
+        assert gzip.decompress(response.content) == other
+        assert compression_stats.snapshot()['cache_hits'] == 0
+
+    def test_gzip_body_length_is_padded(self):
+        lengths = {len(make_middleware(HttpResponse(PAYLOAD))(gzip_request()).content) for _ in range(20)}
+        assert len(lengths) > 1
+
+    @override_settings(COMPRESSION_MAX_RANDOM_BYTES=0)
+    def test_padding_can_be_disabled(self):
+        lengths = {len(make_middleware(HttpResponse(PAYLOAD))(gzip_request()).content) for _ in range(5)}
+        assert len(lengths) == 1
+
+    def test_streaming_body_is_padded(self):
+        lengths = set()
+        for _ in range(20):
+            response = make_middleware(StreamingHttpResponse(iter([PAYLOAD])))(gzip_request())
+            body = b''.join(response.streaming_content)
+            assert gzip.decompress(body) == PAYLOAD
+            lengths.add(len(body))
+        assert len(lengths) > 1
+
+    @pytest.mark.parametrize('accept_encoding', ['gzip;q=0', 'gzip;q=0.0, deflate', 'identity', '*;q=0'])
+    def test_refused_encodings_are_not_used(self, accept_encoding):
+        request = RequestFactory().get('/api/export/all-data/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = make_middleware(HttpResponse(PAYLOAD))(request)
+        assert not response.has_header('Content-Encoding')
+
+    def test_brotli_refused_with_zero_quality(self):
+        request = RequestFactory().get('/api/export/all-data/', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        assert make_middleware(HttpResponse(PAYLOAD)).select_encoding(request) == 'gzip'
+
+    @pytest.mark.skipif(brotli is None, reason="Brotli is not installed")
+    def test_credentialed_requests_get_gzip(self):
+        request = RequestFactory().get(
+            '/api/export/all-data/', HTTP_ACCEPT_ENCODING='br, gzip', HTTP_AUTHORIZATION='Bearer token'
+        )
+        assert make_middleware(HttpResponse(PAYLOAD)).select_encoding(request) == 'gzip'
+
+    @override_settings(COMPRESSION_MIN_SIZE=10 * len(PAYLOAD))
+    def test_min_size_setting(self):
+        response = make_middleware(HttpResponse(PAYLOAD))(gzip_request())
+        assert not response.has_header('Content-Encoding')
+
+class TestCompressionStatsView:
+    def test_requires_staff(self, authenticated_client):
+        response = authenticated_client.get(reverse('compression-stats'))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_reports_bytes_saved(self, api_client, today):
+        user = UserFactory.create()
+        for i in range(40):
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i))
+        api_client.force_authenticate(user=user)
+        response = api_client.get(reverse('export-health-data'), HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+
+        staff = UserFactory.create(is_staff=True)
+        api_client.force_authenticate(user=staff)
+        response = api_client.get(reverse('compression-stats'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['responses_compressed'] >= 1
+        assert response.data['bytes_saved'] > 0
@@ -0,0 +1,141 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.models import AnalyticsSnapshot, DailySummary, PrecomputeRun
+from core.precompute import PrecomputeService
+from tests.factories import (
+    UserFactory, FoodFactory, MealFactory, MealFoodFactory,
+    HealthLogFactory, SleepFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+def make_active_user(days=3):
+    user = UserFactory.create()
+    today = timezone.now().date()
+    for i in range(days):
+        HealthLogFactory.create(user=user, date=today - timedelta(days=i), physical_feeling=2)
+        SleepFactory.create(user=user, date=today - timedelta(days=i), duration=Decimal('7.00'))
+    return user
+
+class TestPrecomputeService:
+    def test_run_writes_summaries_and_snapshots(self, yesterday):
+        user = make_active_user()
+        meal = MealFactory.create(
+            user=user,
+            date_time=timezone.make_aware(timezone.datetime.combine(yesterday, timezone.datetime.min.time()))
+        )
+        MealFoodFactory.create(meal=meal, food=FoodFactory.create())
+        UserFactory.create()  # Inactive: nothing logged
+
+        run = PrecomputeService.run()
+
+        assert run.status == PrecomputeRun.Status.COMPLETED
+        assert run.users_processed == 1
+        summary = DailySummary.objects.get(user=user, date=yesterday)
+        assert summary.physical_feeling == 2
+        assert summary.sleep_duration == Decimal('7.00')
+        assert summary.meal_count == 1
+        assert summary.food_count == 1
+        assert AnalyticsSnapshot.objects.filter(user=user).count() == 4
+
+    def test_resume_from_checkpoint(self, today):
+        first, second, third = make_active_user(), make_active_user(), make_active_user()
+        # An earlier run died after finishing the first user
+        PrecomputeRun.objects.create(
+            run_date=today, status=PrecomputeRun.Status.RUNNING,
+            last_user_id=first.id, users_processed=1,
+        )
+
+        run = PrecomputeService.run(batch_size=1)
+
+        assert run.status == PrecomputeRun.Status.COMPLETED
+        assert run.users_processed == 3
+        assert run.last_user_id == third.id
+        assert not AnalyticsSnapshot.objects.filter(user=first).exists()
+        assert AnalyticsSnapshot.objects.filter(user=second).exists()
+
+    def test_completed_run_not_repeated(self, today):
+        make_active_user()
+        PrecomputeService.run()
+        AnalyticsSnapshot.objects.all().delete()
+
+        PrecomputeService.run()
+        assert not AnalyticsSnapshot.objects.exists()
+
+        PrecomputeService.run(restart=True)
+        assert AnalyticsSnapshot.objects.exists()
+
+    def test_write_invalidates_snapshots(self, today):
+        user = make_active_user()
+        PrecomputeService.run()
+        HealthLogFactory.create(user=user, date=today - timedelta(days=10))
+        assert not AnalyticsSnapshot.objects.filter(user=user).exists()
+
+    def test_write_during_compute_skips_snapshots(self, today, yesterday):
+        user = make_active_user()
+        results = PrecomputeService.compute_user(user.id, today)
+        HealthLogFactory.create(user=user, date=today - timedelta(days=10))
+
+        PrecomputeService.store_user(user.id, today, results)
+        assert not AnalyticsSnapshot.objects.filter(user=user).exists()
+        assert DailySummary.objects.get(user=user, date=yesterday).physical_feeling == 2
+
+    def test_management_command(self, today):
+        make_active_user()
+        call_command('precompute_analytics', '--workers', '1', stdout=open('/dev/null', 'w'))
+        assert PrecomputeRun.objects.get(run_date=today).status == PrecomputeRun.Status.COMPLETED
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_pool_run():
+    users = [make_active_user(days=1) for _ in range(4)]
+    run = PrecomputeService.run(workers=2, batch_size=2)
+    assert run.users_processed == 4
+    assert AnalyticsSnapshot.objects.filter(user__in=users).count() == 16
+
+class TestPrecomputedAnalyticsViews:
+    def test_serves_snapshot(self, authenticated_client, user, today):
+        AnalyticsSnapshot.objects.create(
+            user=user, kind=AnalyticsSnapshot.Kind.SLEEP_ANALYSIS, days=30,
+            computed_for=today, payload={'average_duration': 8.0, 'precomputed': True},
+        )
+        response = authenticated_client.get(reverse('analytics-sleep-analysis'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['precomputed'] is True
+
+    def test_stale_snapshot_ignored(self, authenticated_client, user, yesterday):
+        AnalyticsSnapshot.objects.create(
+            user=user, kind=AnalyticsSnapshot.Kind.SLEEP_ANALYSIS, days=30,
+            computed_for=yesterday, payload={'precomputed': True},
+        )
+        response = authenticated_client.get(reverse('analytics-sleep-analysis'))
+        assert 'precomputed' not in response.data
+        assert 'average_duration' in response.data
+
+    def test_summaries(self, authenticated_client, user, yesterday):
+        DailySummary.objects.create(user=user, date=yesterday, physical_feeling=4, meal_count=3)
+        response = authenticated_client.get(reverse('analytics-summaries'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data[0]['date'] == str(yesterday)
+        assert response.data[0]['meal_count'] == 3
+
+    def test_moved_meal_leaves_old_day(self, authenticated_client, user, yesterday):
+        meal = MealFactory.create(user=user, date_time=timezone.now() - timedelta(days=2))
+        old_day = meal.local_date
+        PrecomputeService.summarise_day(user.pk, old_day)
+        PrecomputeService.summarise_day(user.pk, yesterday)
+
+        moved = timezone.now().replace(hour=12, minute=0) - timedelta(days=1)
+        response = authenticated_client.patch(
+            reverse('meal-detail', args=[meal.pk]), {'date_time': moved.isoformat()}, format='json'
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        counts = {row['date']: row['meal_count'] for row in authenticated_client.get(reverse('analytics-summaries')).data}
+        assert counts[str(old_day)] == 0
+        assert counts[str(yesterday)] == 1
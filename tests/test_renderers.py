@@ -0,0 +1,94 @@
+import io
+import pytest
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from uuid import UUID
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core import renderers
+from core.renderers import FastJSONParser, FastJSONRenderer
+from tests.factories import HealthLogFactory
+
+pytestmark = pytest.mark.django_db
+
+PAYLOAD = {
+    'decimal': Decimal('72.50'),
+    'date': date(2024, 3, 9),
+    'datetimes': [
+        datetime(2024, 3, 9, 22, 30, tzinfo=dt_timezone.utc),
+        datetime(2024, 3, 9, 22, 30, 5, 123456, tzinfo=dt_timezone(timedelta(hours=-8))),
+        datetime(2024, 3, 9, 22, 30),
+    ],
+    'time': time(7, 15),
+    'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+    'lazy': gettext_lazy('Normal'),
+    'error': ErrorDetail('This field is required.', code='required'),
+    'nested': ReturnDict({'rows': ReturnList([1, 2.5, None, True], serializer=None)}, serializer=None),
+    'tuple': (1, 2),
+    3: 'integer key',
+    'text': 'Caf\u00e9\u2028line\u2029end',
+    'empty': [{}, []],
+}
+
+class TestFastJSONRenderer:
+    @pytest.mark.parametrize('media_type', [None, 'application/json; indent=2', 'application/json; indent=4'])
+    def test_same_bytes_as_json_renderer(self, media_type):
+        assert FastJSONRenderer().render(PAYLOAD, media_type) == JSONRenderer().render(PAYLOAD, media_type)
+
+    def test_falls_back_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(renderers, 'orjson', None)
+        assert FastJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+
+    def test_falls_back_for_what_orjson_cannot_encode(self):
+        assert FastJSONRenderer().render({'big': 2 ** 70}) == b'{"big":1180591620717411303424}'
+
+    @pytest.mark.parametrize('value', [float('nan'), float('inf'), -float('inf')])
+    def test_non_finite_floats_rejected(self, value):
+        with pytest.raises(ValueError):
+            JSONRenderer().render({'rows': [{'score': value}]})
+        with pytest.raises(ValueError):
+            FastJSONRenderer().render({'rows': [{'score': value}]})
+
+    def test_non_strict_writes_nan(self, monkeypatch):
+        monkeypatch.setattr(FastJSONRenderer, 'strict', False)
+        assert FastJSONRenderer().render({'score': float('nan')}) == b'{"score":NaN}'
+
+    def test_none_renders_empty(self):
+        assert FastJSONRenderer().render(None) == b''
+
+    def test_used_by_the_api(self, authenticated_client, user):
+        HealthLogFactory.create(user=user, weight=Decimal('70.25'))
+        response = authenticated_client.get(reverse('healthlog-list'))
+        assert isinstance(response.accepted_renderer, FastJSONRenderer)
+        assert response.json()['results'][0]['weight'] == '70.25'
+
+class TestFastJSONParser:
+    def parse(self, parser, body):
+        return parser.parse(io.BytesIO(body), 'application/json', {})
+
+    def test_same_data_as_json_parser(self):
+        body = '{"a": [1, 2.5, null, true], "b": "Café", "c": {"d": -3}}'.encode()
+        assert self.parse(FastJSONParser(), body) == self.parse(JSONParser(), body)
+
+    @pytest.mark.parametrize('body', [b'{"a": ', b'{"a": NaN}', b''])
+    def test_invalid_json(self, body):
+        with pytest.raises(ParseError):
+            self.parse(FastJSONParser(), body)
+
+    def test_falls_back_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(renderers, 'orjson', None)
+        assert self.parse(FastJSONParser(), b'{"a": 1}') == {'a': 1}
+
+    def test_used_by_the_api(self, authenticated_client, user, today):
+        response = authenticated_client.post(
+            reverse('healthlog-list'),
+            {'user': user.id, 'date': str(today), 'physical_feeling': 4, 'mental_feeling': 3, 'weight': '70.25'},
+            format='json'
+        )
+        assert response.status_code == 201
+        assert response.json()['weight'] == '70.25'
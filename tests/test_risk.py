@@ -0,0 +1,136 @@
+import pytest
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.importer import DiaryImporter
+from core.models import BackgroundTask, HealthLog, RiskModel
+from core.risk import RiskModelService, unpack
+from core.tasks import TaskQueue
+from tests.factories import FoodFactory, HealthLogFactory, MealFactory, MealFoodFactory, SleepFactory
+
+pytestmark = pytest.mark.django_db
+
+def eat(user, day, food):
+    meal = MealFactory.create(user=user, date_time=datetime.combine(day, time(12), tzinfo=dt_timezone.utc))
+    MealFoodFactory.create(meal=meal, food=food)
+
+@pytest.fixture
+def foods():
+    return FoodFactory.create(name='Chili'), FoodFactory.create(name='Rice')
+
+@pytest.fixture
+def trained(user, foods):
+    """Forty days on which chili is followed by a bad day and rice by a good one"""
+    chili, rice = foods
+    today = timezone.now().date()
+    for i in range(40, 0, -1):
+        day = today - timedelta(days=i)
+        eat(user, day - timedelta(days=1), chili if i % 2 else rice)
+        HealthLogFactory.create(user=user, date=day, physical_feeling=1 if i % 2 else 4)
+    return user
+
+def stored_weights(user):
+    return list(unpack(RiskModel.objects.get(user=user).weights))
+
+class TestRiskModel:
+    def test_learns_trigger_foods(self, trained, foods):
+        chili, rice = foods
+        today = timezone.now().date()
+        eat(trained, today, chili)
+        result = RiskModelService.score(trained)
+
+        assert result['samples'] == 40 and result['bad_days'] == 20 and result['ready']
+        assert result['risk'] > 0.6
+        assert result['factors'][0]['factor'] == 'Chili' and result['factors'][0]['weight'] > 0
+
+        tomorrow = today + timedelta(days=1)
+        eat(trained, tomorrow, rice)
+        assert RiskModelService.score(trained, tomorrow)['risk'] < 0.4
+
+    def test_online_updates_match_rebuild(self, trained):
+        online = stored_weights(trained)
+        RiskModelService.rebuild(trained.pk)
+        assert stored_weights(trained) == online
+
+    @override_settings(RISK_MODEL_DIMENSIONS=256)
+    def test_parameters_are_compact(self, trained):
+        RiskModelService.update(trained.pk)
+        assert len(RiskModel.objects.get(user=trained).weights) == 256 * 4
+
+    def test_edits_and_deletions_retrain(self, trained):
+        log = HealthLog.objects.filter(user=trained).order_by('date').first()
+        log.physical_feeling = 1
+        log.save()
+        model = RiskModel.objects.get(user=trained)
+        assert (model.samples, model.bad_days) == (40, 21)
+
+        log.delete()
+        assert RiskModel.objects.get(user=trained).samples == 39
+
+    def test_bulk_imports_are_learnt(self, user):
+        today = timezone.now().date()
+        records = [
+            (line, {'date': str(today - timedelta(days=line)), 'physical_feeling': '2', 'mental_feeling': '3'})
+            for line in range(1, 4)
+        ]
+        DiaryImporter(user, 'health_logs').run(records)
+        model = RiskModel.objects.get(user=user)
+        assert (model.samples, model.bad_days, model.last_date) == (3, 3, today - timedelta(days=1))
+
+    def test_meal_and_sleep_changes_retrain(self, trained, foods):
+        chili, rice = foods
+        model = RiskModel.objects.get(user=trained)
+        learnt = model.updated_at
+        # The meal of a day already learnt from changes the features of the health log after it
+        eat(trained, model.last_date - timedelta(days=5), rice)
+        assert RiskModel.objects.get(user=trained).updated_at > learnt
+        online = stored_weights(trained)
+        RiskModelService.rebuild(trained.pk)
+        assert stored_weights(trained) == online
+
+        learnt = RiskModel.objects.get(user=trained).updated_at
+        SleepFactory.create(user=trained, date=model.last_date - timedelta(days=3), quality=1)
+        assert RiskModel.objects.get(user=trained).updated_at > learnt
+
+    def test_imported_meals_retrain(self, trained, foods):
+        last_date = RiskModel.objects.get(user=trained).last_date
+        records = [(1, {
+            'date_time': f'{last_date - timedelta(days=3)}T12:00:00',
+            'meal_type': 'lunch',
+            'foods': [{'name': 'Chili', 'amount': 100}],
+        })]
+        DiaryImporter(trained, 'meals').run(records)
+        online = stored_weights(trained)
+        RiskModelService.rebuild(trained.pk)
+        assert stored_weights(trained) == online
+
+class TestRiskView:
+    def test_scores_today(self, authenticated_client, trained, foods):
+        eat(trained, timezone.now().date(), foods[0])
+        response = authenticated_client.get(reverse('analytics-risk'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['date'] == str(timezone.now().date())
+        assert response.data['risk'] > 0.6
+
+    def test_user_without_history(self, authenticated_client, user):
+        response = authenticated_client.get(reverse('analytics-risk'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['risk'] == 0.5
+        assert response.data['samples'] == 0 and not response.data['ready']
+        assert response.data['factors'] == []
+
+    def test_missing_model_is_queued(self, authenticated_client, user, queued_tasks):
+        HealthLogFactory.create(user=user, date=timezone.now().date() - timedelta(days=1))
+        BackgroundTask.objects.all().delete()
+
+        response = authenticated_client.get(reverse('analytics-risk'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['pending'] is True and not response.data['ready']
+        assert not RiskModel.objects.filter(user=user).exists()
+        assert BackgroundTask.objects.get(user=user).kind == 'risk_model'
+
+        TaskQueue.run_pending()
+        assert authenticated_client.get(reverse('analytics-risk')).data['samples'] == 1
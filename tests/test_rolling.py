@@ -0,0 +1,111 @@
+import math
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.models import BackgroundTask, MetricStat
+from core.rolling import RollingStatsService, smoothing_factor
+from core.tasks import TaskQueue
+from tests.factories import HealthLogFactory, SleepFactory
+
+pytestmark = pytest.mark.django_db
+
+def batch_ewm(values, alpha):
+    """Reference EWMA/EW variance computed over the whole series"""
+    mean, variance = values[0], 0.0
+    for value in values[1:]:
+        diff = value - mean
+        mean += alpha * diff
+        variance = (1 - alpha) * (variance + alpha * diff * diff)
+    return mean, variance
+
+class TestRollingStats:
+    def test_incremental_matches_batch(self, user):
+        start = timezone.now().date() - timedelta(days=30)
+        feelings = [3, 4, 4, 5, 3, 2, 4, 4, 3, 5]
+        for i, feeling in enumerate(feelings):
+            HealthLogFactory.create(user=user, date=start + timedelta(days=i), physical_feeling=feeling)
+
+        stat = MetricStat.objects.get(user=user, metric='physical_feeling')
+        mean, variance = batch_ewm([float(f) for f in feelings], smoothing_factor())
+        assert stat.count == len(feelings)
+        assert stat.ewma == pytest.approx(mean)
+        assert stat.ewm_variance == pytest.approx(variance)
+
+    def test_sudden_decline_flagged(self, user):
+        start = timezone.now().date() - timedelta(days=20)
+        for i in range(10):
+            SleepFactory.create(user=user, date=start + timedelta(days=i), energy_level=4 + (i % 2))
+        SleepFactory.create(user=user, date=start + timedelta(days=10), energy_level=1)
+
+        result = RollingStatsService.get_anomalies(user)['energy_level']
+        assert result['anomaly'] is True
+        assert result['direction'] == 'decline'
+        assert result['zscore'] < -2.5
+
+    def test_stable_series_not_flagged(self, user):
+        start = timezone.now().date() - timedelta(days=20)
+        for i in range(10):
+            SleepFactory.create(user=user, date=start + timedelta(days=i), duration=Decimal('7.00') + Decimal(i % 2))
+
+        result = RollingStatsService.get_anomalies(user)['duration']
+        assert result['count'] == 10
+        assert result['anomaly'] is False
+
+    def test_backfill_and_delete_rebuild(self, user):
+        today = timezone.now().date()
+        HealthLogFactory.create(user=user, date=today, mental_feeling=5)
+        older = HealthLogFactory.create(user=user, date=today - timedelta(days=3), mental_feeling=1)
+
+        stat = MetricStat.objects.get(user=user, metric='mental_feeling')
+        mean, _ = batch_ewm([1.0, 5.0], smoothing_factor())
+        assert stat.count == 2
+        assert stat.last_date == today
+        assert stat.ewma == pytest.approx(mean)
+
+        older.delete()
+        stat.refresh_from_db()
+        assert stat.count == 1
+        assert stat.ewma == 5.0
+
+    def test_stats_built_lazily_for_existing_history(self, user):
+        HealthLogFactory.create(user=user, weight=Decimal('70.00'))
+        MetricStat.objects.filter(user=user).delete()
+
+        result = RollingStatsService.get_anomalies(user)
+        assert result['weight']['count'] == 1
+        assert result['weight']['mean'] == 70.0
+        assert math.isclose(result['weight']['std'], 0.0)
+
+    def test_missing_stats_queued_not_built_on_read(self, user, queued_tasks):
+        HealthLogFactory.create(user=user, weight=Decimal('70.00'))
+        MetricStat.objects.filter(user=user).delete()
+        BackgroundTask.objects.all().delete()
+
+        result = RollingStatsService.get_anomalies(user)
+        assert result['weight']['pending'] is True
+        assert result['weight']['count'] == 0
+        assert not MetricStat.objects.filter(user=user).exists()
+        task = BackgroundTask.objects.get(user=user, kind='rolling_stats')
+        assert task.payload['healthlog']['rebuild'] is True
+
+        TaskQueue.process(task)
+        result = RollingStatsService.get_anomalies(user)
+        assert result['weight']['pending'] is False
+        assert result['weight']['mean'] == 70.0
+
+class TestAnomaliesView:
+    def test_anomalies_endpoint(self, authenticated_client, health_log, sleep_log):
+        response = authenticated_client.get(reverse('analytics-anomalies'))
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {
+            'physical_feeling', 'mental_feeling', 'weight', 'duration', 'energy_level'
+        }
+        assert response.data['physical_feeling']['count'] == 1
+
+    def test_anomalies_invalid_threshold(self, authenticated_client):
+        response = authenticated_client.get(reverse('analytics-anomalies'), {'threshold': 'high'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,108 @@
+import pytest
+from datetime import date, timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.archive import ArchiveService
+from core.models import SearchDocument
+from core.search import match_expression
+from tests.factories import (
+    HealthLogFactory, MealFactory, MealFoodFactory, SleepFactory, UserFactory
+)
+
+pytestmark = pytest.mark.django_db
+
+def search(client, q, **params):
+    response = client.get(reverse('diary-search'), {'q': q, **params})
+    assert response.status_code == status.HTTP_200_OK
+    return response.data['results']
+
+class TestSearchIndex:
+    def test_documents_follow_writes(self, user):
+        log = HealthLogFactory.create(user=user, symptoms='Bloating after lunch', notes='')
+        document = SearchDocument.objects.get(kind='health_log', object_id=log.pk)
+        assert document.body == 'Bloating after lunch'
+        assert document.date == log.date
+
+        log.symptoms = 'Cramps'
+        log.save()
+        document.refresh_from_db()
+        assert document.body == 'Cramps'
+
+        log.symptoms = ''
+        log.save()
+        assert not SearchDocument.objects.filter(kind='health_log', object_id=log.pk).exists()
+
+    def test_deleting_entries_removes_documents(self, user):
+        meal = MealFactory.create(user=user, notes='Pizza night')
+        MealFoodFactory.create(meal=meal, notes='Extra cheese')
+        assert SearchDocument.objects.filter(user=user).count() == 2
+
+        meal.delete()
+        assert not SearchDocument.objects.filter(user=user).exists()
+
+    def test_rebuild_command(self, user):
+        SleepFactory.create(user=user, notes='Woke up twice')
+        SearchDocument.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_search_index', '--user', str(user.pk), stdout=out)
+        assert 'Search index holds 1 documents' in out.getvalue()
+
+    def test_match_expression_quotes_words(self):
+        assert match_expression(7, 'bloating AND "pain"') == 'user_id:"7" AND body:("bloating" "AND" "pain")'
+        assert match_expression(7, '*** ---') is None
+
+class TestDiarySearchView:
+    def test_ranked_hits_across_entry_types(self, authenticated_client, user):
+        log = HealthLogFactory.create(user=user, symptoms='Severe bloating and bloating again', notes='')
+        sleep = SleepFactory.create(user=user, notes='Restless, some bloating before bed')
+        meal = MealFactory.create(user=user, notes='Beans for dinner')
+        meal_food = MealFoodFactory.create(meal=meal, notes='Bloated afterwards')
+        HealthLogFactory.create(user=UserFactory.create(), symptoms='bloating', notes='')
+
+        results = search(authenticated_client, 'bloating')
+
+        assert {(hit['type'], hit['id']) for hit in results} == {
+            ('health_log', log.pk), ('sleep', sleep.pk), ('meal_food', meal_food.pk)
+        }
+        assert results[0]['id'] == log.pk
+        assert results[0]['date'] == str(log.date)
+        assert '<mark>bloating</mark>' in results[0]['snippet']
+        assert results[0]['score'] >= results[-1]['score']
+
+    def test_every_word_must_match(self, authenticated_client, user):
+        HealthLogFactory.create(user=user, symptoms='bloating and cramps', notes='')
+        HealthLogFactory.create(user=user, date=date(2024, 1, 1), symptoms='bloating only', notes='')
+
+        assert len(search(authenticated_client, 'cramps bloating')) == 1
+        assert len(search(authenticated_client, 'bloating', limit=1)) == 1
+        assert search(authenticated_client, 'NEAR(') == []
+
+    def test_archived_entries_stay_searchable(self, authenticated_client, user, settings):
+        settings.ARCHIVE_HORIZON_DAYS = 30
+        old = HealthLogFactory.create(
+            user=user, date=timezone.now().date() - timedelta(days=400), symptoms='Bloating', notes=''
+        )
+        ArchiveService.archive_user(user)
+
+        assert [hit['id'] for hit in search(authenticated_client, 'bloating')] == [old.pk]
+
+    def test_uses_full_text_index(self, authenticated_client, user):
+        HealthLogFactory.create(user=user, symptoms='bloating', notes='')
+        with CaptureQueriesContext(connection) as ctx:
+            search(authenticated_client, 'bloating')
+        sql = ctx.captured_queries[-1]['sql']
+        assert 'core_healthlog' not in sql
+        assert ('MATCH' in sql) if connection.vendor == 'sqlite' else ('@@' in sql)
+
+    def test_requires_query(self, authenticated_client):
+        response = authenticated_client.get(reverse('diary-search'))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = authenticated_client.get(reverse('diary-search'), {'q': 'x', 'limit': 'many'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -7,8 +7,11 @@ from core.serializers import (
     MealSerializer,
     MealFoodSerializer,
     HealthLogSerializer,
-    SleepSerializer
+    SleepSerializer,
+    values_serializer,
 )
+from core.models import Food, HealthLog, Meal, Sleep
+from tests.factories import FoodFactory, HealthLogFactory, MealFactory, MealFoodFactory, SleepFactory
 from unittest.mock import Mock
 
 pytestmark = pytest.mark.django_db
@@ -219,4 +222,33 @@ class TestSleepSerializer:
         }
         serializer = SleepSerializer(data=data)
         assert not serializer.is_valid()
-        assert 'quality' in serializer.errors 
\ No newline at end of file
+        assert 'quality' in serializer.errors 
+
+class TestValuesSerializer:
+    @pytest.fixture
+    def diary(self, user):
+        for day in range(1, 4):
+            meal = MealFactory.create(user=user)
+            MealFoodFactory.create_batch(2, meal=meal)
+            HealthLogFactory.create(user=user, date=f'2024-01-0{day}')
+            SleepFactory.create(user=user, date=f'2024-01-0{day}')
+        HealthLogFactory.create(user=user, date='2024-02-01', weight=None, stool_quality=None)
+        MealFactory.create(user=user)  # no foods
+        FoodFactory.create(barcode='4006381333931')
+
+    @pytest.mark.parametrize('serializer_class, queryset', [
+        (MealSerializer, Meal.objects.prefetch_related('mealfood_set__food')),
+        (HealthLogSerializer, HealthLog.objects.all()),
+        (SleepSerializer, Sleep.objects.all()),
+        (FoodSerializer, Food.objects.all()),
+    ])
+    def test_same_output_as_model_serializer(self, diary, serializer_class, queryset):
+        expected = [dict(row) for row in serializer_class(queryset.all(), many=True).data]
+        assert values_serializer(serializer_class).data(queryset.all()) == expected
+
+    def test_nested_rows_read_in_one_query(self, diary, django_assert_num_queries):
+        with django_assert_num_queries(2):
+            meals = values_serializer(MealSerializer).data(Meal.objects.all())
+        assert [len(meal['mealfood_set']) for meal in meals] == [0, 2, 2, 2]
+        assert set(meals[1]['mealfood_set'][0]) == {'id', 'food_name', 'amount', 'notes'}
+
@@ -1,11 +1,13 @@
 import pytest
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta, datetime
 from decimal import Decimal
 
 from core.models import User, Profile, Food, Meal, MealFood, HealthLog, Sleep
-from core.services import HealthAnalyticsService
+from core.archive import ArchiveService
+from core.services import HealthAnalyticsService, load_series
 from tests.factories import (
     UserFactory, FoodFactory, MealFactory, MealFoodFactory,
     HealthLogFactory, SleepFactory
@@ -210,6 +212,35 @@ class TestHealthAnalyticsService:
             assert 'count' in trigger
             assert isinstance(trigger['count'], int)
     
+    def test_symptom_triggers_single_query(self, db, django_assert_num_queries):
+        """Trigger counting is one grouped query however many poor days there are"""
+        user = UserFactory.create()
+        today = timezone.now().date()
+        dairy = FoodFactory.create(name="Dairy", user=user)
+        for i in range(1, 6):
+            meal = MealFactory.create(user=user, date_time=timezone.now() - timedelta(days=i + 1))
+            MealFoodFactory.create(meal=meal, food=dairy)
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i), physical_feeling=1)
+
+        with django_assert_num_queries(2):
+            triggers = HealthAnalyticsService.identify_symptom_triggers(user, days=10)
+        assert triggers == [{'food': 'Dairy', 'count': 5}]
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason="PostgreSQL fast path")
+    def test_postgres_foods_by_date_matches_generic(self, db, monkeypatch):
+        """array_agg grouping returns the same foods per day as the prefetch path"""
+        user = UserFactory.create()
+        for i in range(3):
+            meal = MealFactory.create(user=user, date_time=timezone.now() - timedelta(days=i))
+            MealFoodFactory.create(meal=meal, food=FoodFactory.create(), amount=100 + i)
+            MealFoodFactory.create(meal=meal, food=FoodFactory.create(), amount=50)
+
+        start, end = timezone.now().date() - timedelta(days=5), timezone.now().date()
+        fast = HealthAnalyticsService._foods_by_date(user, start, end)
+        monkeypatch.setattr('core.services.uses_postgres', lambda queryset: False)
+        generic = HealthAnalyticsService._foods_by_date(user, start, end)
+        assert dict(fast) == dict(generic)
+
     def test_time_range_filtering(self, db):
         """Test that services properly filter data by time range"""
         # Create a user
@@ -234,4 +265,104 @@ class TestHealthAnalyticsService:
         # Verify that the number of data points matches the time range
         assert len(trends_7['physical_feeling']) == 7
         assert len(trends_30['physical_feeling']) == 30
-        assert len(trends_60['physical_feeling']) == 60 
\ No newline at end of file
+        assert len(trends_60['physical_feeling']) == 60
+
+class TestLoadSeries:
+    def test_compact_records_oldest_first(self, db, user):
+        today = timezone.now().date()
+        for i in range(5):
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i), physical_feeling=i + 1)
+        
+        records = load_series(user, 'health_logs', ('date', 'physical_feeling'), today - timedelta(days=3), today)
+        
+        assert [(record.date, record.physical_feeling) for record in records] == [
+            (today - timedelta(days=i), i + 1) for i in (3, 2, 1, 0)
+        ]
+        assert not hasattr(records[0], '__dict__')
+    
+    def test_includes_archived_rows(self, db, user, settings):
+        settings.ARCHIVE_HORIZON_DAYS = 10
+        today = timezone.now().date()
+        for i in (0, 12, 20):
+            SleepFactory.create(user=user, date=today - timedelta(days=i), duration=Decimal('7.25'))
+        ArchiveService.archive_user(user)
+        user.refresh_from_db()
+        
+        records = load_series(user, 'sleep', ('date', 'duration'), today - timedelta(days=15), today)
+        
+        assert [record.date for record in records] == [today - timedelta(days=12), today]
+        assert records[0].duration == Decimal('7.25')
+
+class TestBucketedAggregates:
+    def test_weekly_health_aggregates(self, db):
+        user = UserFactory.create()
+        today = timezone.now().date()
+        week_start = today - timedelta(days=today.weekday())
+        last_week = week_start - timedelta(days=7)
+        for i, feeling in enumerate([1, 3, 5]):
+            HealthLogFactory.create(
+                user=user,
+                date=last_week + timedelta(days=i),
+                physical_feeling=feeling,
+                stool_quality='normal' if i else 'hard',
+                weight=Decimal('70.00'),
+            )
+        
+        buckets = HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'week', count=3)
+        
+        assert [b['bucket'] for b in buckets] == [
+            str(week_start - timedelta(days=14)), str(last_week), str(week_start)
+        ]
+        summary = buckets[1]
+        assert summary['count'] == 3
+        assert summary['physical_feeling'] == {'mean': 3.0, 'min': 1.0, 'max': 5.0}
+        assert summary['weight']['mean'] == 70.0
+        assert summary['stool_quality'] == {'hard': 1, 'normal': 2, 'soft': 0, 'diarrhea': 0}
+        assert buckets[0]['count'] == 0
+        assert buckets[0]['physical_feeling']['mean'] is None
+    
+    def test_completed_buckets_are_cached(self, db, django_assert_num_queries):
+        user = UserFactory.create()
+        today = timezone.now().date()
+        for i in range(60):
+            SleepFactory.create(user=user, date=today - timedelta(days=i), quality=3)
+        
+        first = HealthAnalyticsService.get_bucketed_aggregates(user, 'sleep', 'month', count=3)
+        
+        # Only the current bucket is recomputed, from a query limited to this month
+        with django_assert_num_queries(1) as ctx:
+            second = HealthAnalyticsService.get_bucketed_aggregates(user, 'sleep', 'month', count=3)
+        assert str(today.replace(day=1)) in ctx.captured_queries[0]['sql']
+        assert first == second
+    
+    def test_editing_old_log_invalidates_its_bucket(self, db):
+        user = UserFactory.create()
+        today = timezone.now().date()
+        old_day = today.replace(day=1) - timedelta(days=40)
+        log = HealthLogFactory.create(user=user, date=old_day, physical_feeling=2)
+        
+        before = HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'month', count=4)
+        log.physical_feeling = 4
+        log.save()
+        after = HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'month', count=4)
+        
+        old_bucket = str(old_day.replace(day=1))
+        assert next(b for b in before if b['bucket'] == old_bucket)['physical_feeling']['mean'] == 2.0
+        assert next(b for b in after if b['bucket'] == old_bucket)['physical_feeling']['mean'] == 4.0
+    
+    def test_moving_log_to_another_day_invalidates_both_buckets(self, db):
+        user = UserFactory.create()
+        month_start = timezone.now().date().replace(day=1)
+        old_day = month_start - timedelta(days=70)
+        new_day = month_start - timedelta(days=20)
+        HealthLogFactory.create(user=user, date=old_day, physical_feeling=2)
+        
+        HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'month', count=4)
+        log = HealthLog.objects.get(user=user)
+        log.date = new_day
+        log.save()
+        after = HealthAnalyticsService.get_bucketed_aggregates(user, 'health', 'month', count=4)
+        
+        counts = {b['bucket']: b['count'] for b in after}
+        assert counts[str(old_day.replace(day=1))] == 0
+        assert counts[str(new_day.replace(day=1))] == 1
@@ -0,0 +1,45 @@
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+pytestmark = pytest.mark.skipif(connection.vendor != 'sqlite', reason="SQLite-only tuning")
+
+@pytest.fixture
+def open_connection(django_db_blocker):
+    """Open a standalone connection to a SQLite file outside the test database"""
+    wrappers = []
+    def connect(path):
+        wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=str(path)), alias='tuning')
+        with django_db_blocker.unblock():
+            wrapper.ensure_connection()
+        wrappers.append(wrapper)
+        return wrapper
+    yield connect
+    for wrapper in wrappers:
+        wrapper.close()
+
+def pragma(wrapper, name):
+    return wrapper.connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+class TestSqlitePerformanceMode:
+    def test_pragmas_applied_on_connect(self, settings, tmp_path, open_connection):
+        settings.SQLITE_PERFORMANCE_MODE = True
+        wrapper = open_connection(tmp_path / 'tuned.sqlite3')
+        assert pragma(wrapper, 'journal_mode') == 'wal'
+        assert pragma(wrapper, 'synchronous') == 1  # NORMAL
+        assert pragma(wrapper, 'busy_timeout') == 5000
+
+    def test_disabled_by_default(self, settings, tmp_path, open_connection):
+        settings.SQLITE_PERFORMANCE_MODE = False
+        wrapper = open_connection(tmp_path / 'plain.sqlite3')
+        assert pragma(wrapper, 'journal_mode') == 'delete'
+
+    @pytest.mark.slow
+    def test_writer_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_sqlite_writers', '--writers', '2', '--readers', '1', '--writes', '20', stdout=out)
+        lines = out.getvalue().splitlines()
+        assert len(lines) == 2
+        assert lines[1].startswith('performance (SQLITE_PRAGMAS): 40 writes')
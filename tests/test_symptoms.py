@@ -0,0 +1,120 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.archive import ArchiveService
+from core.importer import DiaryImporter, read_csv
+from core.models import HealthLog, SymptomTag
+from core.services import HealthAnalyticsService
+from core.symptoms import extract_symptoms
+from tests.factories import FoodFactory, HealthLogFactory, MealFactory, MealFoodFactory
+
+pytestmark = pytest.mark.django_db
+
+def tags(log):
+    return set(log.symptom_tags.values_list('slug', flat=True))
+
+class TestExtraction:
+    @pytest.mark.parametrize('text, expected', [
+        ('Bloated and gassy after lunch', {'bloating', 'gas'}),
+        ('Stomach ache, loose stools', {'abdominal_pain', 'diarrhea'}),
+        ('No bloating, but cramps', {'abdominal_pain'}),
+        ("Didn't feel nauseous; headache later", {'headache'}),
+        ('no bloating or gas', set()),
+        ('Felt great', set()),
+        ('', set()),
+    ])
+    def test_vocabulary(self, text, expected):
+        assert extract_symptoms(text) == expected
+
+class TestTagging:
+    def test_tagged_on_write(self, user):
+        log = HealthLogFactory.create(user=user, symptoms='Bloating and heartburn')
+        assert tags(log) == {'bloating', 'heartburn'}
+
+        log.symptoms = 'Only a headache'
+        log.save()
+        assert tags(log) == {'headache'}
+
+        log.notes = 'unrelated'
+        log.save(update_fields=['notes'])
+        assert tags(log) == {'headache'}
+        assert SymptomTag.objects.get(slug='headache').name == 'Headache'
+
+    def test_imported_logs_tagged(self, user):
+        DiaryImporter(user, 'health_logs').run(read_csv([
+            'date,physical_feeling,mental_feeling,symptoms\n', '2024-01-01,2,3,nausea and cramps\n'
+        ]))
+        assert tags(HealthLog.objects.get(user=user)) == {'nausea', 'abdominal_pain'}
+
+    def test_backfill_command(self, user):
+        today = timezone.now().date()
+        logs = [
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i), symptoms='Constipated' if i else 'fine')
+            for i in range(4)
+        ]
+        HealthLog.symptom_tags.through.objects.all().delete()
+
+        out = StringIO()
+        call_command('tag_symptoms', '--batch-size', '2', stdout=out)
+
+        assert 'Tagged 4 health logs with 3 symptom tags' in out.getvalue()
+        assert tags(logs[1]) == {'constipation'}
+
+class TestSymptomAnalytics:
+    @pytest.fixture
+    def history(self, user):
+        today = timezone.now().date()
+        beans, rice = FoodFactory.create(name='Beans'), FoodFactory.create(name='Rice')
+        for i in range(1, 9):
+            meal = MealFactory.create(user=user, date_time=timezone.now() - timedelta(days=i + 1))
+            MealFoodFactory.create(meal=meal, food=beans if i % 2 else rice)
+            # Bloating follows beans; every other day is merely tired
+            HealthLogFactory.create(
+                user=user, date=today - timedelta(days=i), physical_feeling=4,
+                symptoms='bloated' if i % 2 else 'tired'
+            )
+        return user
+
+    def test_triggers_for_symptom(self, history, django_assert_max_num_queries):
+        with django_assert_max_num_queries(2):
+            triggers = HealthAnalyticsService.identify_symptom_triggers(history, days=10, symptom='bloating')
+        assert triggers == [{'food': 'Beans', 'count': 4}]
+        # Bad days stay the default, and none of these days were bad
+        assert HealthAnalyticsService.identify_symptom_triggers(history, days=10) == []
+
+    def test_counts_and_correlations(self, history):
+        assert HealthAnalyticsService.get_symptom_counts(history, days=30) == [
+            {'symptom': 'bloating', 'name': 'Bloating', 'days': 4},
+            {'symptom': 'fatigue', 'name': 'Fatigue', 'days': 4},
+        ]
+        correlations = HealthAnalyticsService.get_food_correlations(history, days=10)
+        assert {tuple(day['symptoms']) for day in correlations} == {('bloating',), ('fatigue',)}
+
+    def test_archived_logs_counted(self, user, settings):
+        settings.ARCHIVE_HORIZON_DAYS = 30
+        HealthLogFactory.create(user=user, date=timezone.now().date() - timedelta(days=100), symptoms='nausea')
+        HealthLogFactory.create(user=user, date=timezone.now().date() - timedelta(days=1), symptoms='nausea')
+        ArchiveService.archive_user(user)
+
+        assert HealthAnalyticsService.get_symptom_counts(user, days=200)[0]['days'] == 2
+
+    def test_endpoints(self, authenticated_client, history):
+        url = reverse('analytics-symptoms-triggers')
+        response = authenticated_client.get(url, {'days': 10, 'symptom': 'bloating'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{'food': 'Beans', 'count': 4}]
+        assert authenticated_client.get(url, {'symptom': 'hiccups'}).status_code == status.HTTP_400_BAD_REQUEST
+
+        response = authenticated_client.get(reverse('analytics-symptoms'))
+        assert [row['symptom'] for row in response.data] == ['bloating', 'fatigue']
+
+    @pytest.mark.parametrize('days', ['abc', '0', '100000'])
+    def test_counts_reject_invalid_days(self, authenticated_client, days):
+        response = authenticated_client.get(reverse('analytics-symptoms'), {'days': days})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'days' in response.data['error']
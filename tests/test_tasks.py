@@ -0,0 +1,178 @@
+import pytest
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from core.models import BackgroundTask, DailySummary, HealthLog, MetricStat, SearchDocument
+from core.tasks import TASK_KINDS, TaskQueue
+from tests.factories import FoodFactory, HealthLogFactory, MealFactory, MealFoodFactory, SleepFactory
+
+pytestmark = pytest.mark.django_db
+
+@pytest.fixture
+def failing_kind(monkeypatch):
+    def handler(user_id, payload):
+        raise RuntimeError('boom')
+    monkeypatch.setitem(TASK_KINDS, 'failing', (handler, lambda pending, new: {**pending, **new}))
+    return 'failing'
+
+class TestTaskQueue:
+    def test_burst_of_writes_coalesces(self, queued_tasks, user):
+        today = timezone.now().date()
+        for i in range(3):
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i), physical_feeling=3 + i % 2)
+
+        task = BackgroundTask.objects.get(user=user, kind='rolling_stats')
+        # The second and third logs are backfills, so the merged change starts at the oldest
+        assert task.payload == {'healthlog': {'since': str(today - timedelta(days=2)), 'rebuild': False}}
+        assert not MetricStat.objects.filter(user=user, count__gt=0).exists()
+
+        assert TaskQueue.run_pending() == (4, 0)  # rolling_stats, risk_model, daily_summaries and text_index
+        assert not BackgroundTask.objects.exists()
+        stat = MetricStat.objects.get(user=user, metric='physical_feeling')
+        assert stat.count == 3
+        assert stat.last_date == today
+
+    def test_new_logs_fold_into_existing_stats(self, queued_tasks, user):
+        start = timezone.now().date() - timedelta(days=5)
+        HealthLogFactory.create(user=user, date=start, mental_feeling=2)
+        TaskQueue.run_pending()
+        HealthLogFactory.create(user=user, date=start + timedelta(days=1), mental_feeling=4)
+        SleepFactory.create(user=user, date=start + timedelta(days=1))
+
+        task = BackgroundTask.objects.get(user=user, kind='rolling_stats')
+        assert set(task.payload) == {'healthlog', 'sleep'}
+        TaskQueue.run_pending()
+        stat = MetricStat.objects.get(user=user, metric='mental_feeling')
+        assert stat.count == 2
+        assert stat.last_value == 4.0
+
+    def test_delete_requests_rebuild(self, queued_tasks, user):
+        log = HealthLogFactory.create(user=user)
+        TaskQueue.run_pending()
+        log.delete()
+        task = BackgroundTask.objects.get(user=user, kind='rolling_stats')
+        assert task.payload['healthlog']['rebuild'] is True
+        TaskQueue.run_pending()
+        assert MetricStat.objects.get(user=user, metric='physical_feeling').count == 0
+
+    def test_daily_summary_refreshed_by_worker(self, queued_tasks, user, yesterday):
+        log = HealthLogFactory.create(user=user, date=yesterday, physical_feeling=2)
+        TaskQueue.run_pending()
+        DailySummary.objects.create(user=user, date=yesterday, physical_feeling=2)
+
+        log.physical_feeling = 5
+        log.save()
+        assert DailySummary.objects.get(user=user, date=yesterday).physical_feeling == 2
+        TaskQueue.run_pending()
+        assert DailySummary.objects.get(user=user, date=yesterday).physical_feeling == 5
+
+    def test_failed_task_retried_with_backoff(self, queued_tasks, failing_kind, user, settings):
+        settings.TASK_QUEUE_MAX_ATTEMPTS = 2
+        TaskQueue.enqueue(failing_kind, user.id, {'a': 1})
+
+        assert TaskQueue.run_pending() == (0, 1)
+        task = BackgroundTask.objects.get()
+        assert task.status == BackgroundTask.Status.PENDING
+        assert task.attempts == 1
+        assert task.run_after > timezone.now()
+        assert 'boom' in task.last_error
+
+        BackgroundTask.objects.update(run_after=timezone.now())
+        TaskQueue.run_pending()
+        task.refresh_from_db()
+        assert task.status == BackgroundTask.Status.FAILED
+        assert task.attempts == 2
+
+    def test_failed_task_merges_into_newer_pending(self, queued_tasks, failing_kind, user):
+        TaskQueue.enqueue(failing_kind, user.id, {'a': 1})
+        task = TaskQueue.claim()[0]
+        # A write arrives while the task is running
+        TaskQueue.enqueue(failing_kind, user.id, {'b': 2})
+        TaskQueue.process(task)
+
+        pending = BackgroundTask.objects.get()
+        assert pending.pk != task.pk
+        assert pending.payload == {'a': 1, 'b': 2}
+
+    def test_abandoned_running_task_reclaimed(self, queued_tasks, failing_kind, user, settings):
+        TaskQueue.enqueue(failing_kind, user.id, {})
+        assert len(TaskQueue.claim()) == 1
+        assert TaskQueue.claim() == []
+
+        settings.TASK_QUEUE_LEASE_SECONDS = 60
+        BackgroundTask.objects.update(claimed_at=timezone.now() - timedelta(minutes=5))
+        assert len(TaskQueue.claim()) == 1
+
+    def test_run_tasks_command(self, queued_tasks, user):
+        HealthLogFactory.create(user=user)
+        out = StringIO()
+        call_command('run_tasks', '--once', stdout=out)
+        assert 'Done: 4 tasks succeeded, 0 failed' in out.getvalue()
+        assert not BackgroundTask.objects.exists()
+
+class TestSignalTasks:
+    """What each write leaves in the queue when tasks are not run eagerly"""
+
+    def queued(self, user):
+        return dict(BackgroundTask.objects.filter(user=user).values_list('kind', 'payload'))
+
+    def test_health_log_save(self, queued_tasks, user, today):
+        log = HealthLogFactory.create(user=user, date=today, symptoms='Bloating')
+
+        queued = self.queued(user)
+        assert queued['rolling_stats'] == {'healthlog': {'since': str(today), 'rebuild': False}}
+        assert queued['risk_model'] == {'since': str(today), 'rebuild': False}
+        assert queued['daily_summaries'] == {'dates': [str(today)]}
+        assert queued['text_index'] == {'healthlog': [log.pk]}
+        # Nothing derived is written by the request itself
+        assert not SearchDocument.objects.filter(user=user).exists()
+        assert not log.symptom_tags.exists()
+
+        TaskQueue.run_pending()
+        assert SearchDocument.objects.filter(user=user, object_id=log.pk).exists()
+        assert set(log.symptom_tags.values_list('slug', flat=True)) == {'bloating'}
+
+    def test_moving_log_queues_from_old_date(self, queued_tasks, user, today):
+        log = HealthLogFactory.create(user=user, date=today)
+        TaskQueue.run_pending()
+
+        log = HealthLog.objects.get(pk=log.pk)
+        log.date = today - timedelta(days=3)
+        log.save()
+        queued = self.queued(user)
+        assert queued['rolling_stats'] == {'healthlog': {'since': str(log.date), 'rebuild': True}}
+        assert queued['daily_summaries'] == {'dates': [str(log.date), str(today)]}
+
+    def test_meal_writes_merge_into_one_index_task(self, queued_tasks, user):
+        meal = MealFactory.create(user=user)
+        meal_food = MealFoodFactory.create(meal=meal, food=FoodFactory.create(name='Oat porridge'))
+
+        assert self.queued(user)['text_index'] == {'meal': [meal.pk], 'mealfood': [meal_food.pk]}
+        TaskQueue.run_pending()
+        assert SearchDocument.objects.filter(user=user, kind='meal_food', object_id=meal_food.pk).exists()
+
+    def test_time_zone_change(self, queued_tasks, user):
+        user.timezone = 'Asia/Tokyo'
+        user.save()
+        assert self.queued(user) == {'meal_local_dates': {}}
+
+class TestWriteEndpoints:
+    def test_create_defers_derived_data(self, queued_tasks, authenticated_client, user, today):
+        url = reverse('healthlog-list')
+        data = {
+            'user': user.id,
+            'date': str(today),
+            'physical_feeling': 4,
+            'mental_feeling': 4,
+            'stool_count': 1,
+            'stool_quality': 'normal',
+            'complete_evacuation': True,
+        }
+        response = authenticated_client.post(url, data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert BackgroundTask.objects.filter(user=user, kind='rolling_stats').exists()
+        assert not MetricStat.objects.filter(user=user).exists()
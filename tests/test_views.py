@@ -1,9 +1,11 @@
 import pytest
 from django.urls import reverse
 from rest_framework import status
-from datetime import timedelta
+from datetime import date, timedelta
 from django.utils import timezone
 
+from tests.factories import HealthLogFactory, SleepFactory
+
 pytestmark = pytest.mark.django_db
 
 class TestAuthViews:
@@ -230,6 +232,20 @@ class TestAnalyticsViews:
         assert 'average_duration' in response.data
         assert 'quality_trend' in response.data 
 
+    def test_aggregates(self, authenticated_client, health_log, sleep_log):
+        url = reverse('analytics-aggregates')
+        response = authenticated_client.get(url, {'bucket': 'month', 'count': 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['health']) == 2
+        assert len(response.data['sleep']) == 2
+        assert response.data['health'][-1]['count'] == 1
+        assert 'stool_quality' in response.data['health'][-1]
+
+    def test_aggregates_invalid_bucket(self, authenticated_client):
+        url = reverse('analytics-aggregates')
+        response = authenticated_client.get(url, {'bucket': 'year'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 class TestExportViews:
     """Tests for data export functionality"""
     
@@ -277,4 +293,72 @@ class TestExportViews:
         # Verify data is not empty
         assert len(data['meals']) > 0
         assert len(data['health_logs']) > 0
-        assert len(data['sleep_logs']) > 0 
\ No newline at end of file
+        assert len(data['sleep_logs']) > 0 
+class TestDateRangeViews:
+    """Tests for the generic ?from=&to=&bucket= range endpoints"""
+    
+    def test_health_log_range_raw_rows(self, authenticated_client, user, today):
+        for i in range(10):
+            HealthLogFactory.create(user=user, date=today - timedelta(days=i))
+        
+        url = reverse('healthlog-range')
+        response = authenticated_client.get(url, {
+            'from': str(today - timedelta(days=4)),
+            'to': str(today),
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 5
+        assert response.data[0]['date'] == str(today - timedelta(days=4))
+    
+    def test_health_log_range_bucketed(self, authenticated_client, user):
+        start = date(2024, 1, 1)
+        for i in range(90):
+            HealthLogFactory.create(user=user, date=start + timedelta(days=i), physical_feeling=4)
+        
+        url = reverse('healthlog-range')
+        response = authenticated_client.get(url, {
+            'from': '2024-01-01', 'to': '2024-03-30', 'bucket': 'month'
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert [row['bucket'] for row in response.data] == ['2024-01-01', '2024-02-01', '2024-03-01']
+        assert [row['count'] for row in response.data] == [31, 29, 30]
+        assert response.data[0]['avg_physical_feeling'] == 4.0
+    
+    def test_sleep_range_weekly_buckets(self, authenticated_client, user):
+        # 2024-01-01 is a Monday, so 14 days fill exactly two weeks
+        for i in range(14):
+            SleepFactory.create(user=user, date=date(2024, 1, 1) + timedelta(days=i), quality=3)
+        
+        url = reverse('sleep-range')
+        response = authenticated_client.get(url, {
+            'from': '2024-01-01', 'to': '2024-01-14', 'bucket': 'week'
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert [row['count'] for row in response.data] == [7, 7]
+        assert response.data[1]['bucket'] == '2024-01-08'
+    
+    def test_meal_range_daily_buckets(self, authenticated_client, meal_with_food, today):
+        url = reverse('meal-range')
+        response = authenticated_client.get(url, {'bucket': 'day'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {'bucket': str(today), 'meal_count': 1, 'food_count': 1}
+        ]
+    
+    def test_range_invalid_parameters(self, authenticated_client):
+        url = reverse('healthlog-range')
+        assert authenticated_client.get(url, {'from': 'bad'}).status_code == status.HTTP_400_BAD_REQUEST
+        assert authenticated_client.get(url, {'bucket': 'year'}).status_code == status.HTTP_400_BAD_REQUEST
+        response = authenticated_client.get(url, {'from': '2024-02-01', 'to': '2024-01-01'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    
+    def test_long_raw_window_rejected(self, authenticated_client, settings):
+        settings.DATE_RANGE_MAX_DAYS = 30
+        url = reverse('healthlog-range')
+        response = authenticated_client.get(url, {'from': '2024-01-01', 'to': '2024-01-31'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = authenticated_client.get(url, {'from': '2024-01-02', 'to': '2024-01-31'})
+        assert response.status_code == status.HTTP_200_OK
+        # Buckets keep the response small however long the window
+        response = authenticated_client.get(url, {'from': '2020-01-01', 'to': '2024-01-31', 'bucket': 'month'})
+        assert response.status_code == status.HTTP_200_OK